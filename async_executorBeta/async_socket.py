@@ -18,6 +18,12 @@ class _RawSocket:
         self.__sched.curr_exe_coro = None
         await kernel_switch()                 # kernel switch to another retrieve control back to event loop 
         return self.__sock.recv(max_bytes)
+
+    async def recv_into(self,buf):
+        self.__sched.read_wait(self.__sock,self.__sched.curr_exe_coro)
+        self.__sched.curr_exe_coro = None
+        await kernel_switch()
+        return self.__sock.recv_into(buf)
       
 
     def close(self):
@@ -54,11 +60,12 @@ async def main():
         sched.new_task(echo_handler(rclient))
 
 async def echo_handler(cli:_RawSocket):
+    buf  = bytearray(1024)          # one receive buffer per connection, reused for every read
+    view = memoryview(buf)
     while True:
-        data = await cli.recv(1024)
-        resp = data.decode('utf-8')
-        if data:
-            await cli.send(data)
+        n = await cli.recv_into(buf)
+        if n:
+            await cli.send(view[:n])
         else:
             break
     
@@ -0,0 +1,112 @@
+'''
+    Micro benchmarks for the scheduler hot path: context switch, spawn and
+    promise wakeup. Numbers are nanoseconds per operation, best of --repeat runs.
+--policy runs them on one of the exonix.policy ready queues instead of the
+default deque to show what the ordering costs.
+
+        python benchmarks/bench_core.py
+        python benchmarks/bench_core.py --policy PriorityPolicy
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix import getloop, kernel_switch, Promise, gather
+from exonix import policy as policies
+
+
+def bench_switch(n):
+    ''' one job yielding to the loop n times '''
+    async def spinner():
+        for _ in range(n):
+            await kernel_switch()
+
+    loop = getloop()
+    loop.new_task(spinner())
+    start = time.perf_counter()
+    loop.run_default_policy()
+    return time.perf_counter() - start
+
+def bench_spawn(n):
+    ''' n empty jobs spawned and run to completion '''
+    async def empty():
+        pass
+
+    loop = getloop()
+    start = time.perf_counter()
+    for _ in range(n):
+        loop.new_task(empty())
+    loop.run_default_policy()
+    return time.perf_counter() - start
+
+def bench_promise(n):
+    ''' n promise round trips between two jobs '''
+    loop  = getloop()
+    box   = [None]
+
+    async def consumer():
+        for _ in range(n):
+            box[0] = Promise()
+            await box[0]
+
+    async def producer():
+        for _ in range(n):
+            await kernel_switch()
+            box[0].set_value(None)
+
+    loop.new_task(consumer())
+    loop.new_task(producer())
+    start = time.perf_counter()
+    loop.run_default_policy()
+    return time.perf_counter() - start
+
+def bench_gather(n, fanout=100):
+    ''' n jobs gathered fanout at a time, per job cost of spawn, finish and collect '''
+    loop = getloop()
+
+    async def leaf():
+        await kernel_switch()
+
+    async def root():
+        for _ in range(n // fanout):
+            await gather(*[leaf() for _ in range(fanout)])
+
+    loop.new_task(root())
+    start = time.perf_counter()
+    loop.run_default_policy()
+    return time.perf_counter() - start
+
+
+BENCHES = {
+    'switch'  : bench_switch,
+    'spawn'   : bench_spawn,
+    'promise' : bench_promise,
+    'gather'  : bench_gather,
+}
+
+def run(names, n, repeat):
+    results = {}
+    for name in names:
+        best = min(BENCHES[name](n) for _ in range(repeat))
+        results[name] = best / n * 1e9
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--policy', default='FifoPolicy', choices=policies.__all__[1:])
+    parser.add_argument('benches', nargs='*', default=list(BENCHES))
+    args = parser.parse_args()
+
+    getloop().use_policy(getattr(policies, args.policy))
+
+    for name, ns in run(args.benches, args.n, args.repeat).items():
+        print(f"{name:<10} {ns:8.1f} ns/op")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+'''
+    Per request cost of parsing HTTP requests, nanoseconds per request, best of
+    --repeat runs. Every run parses --batch pipelined copies of a typical browser
+    GET (or a small JSON POST with --post) out of one receive buffer.
+
+        parser     exonix.httpparser.HttpParser, headers left untouched
+        lookup     HttpParser plus two header lookups per request
+        split      the decode-and-split parsing the old httpserver did
+
+        python benchmarks/bench_http.py
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix.httpparser import HttpParser
+
+
+GET = (b"GET /static/app.js?v=3 HTTP/1.1\r\n"
+       b"Host: localhost:8080\r\n"
+       b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+       b"Accept: */*\r\n"
+       b"Accept-Language: en-US,en;q=0.5\r\n"
+       b"Accept-Encoding: gzip, deflate, br\r\n"
+       b"Referer: http://localhost:8080/\r\n"
+       b"Connection: keep-alive\r\n"
+       b"Sec-Fetch-Dest: script\r\n"
+       b"Sec-Fetch-Mode: no-cors\r\n"
+       b"Sec-Fetch-Site: same-origin\r\n"
+       b"\r\n")
+
+POST = (b"POST /api/users HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: 41\r\n"
+        b"Connection: keep-alive\r\n"
+        b"\r\n"
+        b'{"name": "exonix", "mail": "a@b.example"}')
+
+
+def bench_parser(data, batch, lookup=False):
+    parser = HttpParser(buffer_size=len(data) * batch)
+    start  = time.perf_counter()
+    view   = parser.buffer()
+    view[:len(data) * batch] = data * batch
+    parser.feed(len(data) * batch)
+    count  = 0
+    while True:
+        request = parser.next()
+        if request is None:
+            break
+        if lookup:
+            request.headers.get('host')
+            request.headers.get('accept-encoding')
+        count += 1
+    assert count == batch
+    return time.perf_counter() - start
+
+def bench_lookup(data, batch):
+    return bench_parser(data, batch, True)
+
+def bench_split(data, batch):
+    ''' What httpserver/main.py did before exonix.http, per request '''
+    start  = time.perf_counter()
+    buf    = data * batch
+    count  = 0
+    while buf:
+        end     = buf.index(b"\r\n\r\n")
+        lines   = buf[:end].decode().split('\r\n')
+        method, path, version = lines[0].split(' ')
+        headers = {}
+        for line in lines[1:]:
+            name, value = line.split(': ', 1)
+            headers[name.lower()] = value
+        length = int(headers.get('content-length', 0))
+        buf    = buf[end + 4 + length:]
+        count += 1
+    assert count == batch
+    return time.perf_counter() - start
+
+
+BENCHES = {
+    'parser' : bench_parser,
+    'lookup' : bench_lookup,
+    'split'  : bench_split,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--post', action='store_true', help="parse a JSON POST instead of a GET")
+    parser.add_argument('benches', nargs='*', default=list(BENCHES))
+    args = parser.parse_args()
+
+    data = POST if args.post else GET
+    for name in args.benches:
+        best = min(BENCHES[name](data, args.batch) for _ in range(args.repeat))
+        print(f"{name:<8} {best / args.batch * 1e9:8.1f} ns/request")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+    Throughput of the work stealing runtime versus worker count. A root task
+    fans out --tasks Tasks in groups, each burning --work loop iterations with a
+    few yields in between, and waits for all of them. Reported as tasks per
+    second, best of --repeat runs.
+
+    On a GIL build expect flat or falling numbers as workers are added, the
+    workers take turns on the interpreter; free threaded builds should scale
+    with the number of cores.
+
+        python benchmarks/bench_runtime.py --workers 1 2 4 8
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix import WorkStealingRuntime, kernel_switch
+
+
+def bench_fanout(workers, tasks, work, group=64):
+    runtime = WorkStealingRuntime(workers)
+
+    async def leaf():
+        total = 0
+        for step in range(4):
+            for i in range(work // 4):
+                total += i
+            await kernel_switch()
+        return total
+
+    async def node(count):
+        children = [runtime.spawn(leaf()) for _ in range(count)]
+        for child in children:
+            await child
+
+    async def root():
+        nodes = [runtime.spawn(node(min(group, tasks - i))) for i in range(0, tasks, group)]
+        for task in nodes:
+            await task
+
+    start = time.perf_counter()
+    runtime.run(root())
+    elapsed = time.perf_counter() - start
+    runtime.close()
+    return elapsed
+
+
+def gil_state():
+    is_enabled = getattr(sys, '_is_gil_enabled', None)
+    if is_enabled is None:
+        return "GIL"
+    return "GIL" if is_enabled() else "free threaded"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--work', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"python {sys.version.split()[0]} ({gil_state()}), {os.cpu_count()} cpus")
+    base = None
+    for workers in sorted(set(args.workers)):
+        best = min(bench_fanout(workers, args.tasks, args.work) for _ in range(args.repeat))
+        rate = args.tasks / best
+        base = base or rate
+        print(f"workers {workers:<4} {rate:12.0f} tasks/s   x{rate / base:.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+    Micro benchmarks for exonix.sync and exonix.queues. Numbers are nanoseconds per operation,
+    best of --repeat runs.
+
+        uncontended   acquire/release of a free Lock by one job
+        contended     --jobs jobs taking turns on one Lock, every release is a handoff
+        semaphore     --jobs jobs through a Semaphore(4) that yield while holding it
+        event         --jobs jobs woken by one Event.set, per woken job
+        rwlock        uncontended read acquire/release
+        queue         items through a Queue(64) from one producer to one consumer
+        channel       items through a Channel, every item is a rendezvous
+
+        python benchmarks/bench_sync.py
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix import getloop, kernel_switch, Lock, Semaphore, Event, RWLock, Queue, Channel
+
+
+def run(coros):
+    loop = getloop()
+    for coro in coros:
+        loop.new_task(coro)
+    start = time.perf_counter()
+    loop.run_default_policy()
+    return time.perf_counter() - start
+
+def bench_uncontended(n, jobs):
+    lock = Lock()
+
+    async def spin():
+        for _ in range(n):
+            async with lock:
+                pass
+
+    return run([spin()])
+
+def bench_contended(n, jobs):
+    lock = Lock()
+
+    async def spin():
+        for _ in range(n // jobs):
+            async with lock:
+                await kernel_switch()
+
+    return run([spin() for _ in range(jobs)])
+
+def bench_semaphore(n, jobs):
+    sem = Semaphore(4)
+
+    async def spin():
+        for _ in range(n // jobs):
+            async with sem:
+                await kernel_switch()
+
+    return run([spin() for _ in range(jobs)])
+
+def bench_event(n, jobs):
+    async def waiter(event):
+        await event.wait()
+
+    async def setter():
+        for _ in range(n // jobs):
+            event = Event()
+            for _ in range(jobs):
+                getloop().new_task(waiter(event))
+            await kernel_switch()
+            event.set()
+            await kernel_switch()
+
+    return run([setter()])
+
+def bench_rwlock(n, jobs):
+    rw = RWLock()
+
+    async def spin():
+        for _ in range(n):
+            async with rw.reader:
+                pass
+
+    return run([spin()])
+
+def bench_queue(n, jobs, queue=None):
+    queue = queue if queue is not None else Queue(64)
+
+    async def producer():
+        for i in range(n):
+            await queue.put(i)
+
+    async def consumer():
+        for _ in range(n):
+            await queue.get()
+
+    return run([producer(), consumer()])
+
+def bench_channel(n, jobs):
+    return bench_queue(n, jobs, Channel())
+
+
+BENCHES = {
+    'uncontended' : bench_uncontended,
+    'contended'   : bench_contended,
+    'semaphore'   : bench_semaphore,
+    'event'       : bench_event,
+    'rwlock'      : bench_rwlock,
+    'queue'       : bench_queue,
+    'channel'     : bench_channel,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=200000)
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('benches', nargs='*', default=list(BENCHES))
+    args = parser.parse_args()
+
+    for name in args.benches:
+        best = min(BENCHES[name](args.n, args.jobs) for _ in range(args.repeat))
+        print(f"{name:<12} {best / args.n * 1e9:8.1f} ns/op")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+'''
+    Closed loop load generator for the echo and HTTP benchmarks.
+
+    Plain non-blocking sockets on a selectors.DefaultSelector, so the client is
+    the same whichever server it measures. Every connection keeps exactly one
+    request in flight: it sends, waits for the complete response, records the
+    round trip and sends the next one. Requests finishing inside the warmup are
+    not counted.
+
+    Connections can be split over several client processes (procs) so a single
+    client interpreter is not what limits a fast server; their latency
+    histograms are merged.
+'''
+
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix.stats import Histogram
+
+
+HTTP_REQUEST = b"GET / HTTP/1.1\r\nHost: localhost\r\nUser-Agent: exonix-bench\r\n\r\n"
+
+
+def raise_fd_limit():
+    ''' Soft RLIMIT_NOFILE up to the hard limit, 10k connections need it '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+class _Conn:
+    __slots__ = ('sock', 'buf', 'sent', 'need')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf  = bytearray()
+        self.sent = 0.0
+        self.need = None        # response length once known
+
+
+def _echo_done(conn, size):
+    return len(conn.buf) >= size
+
+def _http_done(conn, size):
+    if conn.need is None:
+        end = conn.buf.find(b"\r\n\r\n")
+        if end < 0:
+            return False
+        length = 0
+        for line in bytes(conn.buf[:end]).split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        conn.need = end + 4 + length
+    return len(conn.buf) >= conn.need
+
+
+def _client(address, conns, mode, size, warmup, duration, barrier, results):
+    raise_fd_limit()
+    request  = HTTP_REQUEST if mode == 'http' else b"x" * size
+    done     = _http_done if mode == 'http' else _echo_done
+    sel      = selectors.DefaultSelector()
+    latency  = Histogram()
+    errors   = 0
+    clock    = time.perf_counter
+
+    opened = []
+    try:
+        for _ in range(conns):
+            sock = socket.create_connection(address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
+            opened.append(_Conn(sock))
+    except OSError as e:
+        for conn in opened:
+            conn.sock.close()
+        barrier.abort()
+        results.put({'error': f"connect failed after {len(opened)} connections: {e}"})
+        return
+
+    try:
+        barrier.wait()
+    except multiprocessing.BrokenBarrierError:
+        for conn in opened:
+            conn.sock.close()
+        return
+
+    start   = clock()
+    measure = start + warmup
+    stop    = measure + duration
+    count   = 0
+    for conn in opened:
+        sel.register(conn.sock, selectors.EVENT_READ, conn)
+        conn.sent = clock()
+        conn.sock.send(request)
+
+    now = start
+    while now < stop:
+        for key, _ in sel.select(0.1):
+            conn = key.data
+            try:
+                data = conn.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                data = b""
+            if not data:
+                errors += 1
+                sel.unregister(conn.sock)
+                conn.sock.close()
+                continue
+
+            conn.buf += data
+            if not done(conn, size):
+                continue
+            now = clock()
+            if now >= measure:
+                latency.record((now - conn.sent) * 1e6)
+                count += 1
+            conn.buf.clear()
+            conn.need = None
+            conn.sent = now
+            conn.sock.send(request)
+        now = clock()
+
+    elapsed = min(now, stop) - measure
+    for conn in opened:
+        conn.sock.close()
+    sel.close()
+    results.put({'requests': count, 'seconds': elapsed, 'errors': errors, 'latency': latency})
+
+
+def run(address, conns, mode='echo', size=64, warmup=1.0, duration=5.0, procs=1):
+    ''' Drive a server at address with conns connections split over procs
+        processes. Returns requests per second, latency percentiles in
+        microseconds and the error count
+    '''
+    procs   = max(1, min(procs, conns))
+    barrier = multiprocessing.Barrier(procs)
+    results = multiprocessing.Queue()
+    shares  = [conns // procs + (1 if i < conns % procs else 0) for i in range(procs)]
+    workers = [multiprocessing.Process(target=_client, daemon=True,
+                                       args=(address, share, mode, size, warmup, duration, barrier, results))
+               for share in shares]
+    for worker in workers:
+        worker.start()
+
+    latency  = Histogram()
+    requests = 0
+    seconds  = 0.0
+    errors   = 0
+    failure  = None
+    for _ in workers:
+        result = results.get(timeout=warmup + duration + 600)
+        if 'error' in result:
+            failure = failure or result['error']
+            continue
+        latency.merge(result['latency'])
+        requests += result['requests']
+        seconds   = max(seconds, result['seconds'])
+        errors   += result['errors']
+    for worker in workers:
+        worker.join()
+
+    if failure is not None:
+        return {'connections': conns, 'error': failure}
+    snapshot = latency.snapshot()
+    return {'connections': conns, 'requests': requests, 'seconds': round(seconds, 3),
+            'rps': round(requests / seconds, 1) if seconds else 0.0,
+            'p50_us': snapshot['p50'], 'p99_us': snapshot['p99'], 'p999_us': snapshot['p999'],
+            'max_us': snapshot['max'], 'errors': errors}
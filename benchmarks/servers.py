@@ -0,0 +1,151 @@
+'''
+    Echo and HTTP keep-alive servers for the benchmark suite, one per backend:
+
+        select   exonix with SelectReactor
+        epoll    exonix with EpollReactor
+        uring    exonix with IoUringReactor (Linux 5.1+, optional)
+        asyncio  stock asyncio streams on the default event loop
+
+    Both apps do the same work on every backend: echo sends back what it read,
+    http answers every complete request head in the buffer (pipelined ones in
+    one write) with a fixed 200 response and keeps the connection open.
+
+        python benchmarks/servers.py epoll http --port 8080
+'''
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exonix import getloop, TcpServer
+from exonix.reactor import SelectReactor, EpollReactor
+
+from loadgen import raise_fd_limit
+
+
+BODY     = b"Hello, World!"
+RESPONSE = (b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: "
+            + str(len(BODY)).encode() + b"\r\n\r\n" + BODY)
+HEAD_END = b"\r\n\r\n"
+
+BACKENDS = ['select', 'epoll', 'uring', 'asyncio']
+APPS     = ['echo', 'http']
+
+
+def _responses(buf):
+    ''' Number of complete request heads in buf and what is left after them '''
+    count = buf.count(HEAD_END)
+    if not count:
+        return 0, buf
+    return count, buf[buf.rindex(HEAD_END) + 4:]
+
+
+''' exonix '''
+
+async def exonix_echo(conn):
+    try:
+        while True:
+            data = await conn.recv(65536)
+            if not data:
+                break
+            await conn.sendall(data)
+    except ConnectionError:
+        pass                            # load generator hung up mid request
+
+async def exonix_http(conn):
+    buf = b""
+    try:
+        while True:
+            data = await conn.recv(65536)
+            if not data:
+                break
+            count, buf = _responses(buf + data)
+            if count:
+                await conn.sendall(RESPONSE * count)
+    except ConnectionError:
+        pass
+
+def serve_exonix(backend, app, host, port, ready):
+    loop = getloop()
+    if backend == 'select':
+        loop.use_reactor(SelectReactor)
+    elif backend == 'epoll':
+        loop.use_reactor(EpollReactor)
+    elif backend == 'uring':
+        from exonix.iouring import IoUringReactor
+        loop.use_reactor(IoUringReactor)
+
+    server = TcpServer(exonix_echo if app == 'echo' else exonix_http, host, port, backlog=65535)
+    ready(server.address[1])
+    loop.new_task(server.serve_forever())
+    loop.run_default_policy()
+
+
+''' asyncio '''
+
+async def asyncio_echo(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def asyncio_http(reader, writer):
+    buf = b""
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            count, buf = _responses(buf + data)
+            if count:
+                writer.write(RESPONSE * count)
+                await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+def serve_asyncio(app, host, port, ready):
+    async def main():
+        server = await asyncio.start_server(asyncio_echo if app == 'echo' else asyncio_http,
+                                            host, port, backlog=65535)
+        ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def serve(backend, app, host='127.0.0.1', port=0, ready=None):
+    ''' Run a server until the process is killed. ready(port) is called once
+        it listens
+    '''
+    raise_fd_limit()
+    ready = ready or (lambda port: print(f"listening on {host}:{port}", flush=True))
+    if backend == 'asyncio':
+        serve_asyncio(app, host, port, ready)
+    else:
+        serve_exonix(backend, app, host, port, ready)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('backend', choices=BACKENDS)
+    parser.add_argument('app', choices=APPS)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    serve(args.backend, args.app, args.host, args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+'''
+    Reproducible benchmark suite, localhost only: exonix on SelectReactor and
+    EpollReactor (and io_uring with --backends uring) against stock asyncio.
+
+        micro    spawn and switch, ns/op, best of --repeat
+        timers   arm+cancel of a 1s timer, and --sleepers jobs each sleeping
+                 1 ms in a loop, ns per timer, best of --repeat
+        echo     closed loop echo of --size bytes at each --conns level,
+                 requests/s with p50/p99 latency
+        http     HTTP/1.1 keep-alive GET at each --http-conns level
+
+    Every backend runs in fresh processes: the micro benchmarks in one child,
+    every server in its own child, the load generator (benchmarks/loadgen.py)
+    in --client-procs more. select() cannot watch descriptors above 1023, so
+    SelectReactor skips connection levels that need them.
+
+    Results go to a JSON file for regression tracking; --compare prints the
+    change against an earlier one.
+
+        python benchmarks/suite.py
+        python benchmarks/suite.py echo --backends epoll asyncio --conns 100 --duration 3
+        python benchmarks/suite.py --output new.json --compare baseline.json
+'''
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loadgen
+import servers
+
+
+SCENARIOS   = ['micro', 'timers', 'echo', 'http']
+FD_SETSIZE  = 1024
+_HIGHER_IS_BETTER = ('rps',)
+
+
+''' micro and timer benchmarks, seconds for n operations '''
+
+def exonix_micro(backend, n, sleepers, repeat):
+    from exonix import getloop, sleep
+    from exonix.job import Job
+    from exonix.reactor import SelectReactor, EpollReactor
+    from bench_core import bench_switch, bench_spawn
+
+    loop = getloop()
+    if backend == 'select':
+        loop.use_reactor(SelectReactor)
+    elif backend == 'epoll':
+        loop.use_reactor(EpollReactor)
+    elif backend == 'uring':
+        from exonix.iouring import IoUringReactor
+        loop.use_reactor(IoUringReactor)
+
+    def timer_cancel(n):
+        target = Job(None, loop)        # never fires, one job for all timers
+        start  = time.perf_counter()
+        for i in range(n):
+            loop.call_later(target, 1.0 + (i & 1023) * 0.001).cancel()
+        return time.perf_counter() - start
+
+    def timer_sleep(n):
+        async def sleeper(rounds):
+            for _ in range(rounds):
+                await sleep(0.001)
+
+        rounds = max(1, n // sleepers)
+        for _ in range(sleepers):
+            loop.new_task(sleeper(rounds))
+        start = time.perf_counter()
+        loop.run_default_policy()
+        return time.perf_counter() - start, rounds * sleepers
+
+    return _measure(bench_switch, bench_spawn, timer_cancel, timer_sleep, n, repeat)
+
+def asyncio_micro(backend, n, sleepers, repeat):
+    def bench_switch(n):
+        async def spinner():
+            for _ in range(n):
+                await asyncio.sleep(0)
+
+        loop  = asyncio.new_event_loop()
+        start = time.perf_counter()
+        loop.run_until_complete(spinner())
+        elapsed = time.perf_counter() - start
+        loop.close()
+        return elapsed
+
+    def bench_spawn(n):
+        async def empty():
+            pass
+
+        async def root():
+            loop  = asyncio.get_running_loop()
+            tasks = [loop.create_task(empty()) for _ in range(n)]
+            for task in tasks:
+                await task
+
+        loop  = asyncio.new_event_loop()
+        start = time.perf_counter()
+        loop.run_until_complete(root())
+        elapsed = time.perf_counter() - start
+        loop.close()
+        return elapsed
+
+    def timer_cancel(n):
+        loop     = asyncio.new_event_loop()
+        callback = lambda: None
+        start    = time.perf_counter()
+        for i in range(n):
+            loop.call_later(1.0 + (i & 1023) * 0.001, callback).cancel()
+        elapsed = time.perf_counter() - start
+        loop.close()
+        return elapsed
+
+    def timer_sleep(n):
+        async def sleeper(rounds):
+            for _ in range(rounds):
+                await asyncio.sleep(0.001)
+
+        async def root(rounds):
+            await asyncio.gather(*[sleeper(rounds) for _ in range(sleepers)])
+
+        rounds = max(1, n // sleepers)
+        loop   = asyncio.new_event_loop()
+        start  = time.perf_counter()
+        loop.run_until_complete(root(rounds))
+        elapsed = time.perf_counter() - start
+        loop.close()
+        return elapsed, rounds * sleepers
+
+    return _measure(bench_switch, bench_spawn, timer_cancel, timer_sleep, n, repeat)
+
+def _measure(bench_switch, bench_spawn, timer_cancel, timer_sleep, n, repeat):
+    micro = {'switch_ns': min(bench_switch(n) for _ in range(repeat)) / n * 1e9,
+             'spawn_ns' : min(bench_spawn(n) for _ in range(repeat)) / n * 1e9}
+    sleep = min(timer_sleep(n) for _ in range(repeat))
+    timers = {'arm_cancel_ns': min(timer_cancel(n) for _ in range(repeat)) / n * 1e9,
+              'sleep_ns'     : sleep[0] / sleep[1] * 1e9}
+    return {'micro': {k: round(v, 1) for k, v in micro.items()},
+            'timers': {k: round(v, 1) for k, v in timers.items()}}
+
+def _micro_child(backend, n, sleepers, repeat, results):
+    try:
+        bench = asyncio_micro if backend == 'asyncio' else exonix_micro
+        results.put(bench(backend, n, sleepers, repeat))
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+
+
+''' network benchmarks '''
+
+def _server_child(backend, app, ports):
+    servers.serve(backend, app, ready=ports.put)
+
+def run_server_bench(backend, app, conns, args):
+    if backend == 'select' and conns + 16 >= FD_SETSIZE:
+        return {'connections': conns, 'skipped': f"select() cannot watch fds >= {FD_SETSIZE}"}
+
+    ports  = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_server_child, args=(backend, app, ports), daemon=True)
+    server.start()
+    try:
+        port = ports.get(timeout=10)
+        return loadgen.run(('127.0.0.1', port), conns, app, args.size, args.warmup,
+                           args.duration, args.client_procs)
+    except Exception as e:
+        return {'connections': conns, 'error': f"{type(e).__name__}: {e}"}
+    finally:
+        server.terminate()
+        server.join()
+
+
+''' driver '''
+
+def run_backend(backend, args):
+    result = {}
+    if 'micro' in args.scenarios or 'timers' in args.scenarios:
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_micro_child,
+                                        args=(backend, args.n, args.sleepers, args.repeat, queue))
+        child.start()
+        micro = queue.get()
+        child.join()
+        for scenario in ('micro', 'timers'):
+            if scenario in args.scenarios:
+                result[scenario] = micro.get(scenario, micro)
+
+    for app, levels in (('echo', args.conns), ('http', args.http_conns)):
+        if app in args.scenarios:
+            result[app] = {str(conns): run_server_bench(backend, app, conns, args) for conns in levels}
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def metrics(results):
+    ''' Flatten to {backend/scenario/level/metric: value} for printing and comparing '''
+    flat = {}
+    for backend, scenarios in results.items():
+        for scenario, values in scenarios.items():
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for metric in ('rps', 'p50_us', 'p99_us'):
+                        if metric in value:
+                            flat[f"{backend}/{scenario}/{key}/{metric}"] = value[metric]
+                elif isinstance(value, (int, float)):
+                    flat[f"{backend}/{scenario}/{key}"] = value
+    return flat
+
+def report(results, baseline=None):
+    for backend, scenarios in results.items():
+        for scenario, values in scenarios.items():
+            for key, value in values.items():
+                if isinstance(value, dict) and ('error' in value or 'skipped' in value):
+                    print(f"{backend}/{scenario}/{key}: {value.get('error') or value.get('skipped')}")
+
+    base = metrics(baseline['results']) if baseline else {}
+    for name, value in metrics(results).items():
+        line = f"{name:<36} {value:>14,.1f}"
+        old  = base.get(name)
+        if old:
+            change = (value - old) / old * 100
+            better = change > 0 if name.endswith(_HIGHER_IS_BETTER) else change < 0
+            line  += f"   {change:+6.1f}% {'better' if better else 'worse'} than {old:,.1f}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', help=f"any of {', '.join(SCENARIOS)}, default all")
+    parser.add_argument('--backends', nargs='+', default=['select', 'epoll', 'asyncio'], choices=servers.BACKENDS)
+    parser.add_argument('-n', type=int, default=200000, help="operations per micro/timer benchmark")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sleepers', type=int, default=10000, help="concurrent jobs in the sleep benchmark")
+    parser.add_argument('--conns', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--http-conns', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--size', type=int, default=64, help="echo message size in bytes")
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--client-procs', type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    parser.add_argument('--output', '-o', default=None, help="JSON file, default benchmarks/results/<date>.json")
+    parser.add_argument('--compare', default=None, help="earlier JSON result to compare against")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or SCENARIOS
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario!r}, pick from {', '.join(SCENARIOS)}")
+
+    loadgen.raise_fd_limit()
+    results = {}
+    for backend in args.backends:
+        print(f"running {backend} ...", flush=True)
+        results[backend] = run_backend(backend, args)
+
+    document = {
+        'meta': {
+            'date'     : datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision' : git_revision(),
+            'python'   : sys.version.split()[0],
+            'platform' : platform.platform(),
+            'cpus'     : os.cpu_count(),
+            'args'     : {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+        os.makedirs(folder, exist_ok=True)
+        output = os.path.join(folder, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    print(f"results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,34 @@
 from .kernel import *
 from .executor import *
 from .promise import *
+from .timer import *
+from .net import *
+from .streams import *
+from .supervisor import *
+from .runtime import *
+from .policy import *
+from .combinators import *
+from .sync import *
+from .queues import *
+from .stats import *
+from .profile import *
+from .httpparser import *
+from .http import *
+from .static import *
 
 __all__ = (executor.__all__ +
-           promise.__all__)
+           promise.__all__ +
+           timer.__all__ +
+           net.__all__ +
+           streams.__all__ +
+           supervisor.__all__ +
+           runtime.__all__ +
+           policy.__all__ +
+           combinators.__all__ +
+           sync.__all__ +
+           queues.__all__ +
+           stats.__all__ +
+           profile.__all__ +
+           httpparser.__all__ +
+           http.__all__ +
+           static.__all__)
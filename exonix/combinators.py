@@ -0,0 +1,282 @@
+'''
+    Waiting on many promises at once.
+
+    Each combinator registers one shared _Countdown (see promise.py) on every
+    child instead of awaiting the children one after the other: the waiting job
+    parks once and is woken once, when enough children are done, rather than
+    switching in and out for every child.
+
+        gather(*aws)             all results in argument order
+        first_completed(*aws)    (done, pending) as soon as one child is done
+        race(*aws)               result of the first child to finish, losers cancelled
+        as_completed(*aws)       async iterator over the children as they finish
+        TaskGroup                jobs spawned inside `async with` are awaited
+                                 at its end, the first failure cancels the rest
+
+    Coroutines are wrapped into Jobs on the current loop (like converge), Jobs
+    and Promises are awaited as they are.
+'''
+
+from .executor import getloop
+from .job import Job
+from .promise import Promise,CancelledError,_Countdown,PENDING,FINISHED,FAILED
+
+
+try:
+    _ExceptionGroup = BaseExceptionGroup
+except NameError:
+    class _ExceptionGroup(Exception):
+        ''' Stand-in for BaseExceptionGroup before Python 3.11, same message
+            and exceptions attributes
+        '''
+        def __init__(self,message,exceptions) -> None:
+            super().__init__(message,exceptions)
+            self.message    = message
+            self.exceptions = tuple(exceptions)
+
+        def __str__(self) -> str:
+            return f"{self.message} ({len(self.exceptions)} sub-exceptions)"
+
+
+def _watch_all(aws,countdown):
+    ''' Register countdown on every awaitable and return them as promises.
+        Coroutines become Jobs that get countdown as their waiter before they
+        are queued, promises already done are recorded right away
+    '''
+    loop     = getloop()
+    children = []
+    spawned  = []
+    for aw in aws:
+        if isinstance(aw,Promise):
+            if not aw._watch(countdown):
+                countdown._done(aw)
+        else:
+            aw = Job(aw,loop)
+            aw._waiters = countdown
+            spawned.append(aw)
+        children.append(aw)
+
+    loop._ready.extend(spawned)
+    return children
+
+def _unwatch(children,countdown):
+    for child in children:
+        if child._state == PENDING:
+            child._unpark(countdown)
+
+def _cancel_pending(children):
+    for child in children:
+        if child._state == PENDING:
+            child.cancel()
+
+
+async def gather(*aws,return_exceptions=False,aggregate=False,cancel_on_error=True):
+    ''' Wait for every awaitable and return their results in argument order.
+
+        By default the first failure is raised at once and, with cancel_on_error,
+        the children still running are cancelled. return_exceptions puts the
+        exceptions into the result list instead, aggregate waits for everyone
+        and raises all failures together as an ExceptionGroup (a plain Exception
+        with the same message and exceptions attributes before Python 3.11)
+    '''
+    fail_fast = not (return_exceptions or aggregate)
+    countdown = _Countdown(len(aws),fail_fast)
+    children  = _watch_all(aws,countdown)
+
+    try:
+        await countdown.wait()
+    except CancelledError:
+        _unwatch(children,countdown)
+        _cancel_pending(children)
+        raise
+
+    if fail_fast and countdown.failed is not None:
+        _unwatch(children,countdown)
+        if cancel_on_error:
+            _cancel_pending(children)
+        raise countdown.failed._value
+
+    results = [child._value for child in children]
+    if aggregate:
+        errors = [child._value for child in children if child._state > FINISHED]
+        if errors:
+            raise _ExceptionGroup(f"{len(errors)} of {len(children)} awaitables failed",errors)
+    return results
+
+
+async def first_completed(*aws):
+    ''' Wait until at least one awaitable is done, returns (done, pending) lists.
+        Nothing is cancelled
+    '''
+    if not aws:
+        raise ValueError("first_completed() needs at least one awaitable")
+    countdown = _Countdown(1)
+    children  = _watch_all(aws,countdown)
+
+    try:
+        await countdown.wait()
+    finally:
+        _unwatch(children,countdown)
+
+    done = countdown.done
+    return done,[child for child in children if child._state == PENDING]
+
+
+async def race(*aws,cancel_losers=True):
+    ''' Result of whichever awaitable finishes first, raising its exception if it
+        failed. The others are cancelled unless cancel_losers is False
+    '''
+    if not aws:
+        raise ValueError("race() needs at least one awaitable")
+    countdown = _Countdown(1)
+    children  = _watch_all(aws,countdown)
+    try:
+        await countdown.wait()
+    except CancelledError:
+        _unwatch(children,countdown)
+        _cancel_pending(children)
+        raise
+
+    _unwatch(children,countdown)
+    winner = countdown.done[0]
+    if cancel_losers:
+        _cancel_pending(children)
+    if winner._state > FINISHED:
+        raise winner._value
+    return winner._value
+
+
+class as_completed:
+    ''' Async iterator yielding the awaitables as they finish, each one is done
+        so awaiting it returns (or raises) immediately:
+
+            async for job in as_completed(*jobs):
+                result = await job
+    '''
+
+    def __init__(self,*aws) -> None:
+        self._countdown  =  _Countdown(1)
+        self._children   =  _watch_all(aws,self._countdown)
+        self._next       =  0         # index into countdown.done
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        countdown = self._countdown
+        if self._next == len(self._children):
+            raise StopAsyncIteration
+
+        countdown.quorum = self._next + 1
+        await countdown.wait()
+        promise = countdown.done[self._next]
+        self._next += 1
+        return promise
+
+    def __len__(self):
+        return len(self._children) - self._next
+
+    def close(self):
+        ''' Stop listening to the children that are still running '''
+        _unwatch(self._children,self._countdown)
+        self._next = len(self._children)
+
+
+'''
+    Structured concurrency: every job spawned through the group is a waiter-less
+    member of one shared countdown, and leaving the `async with` block waits for
+    all of them, so none outlives the block.
+
+        async with TaskGroup() as group:
+            for request in batch:
+                group.spawn(handle(request))
+            group.spawn_many(backend_calls)      # one extend onto the ready queue
+
+    When a member fails, the members still running are cancelled at once and
+    the failure is raised out of the block after they have all finished. If the
+    block itself raises or the job running it is cancelled, every member is
+    cancelled and waited for before the exception propagates.
+'''
+class TaskGroup:
+    def __init__(self,loop=None) -> None:
+        self._loop       =  loop
+        self._jobs       =  []
+        self._countdown  =  _Countdown(0,on_fail=self.__member_failed)
+        self._error      =  None      # first member that failed, not just cancelled
+        self._closed     =  False
+
+    def __repr__(self) -> str:
+        return f"<TaskGroup jobs={len(self._jobs)} done={len(self._countdown.done)}>"
+
+    async def __aenter__(self):
+        if self._loop is None:
+            self._loop = getloop()
+        return self
+
+    def spawn(self,coro):
+        return self.spawn_many((coro,))[0]
+
+    def spawn_many(self,coros):
+        ''' Create a Job per coroutine and queue them all with one extend '''
+        if self._closed:
+            for coro in coros:
+                coro.close()            # never started, keep them from warning
+            raise Exception("TaskGroup is closed")
+
+        loop      = self._loop or getloop()
+        countdown = self._countdown
+        jobs      = [Job(coro,loop) for coro in coros]
+        for job in jobs:
+            job._waiters = countdown
+        countdown.quorum += len(jobs)
+        self._jobs.extend(jobs)
+
+        if self._error is not None:
+            for job in jobs:
+                job.cancel()
+        loop._ready.extend(jobs)
+        return jobs
+
+    def __member_failed(self,job):
+        if job._state == FAILED and self._error is None:
+            self._error = job
+            self.cancel()
+
+    def cancel(self):
+        ''' Cancel every member that is still running '''
+        for job in self._jobs:
+            if job._state == PENDING:
+                job.cancel()
+
+    async def __aexit__(self,exc_type,exc,tb):
+        if exc is not None:
+            self.cancel()
+
+        cancelled = None
+        while True:
+            try:
+                await self._countdown.wait()
+                break
+            except CancelledError as e:
+                # members are cancelled and still awaited, so none is left behind
+                cancelled = cancelled or e
+                self.cancel()
+
+        self._closed = True
+        error = self._error
+        if error is None:
+            # under a threaded runtime the countdown can be satisfied on another
+            # worker just before that worker runs __member_failed
+            error = next((job for job in self._countdown.done if job._state == FAILED),None)
+        self._jobs.clear()
+        self._countdown.done.clear()
+        self._error = None
+
+        if cancelled is not None:
+            raise cancelled
+        if exc is None and error is not None:
+            raise error._value
+        return False
+
+
+__all__ = ['gather','first_completed','race','as_completed','TaskGroup']
@@ -1,11 +1,19 @@
 from .kernel import kernel_switch
 from collections import deque
-import heapq
+import concurrent.futures
+import os
+import sys
+import threading
 import time
-from .job import Job
-from enum import Enum,auto
+import traceback
+from .job import Job,ScheduledJob
+from .promise import Promise,CancelledError,_Countdown,FINISHED
+from .timer import TimerWheel
+from .offload import Offloader
+from .stats import LoopStats
 from abc import ABC,abstractmethod
 from .reactor import *
+from .sync import Lock,Barrier       # moved to exonix.sync, importable from here as before
 
 class SingletonMeta(type):
     _instances = {}
@@ -57,14 +65,38 @@ class ExecutorBase(ABC):
         """
         pass
 
+class _LoopStopped(Exception):
+    pass
+
+def _stop_loop():
+    # queued like a job by TaskExecutor.stop(), unwinds run_default_policy
+    raise _LoopStopped
+
+_SLICE_JOBS = 128
+
+def _report_exception(job,exc):
+    print(f"exonix: unhandled exception in {job!r}",file=sys.stderr)
+    traceback.print_exception(type(exc),exc,exc.__traceback__)
+
+def _report_slow(job,elapsed):
+    print(f"exonix: {job!r} held the loop for {elapsed * 1000:.1f} ms",file=sys.stderr)
+
+class _LoopReload(Exception):
+    pass
+
+def _reload_loop():
+    # queued by use_policy/enable_stats, a running loop re-enters and picks up
+    # the new ready queue or the instrumented variant
+    raise _LoopReload
+
+
 class TaskExecutor(metaclass=SingletonMeta):
     def __init__(self) -> None:
         if not hasattr(self,'_initialized'):
             self._initialized     = True
-            self.__readyTask     = deque()
-            self.__sleepingTask  = []
-            self.__current       = None 
-            self.__id            = 0
+            self._ready          = deque()      # touched directly by Job on the hot path
+            self._current        = None
+            self.__timers        = TimerWheel()
                     
             
             '''
@@ -74,56 +106,232 @@ class TaskExecutor(metaclass=SingletonMeta):
                  and the completion api's like IO_URING 
             '''
 
-            self.__reactor = SelectReactor(self)
-            # self.__reactor = EpollReactor(self)
+            self.__reactor = default_reactor(self)
+
+            # cross thread handoff: other threads append (callback,args) and poke
+            # the waker, the loop drains the whole batch in one turn
+            self._handoff        = deque()
+            self._wakeup_sent    = False
+            self._keepalive      = 0            # work out on other threads that will call back
+            self.__waker         = Waker()
+            self.__waker_armed   = False
+            self.__drain_cb      = self.__drain_handoff
+            self.__offload       = None
+
+            # time slice: after this many jobs (or this many seconds) in a row the
+            # loop polls the reactor without blocking and expires timers, so jobs
+            # that only ever yield cannot starve IO
+            self._slice_jobs     = _SLICE_JOBS
+            self._slice_time     = None
+            self._slow_after     = None         # seconds, see warn_slow_jobs
+            self._on_slow        = _report_slow
+            self._on_error       = _report_exception
+            self._stats          = None         # LoopStats while enable_stats is on
+
+    @classmethod
+    def create(cls):
+        ''' A loop that is not the process wide singleton, e.g. one per worker
+            thread of a multi threaded runtime. Bind it with set_thread_loop
+        '''
+        loop = cls.__new__(cls)
+        loop.__init__()
+        return loop
 
     def get_current(self):
-        return self.__current
+        return self._current
     
     def set_current(self,current):
-        self.__current = current
+        self._current = current
+
+    def get_reactor(self):
+        return self.__reactor
+
+    def use_reactor(self,reactor_cls,*args,**kwargs):
+        ''' Swap the IO reactor, e.g. use_reactor(SelectReactor) or
+            use_reactor(EpollReactor, flags=select.EPOLLET). Only allowed while
+            nothing is parked on the current one
+        '''
+        if self.__reactor.reactor_ready():
+            raise Exception("Cannot switch reactor while tasks are waiting on IO")
+
+        self.__reactor.close()
+        self.__reactor = reactor_cls(self,*args,**kwargs)
+        if self.__waker_armed:
+            self.__waker_armed = False
+            self.__arm_waker()
+        return self.__reactor
+
+    def use_policy(self,policy_cls,*args,**kwargs):
+        ''' Swap the ready queue for a scheduling policy from exonix.policy, e.g.
+            use_policy(PriorityPolicy). Queued jobs move over, works while running
+        '''
+        old    = self._ready
+        policy = policy_cls(*args,**kwargs)
+        while old:
+            job = old.popleft()
+            if job is not _reload_loop:
+                policy.append(job)
+
+        self._ready = policy
+        old.append(_reload_loop)
+        return policy
+
+    def get_policy(self):
+        return self._ready
+
+    def use_timers(self,timer_cls,*args,**kwargs):
+        ''' Swap the timer backend, e.g. use_timers(TimerHeap) or
+            use_timers(TimerWheel, resolution=0.0001)
+        '''
+        if self.__timers:
+            raise Exception("Cannot switch timers while timers are pending")
+
+        self.__timers = timer_cls(*args,**kwargs)
+        return self.__timers
 
 
-    '''Ensures the pushed value is a _Task'''
-    def __create_task(self,_task):
+    def new_task(self,_task):
+        ''' Queue a coroutine (wrapped into a Job) or an existing Job, returns the Job '''
         if not isinstance(_task,Job):
-            raise Exception("Argument Passed is not a acceptable type")
-            
-        self.__readyTask.append(_task)
+            _task = Job(_task,self)
+        self._ready.append(_task)
+        return _task
+
+    def schedule(self,_task,priority=0,deadline=None,group=None):
+        ''' new_task with the attributes the scheduling policies look at: priority
+            (higher first), deadline in seconds from now, group for fair sharing
+        '''
+        if deadline is not None:
+            deadline += time.monotonic()
+        job = ScheduledJob(_task,self,priority,deadline,group)
+        self._ready.append(job)
+        return job
+
+    def new_tasks(self,jobs):
+        ''' Bulk version of new_task for already created Jobs, used by the reactors
+            to hand over everything one poll woke up in a single extend
+        '''
+        self._ready.extend(jobs)
 
-    def new_task(self,_task):
-        prom = None
-        if isinstance(_task,Job):
-            self.__create_task(_task)
-            prom = _task
-        else:
-            prom = Job(_task)
-            self.__create_task(prom)
-        return prom
-    
     def read_wait(self,fileno,task):
+        ''' Park task until fileno is readable. fileno is a socket (or anything
+            with fileno()) or a raw int fd. Call discard_fd before closing it
+            while a task may still be parked on it
+        '''
         self.__reactor.register_reader(fileno,task)
     
     def write_wait(self,fileno,task):
+        ''' Park task until fileno is writable, see read_wait '''
         self.__reactor.register_writter(fileno,task)
 
     async def sleep(self,delay):
-        self.call_later(self.__current,delay)
-        self.__current = None 
+        if delay > 0:
+            self.call_later(self._current,delay)
+            self._current = None 
         await kernel_switch()
     
     def close_epoll(self,fd):
         self.__reactor.remove_waiters(fd)
 
-    ''' experimental right now '''
+    def discard_fd(self,fd):
+        ''' Call before closing fd so the reactor drops its registration and
+            wakes whoever is still parked on it. Required for an fd with waiters:
+            closing it first leaves them parked on a number the kernel may hand
+            to the next open()
+        '''
+        self.__reactor.discard(fd)
+
+    def remove_reader(self,fd):
+        return self.__reactor.remove_reader(fd)
+
+    def remove_writer(self,fd):
+        return self.__reactor.remove_writer(fd)
+
+    def call_soon_threadsafe(self,callback,*args):
+        ''' Run callback(*args) on the loop thread. Safe from any thread; the only
+            shared state is a deque append and, for the first call of a batch, one
+            eventfd write that interrupts a blocked poll
+        '''
+        self._handoff.append((callback,args))
+        if not self._wakeup_sent:
+            self._wakeup_sent = True
+            self.__waker.notify()
+
+    def wakeup(self):
+        ''' Interrupt a blocked poll from any thread '''
+        if not self._wakeup_sent:
+            self._wakeup_sent = True
+            self.__waker.notify()
+
+    def submit_threadsafe(self,coro):
+        ''' Schedule a coroutine from another thread, returns a
+            concurrent.futures.Future with its result
+        '''
+        future = concurrent.futures.Future()
+        self.call_soon_threadsafe(self.__spawn_bridged,coro,future)
+        return future
+
+    def __spawn_bridged(self,coro,future):
+        if future.set_running_or_notify_cancel():
+            self.new_task(_bridge(coro,future))
+        else:
+            coro.close()
+
+    def configure_offload(self,threads=None,processes=None,batch_size=1,process_batch_size=None):
+        ''' Pool sizes and batching for run_in_thread/run_in_process, see
+            exonix.offload. Pools already running are shut down without waiting
+        '''
+        if self.__offload is not None:
+            self.__offload.shutdown(wait=False)
+        self.__offload = Offloader(self,threads,processes,batch_size,process_batch_size)
+        return self.__offload
+
+    def run_in_thread(self,fn,*args,**kwargs):
+        ''' Run a blocking call on the thread pool, returns an awaitable Promise '''
+        if self.__offload is None:
+            self.configure_offload()
+        return self.__offload.run_in_thread(fn,*args,**kwargs)
+
+    def run_in_process(self,fn,*args,**kwargs):
+        ''' Run a CPU bound call on the process pool, returns an awaitable Promise '''
+        if self.__offload is None:
+            self.configure_offload()
+        return self.__offload.run_in_process(fn,*args,**kwargs)
+
+    def shutdown_offload(self,wait=True):
+        if self.__offload is not None:
+            self.__offload.shutdown(wait)
+            self.__offload = None
+
+    def __arm_waker(self):
+        reactor = self.__reactor
+        reactor.register_reader(self.__waker.fileno(),self.__drain_cb)
+        reactor._internal += 1
+        self.__waker_armed = True
+
+    def __drain_handoff(self):
+        # queued like a job by the reactor when the waker fires
+        self.__reactor._internal -= 1
+        self.__waker_armed = False
+
+        self._wakeup_sent = False       # cleared before draining, later appends poke again
+        self.__waker.drain()
+        handoff = self._handoff
+        for _ in range(len(handoff)):
+            callback,args = handoff.popleft()
+            callback(*args)
+
+        self.__arm_waker()
+
     def call_later(self,task,delay):
-        self.__id += 1
-        deadline = delay + time.time()
+        ''' Schedule task to run after delay seconds on the monotonic clock,
+            returns a TimerHandle whose cancel() drops it in O(1)
+        '''
+        if not isinstance(task,Job):
+            task = Job(task,self)
 
-        if isinstance(task,Job):
-            heapq.heappush(self.__sleepingTask,(deadline,self.__id,task))
-        else:
-            heapq.heappush(self.__sleepingTask,(deadline,self.__id,Job(task)))   
+        handle = task._parked = self.__timers.add(time.monotonic() + delay,task)
+        return handle
 
     
     ''' Experimental kind of now we can use another loop in here we should have build in system for different loops
@@ -136,15 +344,125 @@ class TaskExecutor(metaclass=SingletonMeta):
                  for monitoring tasks  
     '''
     
+    def close(self):
+        ''' Release the reactor, the wakeup fd and the offload pools '''
+        self.shutdown_offload(wait=False)
+        self.__reactor.close()
+        self.__waker.close()
+
+    def pending(self):
+        ''' True while anything could still make a job runnable '''
+        return bool(self._ready or self.__timers or self.__reactor.reactor_ready()
+                    or self._keepalive or self._handoff)
+
+    def run_once(self,timeout=None):
+        ''' Poll the reactor once, bounded by timeout and by the next timer, then
+            move expired timers to the ready queue. For runtimes that drive the
+            loop themselves instead of run_default_policy
+        '''
+        if not self.__waker_armed:
+            self.__arm_waker()
+
+        timers = self.__timers
+        if timers:
+            delay = timers.next_deadline() - time.monotonic()
+            if delay < 0:
+                delay = 0
+            if timeout is None or delay < timeout:
+                timeout = delay
+
+        self.__reactor.poll(timeout)
+        if timers:
+            timers.expire(time.monotonic(),self._ready)
+
+    def enable_stats(self,enabled=True):
+        ''' Switch loop instrumentation on or off, see stats(). While it is off
+            the loop runs without any of the bookkeeping
+        '''
+        if enabled:
+            if self._stats is None:
+                self._stats = LoopStats()
+        else:
+            self._stats = None
+        self._ready.append(_reload_loop)    # a running loop switches variant at once
+
+    def stats(self):
+        ''' Counters and histograms recorded since enable_stats, plus the current
+            queue sizes. Times are seconds, *_us histograms microseconds
+        '''
+        current = {'ready': len(self._ready),'timers': len(self.__timers),
+                   'waiting_fds': self.__reactor._waiting - self.__reactor._internal,
+                   'handoff': len(self._handoff),'keepalive': self._keepalive}
+        if self._stats is None:
+            current['enabled'] = False
+            return current
+        snapshot = self._stats.snapshot()
+        snapshot.update(current)
+        snapshot['enabled'] = True
+        return snapshot
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats.reset()
+
+    def set_time_slice(self,jobs=_SLICE_JOBS,seconds=None):
+        ''' Bound how long ready jobs run back to back before the loop looks at
+            the reactor and the timers again: at most `jobs` jobs and, if given,
+            `seconds` of wall time (e.g. 0.0005 for 500us)
+        '''
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        self._slice_jobs = jobs
+        self._slice_time = seconds
+
+    def warn_slow_jobs(self,threshold=0.1,callback=None):
+        ''' Call callback(job, elapsed) whenever a single step of a job keeps the
+            loop busy for threshold seconds or more. The default callback prints
+            the job to stderr, threshold None switches the check off
+        '''
+        self._slow_after = threshold
+        self._on_slow    = callback or _report_slow
+
+    def set_exception_handler(self,handler=None):
+        ''' handler(job, exc) is called when a job fails while nobody awaits it,
+            None restores the default that prints the traceback to stderr
+        '''
+        self._on_error = handler or _report_exception
+
+    def report_exception(self,job,exc):
+        self._on_error(job,exc)
+
+    def stop(self):
+        ''' Make run_default_policy return once the jobs already ready have run,
+            whatever is still parked or sleeping stays where it is
+        '''
+        self._ready.append(_stop_loop)
+
     def run_default_policy(self):
+        while True:
+            try:
+                self.__run_default_policy()
+                return
+            except _LoopStopped:
+                return
+            except _LoopReload:
+                continue
+
+    def __run_default_policy(self):
+        if self._stats is not None:
+            return self.__run_instrumented()
+
+        ready = self._ready
+        if not self.__waker_armed:
+            self.__arm_waker()
 
-        while (self.__readyTask or self.__sleepingTask or self.__reactor.reactor_ready()):
+        while (ready or self.__timers or self.__reactor.reactor_ready()
+               or self._keepalive or self._handoff):
 
-            if not self.__readyTask:
+            if not ready:
 
-                if self.__sleepingTask:
-                    deadline,_ ,func = self.__sleepingTask[0]
-                    timeout = deadline - time.time()
+                if self.__timers:
+                    timeout = self.__timers.next_deadline() - time.monotonic()
 
                     if timeout < 0:
                         timeout = 0
@@ -160,103 +478,208 @@ class TaskExecutor(metaclass=SingletonMeta):
                 '''
                 # print(timeout)
                 self.__reactor.poll(timeout)
-                
-                time_now = time.time()
-                while self.__sleepingTask:
-                    if time_now > self.__sleepingTask[0][0]:
-                        self.__create_task(heapq.heappop(self.__sleepingTask)[2])
-                    else:
-                        break
 
-            self.__current = self.__readyTask.popleft()
-            self.__current()
-
-
-''' 
-        Base Policy Locks soon we will make it more fast and powerful 
-'''
-
-class Lock:
-    class LockState(Enum):
-        ACQUIRED = auto()
-        RELEASED = auto()
-
-    def __init__(self,exe) -> None:
-        self.__lock      =  self.LockState.RELEASED
-        self.__waiters   =  deque()            
-        self.__executor  =  exe
-
-    def __repr__(self) -> str:
-        if self.__lock == self.LockState.ACQUIRED:
-            return f"<Lock on {self.__executor.get_current()} {self.__lock}>"
-        else:
-            return f"<Lock finished {self.__lock}>"
-
-    async def acquire(self):
-        if self.__lock == self.LockState.ACQUIRED:
-            # wait 
-            self.__waiters.append(self.__executor.get_current())
-            self.__executor.set_current(None)
-            await kernel_switch()
-        else:        
-            self.__lock = self.LockState.ACQUIRED
-
-    def release(self):
-        self.__lock = self.LockState.RELEASED
-        
-        if self.__waiters:
-            self.__executor.new_task(self.__waiters.popleft())
-
-
-class Barrier:
-    class BarrierState(Enum):
-        WAITING  = auto()
-        FINISHED = auto()
-
-    def __init__(self,count,exe) -> None:
-        self.__idx      =  0
-        self.__count    =  count
-        self.__waiters  =  deque()
-        self.__state    =  self.BarrierState.WAITING
-        self.__executor =  exe
-
-    async def wait(self):
-        self.__idx += 1
-        
-        if self.__idx < self.__count:
-            self.__waiters.append(self.__executor.get_current())
-            self.__executor.set_current(None)
-            await kernel_switch()
-
-        else:
-            for i in self.__waiters:
-                self.__executors.new_task(self.__waiters.popleft())
+                if self.__timers:
+                    self.__timers.expire(time.monotonic(),ready)
 
+                if not ready:
+                    continue
 
+            # Job.__call__ marks itself as current
+            if self._slice_time is None and self._slow_after is None:
+                for _ in range(self._slice_jobs):
+                    ready.popleft()()
+                    if not ready:
+                        break
+            else:
+                self.__run_timed_slice(ready)
+
+            # slice used up with jobs still ready: let IO and timers in without
+            # blocking, they queue behind the jobs that are already ready
+            if ready:
+                self.__reactor.poll(0)
+                if self.__timers:
+                    self.__timers.expire(time.monotonic(),ready)
+
+    def __run_timed_slice(self,ready):
+        clock    = time.perf_counter
+        slow     = self._slow_after
+        start    = clock()
+        deadline = start + self._slice_time if self._slice_time is not None else None
+
+        for count in range(1,self._slice_jobs + 1):
+            job = ready.popleft()
+            job()
+            now = clock()
+            if slow is not None and now - start >= slow:
+                self._on_slow(job,now - start)
+            if not ready or (deadline is not None and now >= deadline):
+                break
+            start = now
+        return count
+
+    ''' 
+        Same loop as __run_default_policy, timing every poll and slice into
+        self._stats. Kept separate so the plain loop pays nothing for it
+    '''
+    def __run_instrumented(self):
+        ready = self._ready
+        stats = self._stats
+        clock = time.perf_counter
+        if not self.__waker_armed:
+            self.__arm_waker()
+
+        while (ready or self.__timers or self.__reactor.reactor_ready()
+               or self._keepalive or self._handoff):
+            stats.iterations += 1
+
+            if not ready:
+                if self.__timers:
+                    timeout = self.__timers.next_deadline() - time.monotonic()
+                    if timeout < 0:
+                        timeout = 0
+                else:
+                    timeout = None
+
+                self.__poll_instrumented(timeout,ready,stats)
+                if not ready:
+                    continue
+
+            stats.ready_depth.record(len(ready))
+            start = clock()
+            if self._slice_time is None and self._slow_after is None:
+                for count in range(1,self._slice_jobs + 1):
+                    ready.popleft()()
+                    if not ready:
+                        break
+            else:
+                count = self.__run_timed_slice(ready)
+            stats.run_time += clock() - start
+            stats.jobs     += count
+            stats.jobs_per_iteration.record(count)
+
+            if ready:
+                self.__poll_instrumented(0,ready,stats)
+
+    def __poll_instrumented(self,timeout,ready,stats):
+        before = len(ready)
+        clock  = time.perf_counter
+        start  = clock()
+        self.__reactor.poll(timeout)
+        spent  = clock() - start
+
+        stats.polls     += 1
+        stats.poll_time += spent
+        stats.poll_us.record(spent * 1e6)
+        stats.woken_per_poll.record(len(ready) - before)
+        if self.__timers:
+            self.__timers.expire(time.monotonic(),ready,stats.timer_lateness_us)
+
+
+async def _bridge(coro,future):
+    try:
+        result = await coro
+    except BaseException as e:
+        future.set_exception(e)
+        if not isinstance(e,Exception):
+            raise
+    else:
+        future.set_result(result)
+
+
+# loop of the calling thread: the process wide TaskExecutor unless a runtime
+# bound a worker loop to this thread with set_thread_loop
+_local = threading.local()
 
 def getloop():
-    return TaskExecutor()
+    try:
+        return _local.loop
+    except AttributeError:
+        loop = _local.loop = TaskExecutor()
+        return loop
+
+def set_thread_loop(loop):
+    _local.loop = loop
+
+def _forget_loop():
+    # a forked child must not share the parent's epoll/io_uring instance or its
+    # queues, the first getloop() in the child builds a fresh executor
+    global _local
+    _local = threading.local()
+    loop = SingletonMeta._instances.pop(TaskExecutor,None)
+    if loop is not None:
+        loop.get_reactor().close()
+        loop._TaskExecutor__waker.close()
+
+if hasattr(os,'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_loop)
 
 async def sleep(delay):
     loop = getloop()
-    loop.call_later(loop.get_current(),delay)
-    loop.set_current(None)
+    if delay > 0:
+        loop.call_later(loop.get_current(),delay)
+        loop.set_current(None)
     await kernel_switch()
 
+'''
+    Timer armed by with_timeout, cancels the job that waits once it fires.
+    with_timeout disarms it on the way out, since a late loop can run it in
+    the same pass as the timer that already let the job through
+'''
+class _Expiry(Job):
+    __slots__ = ('_target','fired')
+
+    def __init__(self,target,loop) -> None:
+        super().__init__(None,loop)
+        self._target  =  target
+        self.fired    =  False
+
+    def __call__(self):
+        if self._target is None:
+            return                      # disarmed, the awaitable won in the same timer pass
+        self.fired = True
+        self._target.cancel()
+
+async def with_timeout(awaitable,seconds):
+    ''' Await awaitable for at most seconds, then raise TimeoutError. A Job or
+        Promise passed in is cancelled on timeout, a coroutine runs inside the
+        caller and is interrupted wherever it waits. seconds None waits forever
+    '''
+    if seconds is None:
+        return await awaitable
+
+    loop   = getloop()
+    expiry = _Expiry(loop._current,loop)
+    handle = loop.call_later(expiry,seconds)
+    try:
+        return await awaitable
+    except CancelledError:
+        if not expiry.fired:
+            raise
+        if isinstance(awaitable,Promise):
+            awaitable.cancel()
+        raise TimeoutError(f"timed out after {seconds}s") from None
+    finally:
+        expiry._target = None
+        handle.cancel()
+
 def start(task):
+    ''' Run task until the loop is out of work and return its result, an
+        exception it failed with is raised here
+    '''
     _loop = getloop()
     res = _loop.new_task(task)
+    res._watch(_Countdown())            # counts as awaited, start() raises it
     _loop.run_default_policy()
+    if res._state > FINISHED:
+        raise res._value
     return res.inner_val_unsafe()
 
 def converge(*args):
     _loop = getloop()
-    res = []
-
-    for i in args:
-        res.append(_loop.new_task(i))
-
+    res = [i if isinstance(i,Job) else Job(i,_loop) for i in args]
+    _loop.new_tasks(res)
     return res
 
 
-__all__ = ['getloop','sleep','start','converge']
\ No newline at end of file
+__all__ = ['getloop','sleep','with_timeout','start','converge']
\ No newline at end of file
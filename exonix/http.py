@@ -0,0 +1,350 @@
+'''
+    HTTP/1.1 server on the TaskExecutor.
+
+    Every connection is one job of a TcpServer that receives into the buffer of
+    its HttpParser (see httpparser.py) and takes whole requests off its front,
+    so a request split over several recv calls is simply completed by the next
+    one, and several pipelined requests arriving in one recv are all answered,
+    in order, with a single send. Connections stay open (HTTP/1.1 default, or
+    HTTP/1.0 with Connection: keep-alive) until the client closes, asks for
+    close, or stays idle for keepalive_timeout seconds.
+
+    Bodies are read by Content-Length or Transfer-Encoding: chunked, both bounded
+    by max_body_size. Handlers are looked up per method and path:
+
+        app = Router()
+
+        @app.get('/users/{id}')
+        async def user(request):
+            return {'id': request.params['id']}
+
+        HttpServer(app, '127.0.0.1', 8080, default_headers={'Access-Control-Allow-Origin': '*'})
+
+    A handler returns a Response, or bytes/str (text/html), a dict or list (JSON)
+    or None (204). Raising HttpError answers with that status.
+'''
+
+import json
+import os
+import re
+import socket
+import traceback
+from http import HTTPStatus
+
+from .executor import with_timeout
+from .net import TcpServer
+from .httpparser import HttpParser,Request,HttpError
+
+
+_CRLF            = b"\r\n"
+_KEEPALIVE       = 75.0         # seconds an idle keep-alive connection is kept
+_NO_BODY         = frozenset((204,304))
+_MSG_MORE        = getattr(socket,'MSG_MORE',0)     # hold the head back for the file body that follows
+
+
+_status_lines = {}
+
+def _status_line(status):
+    line = _status_lines.get(status)
+    if line is None:
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            phrase = "Unknown"
+        line = _status_lines[status] = f"HTTP/1.1 {status} {phrase}\r\n".encode()
+    return line
+
+
+class Response:
+    __slots__ = ('status','body','headers','content_type')
+
+    def __init__(self,body=b"",status=200,headers=None,content_type='text/html; charset=utf-8') -> None:
+        self.status        =  status
+        self.body          =  body.encode() if isinstance(body,str) else body
+        self.headers       =  headers or {}
+        self.content_type  =  content_type
+
+    def __repr__(self) -> str:
+        return f"<Response {self.status} {len(self.body)} bytes>"
+
+    @classmethod
+    def json(cls,data,status=200,headers=None):
+        return cls(json.dumps(data).encode(),status,headers,'application/json')
+
+    @classmethod
+    def text(cls,text,status=200,headers=None):
+        return cls(text,status,headers,'text/plain; charset=utf-8')
+
+    @property
+    def length(self):
+        return len(self.body)
+
+    def header_lines(self):
+        ''' Content-Type, Content-Length and the headers of this response,
+            encoded. Subclasses that answer the same way many times can
+            compute this once
+        '''
+        parts = []
+        if self.status not in _NO_BODY:
+            parts.append(f"Content-Type: {self.content_type}\r\nContent-Length: {self.length}\r\n".encode())
+        for name,value in self.headers.items():
+            parts.append(f"{name}: {value}\r\n".encode('latin-1'))
+        return b"".join(parts)
+
+    def encode(self,keep_alive=True,extra=b"",head_only=False):
+        ''' Status line, headers and body as one bytes object. extra is a block
+            of already encoded header lines sent with every response
+        '''
+        parts = [_status_line(self.status),
+                 self.header_lines(),
+                 b"Connection: keep-alive\r\n" if keep_alive else b"Connection: close\r\n",
+                 extra,
+                 _CRLF]
+        if not head_only and self.status not in _NO_BODY:
+            parts.append(self.body)
+        return b"".join(parts)
+
+
+'''
+    Response whose body is count bytes of an open file from offset. The server
+    sends the head as usual and the body with AsyncSocket.sendfile, so it never
+    passes through Python, then closes the file (also when the body is not
+    sent, for HEAD or a dropped connection).
+'''
+class FileResponse(Response):
+    __slots__ = ('file','offset','count')
+
+    def __init__(self,file,offset=0,count=None,status=200,headers=None,
+                 content_type='application/octet-stream') -> None:
+        super().__init__(b"",status,headers,content_type)
+        self.file    =  file
+        self.offset  =  offset
+        self.count   =  count if count is not None else os.fstat(file.fileno()).st_size - offset
+
+    def __repr__(self) -> str:
+        return f"<FileResponse {self.status} {self.count} bytes of {self.file!r}>"
+
+    @property
+    def length(self):
+        return self.count
+
+    def close(self):
+        self.file.close()
+
+
+def _coerce(result):
+    if isinstance(result,Response):
+        return result
+    if result is None:
+        return Response(status=204)
+    if isinstance(result,(bytes,bytearray,memoryview,str)):
+        return Response(result)
+    if isinstance(result,(dict,list)):
+        return Response.json(result)
+    raise TypeError(f"handler returned {type(result).__name__}, expected Response, bytes, str, dict or list")
+
+
+'''
+    Handlers by path and method. Paths match exactly, a {name} segment matches
+    one path segment and a {name:path} segment the rest of the path, slashes
+    included; either lands in request.params. GET handlers also answer HEAD.
+'''
+class Router:
+    _PARAM = re.compile(r'\{(\w+)(?::(path))?\}')
+
+    def __init__(self) -> None:
+        self._exact    =  {}      # path -> {method: handler}
+        self._pattern  =  []      # (regex, {method: handler})
+
+    def add(self,method,path,handler):
+        method = method.upper()
+        if '{' not in path:
+            self._exact.setdefault(path,{})[method] = handler
+            return handler
+
+        pieces = self._PARAM.split(path)        # literal, name, converter, literal, ...
+        parts  = [re.escape(pieces[0])]
+        for i in range(1,len(pieces),3):
+            name,converter,literal = pieces[i:i + 3]
+            parts.append(f'(?P<{name}>.+)' if converter == 'path' else f'(?P<{name}>[^/]+)')
+            parts.append(re.escape(literal))
+        regex  = re.compile('^' + ''.join(parts) + '$')
+        for known,methods in self._pattern:
+            if known.pattern == regex.pattern:
+                methods[method] = handler
+                return handler
+        self._pattern.append((regex,{method: handler}))
+        return handler
+
+    def route(self,path,methods=('GET',)):
+        def register(handler):
+            for method in methods:
+                self.add(method,path,handler)
+            return handler
+        return register
+
+    def get(self,path):
+        return self.route(path,('GET',))
+
+    def post(self,path):
+        return self.route(path,('POST',))
+
+    def put(self,path):
+        return self.route(path,('PUT',))
+
+    def delete(self,path):
+        return self.route(path,('DELETE',))
+
+    def resolve(self,request):
+        ''' Handler for request, filling request.params. Raises HttpError 404
+            for an unknown path and 405 for a known path without that method
+        '''
+        methods = self._exact.get(request.path)
+        if methods is None:
+            for regex,candidates in self._pattern:
+                match = regex.match(request.path)
+                if match is not None:
+                    request.params = match.groupdict()
+                    methods = candidates
+                    break
+            else:
+                raise HttpError(404)
+
+        handler = methods.get(request.method)
+        if handler is None and request.method == 'HEAD':
+            handler = methods.get('GET')
+        if handler is None:
+            raise HttpError(405,headers={'Allow': ', '.join(methods)})
+        return handler
+
+
+def _error_response(error):
+    return Response.text(error.message,error.status,error.headers)
+
+
+class HttpServer:
+    def __init__(self,router,host='127.0.0.1',port=0,default_headers=None,
+                 keepalive_timeout=_KEEPALIVE,max_header_size=65536,max_headers=100,
+                 max_body_size=16 * 1024 * 1024,buffer_size=8192,
+                 reuse_port=False,sock=None,loop=None) -> None:
+        self.router             =  router
+        self.keepalive_timeout  =  keepalive_timeout
+        self.limits             =  (buffer_size,max_header_size,max_headers,max_body_size)
+        self.requests           =  0
+        self._extra             =  b"".join(f"{name}: {value}\r\n".encode('latin-1')
+                                            for name,value in (default_headers or {}).items())
+        self._server            =  TcpServer(self.__connection,host,port,reuse_port=reuse_port,
+                                             sock=sock,loop=loop)
+
+    def __repr__(self) -> str:
+        return f"<HttpServer {self.address} active={self._server.active} requests={self.requests}>"
+
+    @property
+    def address(self):
+        return self._server.address
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def close(self):
+        self._server.close()
+
+    async def __connection(self,conn):
+        parser  = HttpParser(*self.limits)
+        timeout = self.keepalive_timeout
+
+        while True:
+            out,close = await self.__answer(parser)
+            if out:
+                if not await self.__send(conn,out):
+                    return
+            if close:
+                return
+            if parser.wants_continue():
+                await conn.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+            try:
+                if timeout is None:
+                    received = await conn.recv_into(parser.buffer())
+                else:
+                    received = await with_timeout(conn.recv_into(parser.buffer()),timeout)
+            except (TimeoutError,ConnectionError):
+                return
+            if not received:
+                return
+            parser.feed(received)
+
+    async def __answer(self,parser):
+        ''' Responses to every complete request buffered in parser, and whether
+            the connection closes after them. Requests are answered before the
+            next recv, so their body views into the receive buffer stay valid
+            while the handler runs
+        '''
+        out = []
+        while True:
+            try:
+                request = parser.next()
+            except HttpError as e:
+                out.append(_error_response(e).encode(False,self._extra))
+                return out,True
+            if request is None:
+                return out,False
+
+            self.requests += 1
+            keep_alive = request.keep_alive
+            response   = await self.__dispatch(request)
+            head_only  = request.method == 'HEAD'
+            out.append(response.encode(keep_alive,self._extra,head_only))
+            if isinstance(response,FileResponse):
+                if head_only or response.status in _NO_BODY:
+                    response.close()
+                else:
+                    out.append(response)
+            if not keep_alive:
+                return out,True
+
+    async def __send(self,conn,out):
+        ''' Sends encoded responses in one write and FileResponse bodies with
+            sendfile between them. False if a file came up short, the client
+            then waits for bytes that never come and the connection must close
+        '''
+        if len(out) == 1:
+            await conn.sendall(out[0])
+            return True
+
+        complete = True
+        pending  = []
+        try:
+            for i,part in enumerate(out):
+                if not isinstance(part,FileResponse):
+                    pending.append(part)
+                    continue
+                await conn.sendall(b"".join(pending),_MSG_MORE)
+                pending = []
+                if await conn.sendfile(part.file,part.offset,part.count) < part.count:
+                    complete = False
+                    break
+                part.close()
+            else:
+                if pending:
+                    await conn.sendall(b"".join(pending))
+        finally:
+            for part in out[i:]:
+                if isinstance(part,FileResponse):
+                    part.close()
+        return complete
+
+    async def __dispatch(self,request):
+        try:
+            result = self.router.resolve(request)(request)
+            if hasattr(result,'__await__'):
+                result = await result
+            return _coerce(result)
+        except HttpError as e:
+            return _error_response(e)
+        except Exception:
+            traceback.print_exc()
+            return Response.text("Internal Server Error",500)
+
+
+__all__ = ['HttpServer','Router','Request','Response','FileResponse','HttpError']
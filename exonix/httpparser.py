@@ -0,0 +1,424 @@
+'''
+    Incremental HTTP/1.x request parser working in place on one receive buffer.
+
+    The connection receives straight into the parser's bytearray (recv_into on
+    buffer()) and next() takes complete requests off the front of it. Nothing
+    is split into lines or decoded to find the end of a request: the parser
+    searches the buffer with find() and keeps offsets. A request stays where
+    it arrived until it is complete; its offsets are relative to its first
+    byte, so moving the unparsed tail to the front of the buffer (or into a
+    bigger one) does not disturb what was already parsed, and the scan
+    resumes where the last call stopped instead of starting over.
+
+        method, target, version    decoded to str, they are short and always used
+        headers                    Headers, a view of the header lines that is only
+                                   split and decoded on the first lookup
+        body                       memoryview of the buffer for Content-Length
+                                   bodies, chunked bodies are joined once
+
+    The memoryviews point into the receive buffer and are only valid until the
+    handler of the request returns, call bytes() on them (or Headers.copy())
+    to keep the data.
+
+    Limits: max_header_size bytes for request line plus headers (431),
+    max_headers header lines (431), max_body_size (413).
+'''
+
+import json
+import urllib.parse
+from http import HTTPStatus
+
+
+_CRLF            = b"\r\n"
+_HEAD_END        = b"\r\n\r\n"
+_BUFFER_SIZE     = 8192         # per connection, grows for big requests and shrinks back
+_MAX_HEADER_SIZE = 65536
+_MAX_HEADERS     = 100
+_MAX_BODY_SIZE   = 16 * 1024 * 1024
+_MAX_CHUNK_LINE  = 1024
+
+# parser states
+_HEAD       = 0
+_BODY       = 1
+_CHUNK_SIZE = 2
+_CHUNK_DATA = 3
+_TRAILERS   = 4
+
+_OWS       = b' \t'
+_HEXDIGITS = b'0123456789abcdefABCDEF'
+
+
+class HttpError(Exception):
+    ''' Raised by the parser or a handler, answered with status '''
+    def __init__(self,status,message=None,headers=None) -> None:
+        self.status  = int(status)
+        self.message = message or HTTPStatus(self.status).phrase
+        self.headers = headers
+        super().__init__(self.message)
+
+
+'''
+    Read only view of a request's header lines, still in the receive buffer.
+    Nothing is split or decoded until the first lookup, which indexes every
+    line by its lower-cased name in one pass; a handler that never looks at a
+    header never pays for it. Repeated headers are joined with ', ' by get(),
+    getall() returns them one by one.
+'''
+class Headers:
+    __slots__ = ('_view','_index')
+
+    def __init__(self,view) -> None:
+        self._view   =  view          # the header lines, each ending in CRLF
+        self._index  =  None          # lower-cased name -> [values]
+
+    def __repr__(self) -> str:
+        return f"<Headers {self.copy()!r}>"
+
+    def __build(self):
+        index = {}
+        for line in str(self._view,'latin-1').split('\r\n'):
+            name,sep,value = line.partition(':')
+            if not sep:
+                continue
+            name   = name.lower()
+            value  = value.strip(' \t')
+            values = index.get(name)
+            if values is None:
+                index[name] = [value]
+            else:
+                values.append(value)
+        self._index = index
+        self._view  = None            # decoded, the buffer may be reused from here on
+        return index
+
+    def __indexed(self):
+        # an empty index is built too, _view is gone after the first build
+        if self._index is None:
+            self.__build()
+        return self._index
+
+    def get(self,name,default=None):
+        values = self.__indexed().get(name.lower())
+        if values is None:
+            return default
+        return values[0] if len(values) == 1 else ', '.join(values)
+
+    def getall(self,name):
+        return list(self.__indexed().get(name.lower(),()))
+
+    def __getitem__(self,name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self,name):
+        return name.lower() in self.__indexed()
+
+    def __iter__(self):
+        return iter(self.__indexed())
+
+    def __len__(self):
+        return len(self.__indexed())
+
+    def items(self):
+        ''' (lower-cased name, value) per header line, in arrival order per name '''
+        return [(name,value) for name,values in self.__indexed().items() for value in values]
+
+    def copy(self):
+        ''' Plain dict of lower-cased names to values, independent of the buffer '''
+        return {name: self.get(name) for name in self}
+
+
+def _field(lines,name):
+    ''' Values of one header in the lower-cased header lines, searched for as
+        CRLF + name so the other lines are never looked at
+    '''
+    values = []
+    pos    = lines.find(name)
+    while pos >= 0:
+        colon = pos + len(name)
+        if lines[colon:colon + 1] == b':':
+            eol = lines.find(_CRLF,colon)
+            values.append(lines[colon + 1:eol].strip(_OWS))
+        elif lines[colon:colon + 1] in (b' ',b'\t'):
+            raise HttpError(400,"whitespace before colon")
+        pos = lines.find(name,colon)
+    return values
+
+
+class Request:
+    __slots__ = ('method','target','path','query','version','headers','body','params','keep_alive','_args')
+
+    def __init__(self,method,target,version,headers,body=b"",keep_alive=None) -> None:
+        path,_,query     =  target.partition('?')
+        self.method      =  method
+        self.target      =  target
+        self.path        =  urllib.parse.unquote(path) if '%' in path else path
+        self.query       =  query
+        self.version     =  version
+        self.headers     =  headers         # Headers, or any mapping with get()
+        self.body        =  body
+        self.params      =  {}              # {name} segments of the matched route
+        self._args       =  None
+        if keep_alive is None:
+            connection = (headers.get('connection') or '').lower()
+            keep_alive = 'close' not in connection if version == 'HTTP/1.1' else 'keep-alive' in connection
+        self.keep_alive  =  keep_alive
+
+    def __repr__(self) -> str:
+        return f"<Request {self.method} {self.target} {self.version}>"
+
+    def header(self,name,default=None):
+        return self.headers.get(name,default)
+
+    @property
+    def args(self):
+        ''' Query string arguments, the first value of each name '''
+        if self._args is None:
+            self._args = {k: v[0] for k,v in urllib.parse.parse_qs(self.query).items()}
+        return self._args
+
+    def text(self,encoding='utf-8'):
+        return str(self.body,encoding)
+
+    def json(self):
+        return json.loads(str(self.body,'utf-8'))
+
+    def form(self):
+        ''' application/x-www-form-urlencoded body, the first value of each name '''
+        return {k: v[0] for k,v in urllib.parse.parse_qs(str(self.body,'latin-1')).items()}
+
+
+class HttpParser:
+    __slots__ = ('max_header_size','max_headers','max_body_size','_size','_buf','_view',
+                 '_start','_end','_state','_pos','_head','_length','_chunks','_body_size',
+                 '_continued')
+
+    def __init__(self,buffer_size=_BUFFER_SIZE,max_header_size=_MAX_HEADER_SIZE,
+                 max_headers=_MAX_HEADERS,max_body_size=_MAX_BODY_SIZE) -> None:
+        self.max_header_size  =  max_header_size
+        self.max_headers      =  max_headers
+        self.max_body_size    =  max_body_size
+        self._size            =  buffer_size
+        self._buf             =  bytearray(buffer_size)
+        self._view            =  memoryview(self._buf)
+        self._start           =  0          # first byte of the request being parsed
+        self._end             =  0          # end of the received data
+        self._state           =  _HEAD
+        self._pos             =  0          # where the scan resumes, relative to _start
+        self._head            =  None       # parsed request line and headers
+        self._length          =  0          # Content-Length, or bytes left in the chunk
+        self._chunks          =  []         # (start, end) of chunk data, relative
+        self._body_size       =  0
+        self._continued       =  False
+
+    def __repr__(self) -> str:
+        return f"<HttpParser buffered={self._end - self._start} capacity={len(self._buf)}>"
+
+    ''' receive side '''
+
+    def buffer(self):
+        ''' Writable memoryview of the free end of the buffer, for recv_into.
+            Makes room first by moving the unparsed bytes to the front or,
+            once they fill the buffer, by switching to one twice the size
+        '''
+        start,end = self._start,self._end
+        if start == end:
+            if len(self._buf) > self._size * 4:    # a big body grew it, give the memory back
+                self.__replace(bytearray(self._size))
+            self._start = self._end = 0
+        elif end == len(self._buf):
+            if start:
+                self._view[:end - start] = self._view[start:end]    # memmove, may overlap
+            else:
+                grown = bytearray(len(self._buf) * 2)
+                grown[:end] = self._view[:end]
+                self.__replace(grown)
+            self._start,self._end = 0,end - start
+        return self._view[self._end:]
+
+    def feed(self,nbytes):
+        ''' nbytes were received into the view buffer() returned '''
+        self._end += nbytes
+
+    def __replace(self,buf):
+        # views handed out for the last request keep the old buffer alive
+        self._buf  = buf
+        self._view = memoryview(buf)
+
+    def wants_continue(self):
+        ''' True once for a request whose head asked for 100-continue and whose
+            body has not arrived yet
+        '''
+        if self._state == _HEAD or self._continued:
+            return False
+        self._continued = True
+        return self._head[6]
+
+    ''' parsing '''
+
+    def next(self):
+        ''' The next complete request, or None until more bytes are fed '''
+        state = self._state
+        if state == _HEAD:
+            if not self.__parse_head():
+                return None
+            state = self._state
+
+        if state == _BODY:
+            start = self._start
+            end   = start + self._pos + self._length
+            if end > self._end:
+                return None
+            body = self._view[start + self._pos:end]
+        else:
+            if not self.__parse_chunks():
+                return None
+            end   = self._start + self._pos
+            body  = self.__join_chunks()
+
+        method,target,version,lines,lines_end,keep_alive,_ = self._head
+        start   = self._start
+        request = Request(method,target,version,Headers(self._view[start + lines:start + lines_end]),
+                          body,keep_alive)
+        self._start     = end
+        self._state     = _HEAD
+        self._pos       = 0
+        self._head      = None
+        self._continued = False
+        return request
+
+    def __parse_head(self):
+        buf,start,end = self._buf,self._start,self._end
+
+        # tolerate the empty lines some clients send between requests
+        while buf.startswith(_CRLF,start,end):
+            start += 2
+        self._start = start
+
+        head_end = buf.find(_HEAD_END,max(start,start + self._pos - 3),end)
+        if head_end < 0:
+            if end - start > self.max_header_size:
+                raise HttpError(431)
+            self._pos = end - start
+            return False
+        if head_end - start > self.max_header_size:
+            raise HttpError(431)
+
+        line_end = buf.find(_CRLF,start,head_end + 2)
+        first    = buf.find(b' ',start,line_end)
+        second   = buf.find(b' ',first + 1,line_end)
+        if first <= start or second < 0 or not buf.startswith(b'HTTP/1.',second + 1,line_end):
+            raise HttpError(400,"malformed request line")
+        view    = self._view
+        method  = str(view[start:first],'latin-1')
+        target  = str(view[first + 1:second],'latin-1')
+        version = str(view[second + 1:line_end],'latin-1')
+
+        # the parser itself needs four headers: find them in one lower-cased copy
+        # of the header lines instead of walking every line in Python
+        lines = buf[line_end:head_end + 2].lower()          # CRLF name: value CRLF ...
+        if lines.count(_CRLF) - 1 > self.max_headers:
+            raise HttpError(431,"too many header lines")
+        length     = _field(lines,b'\r\ncontent-length') if b'\r\ncontent-length' in lines else ()
+        encoding   = _field(lines,b'\r\ntransfer-encoding') if b'\r\ntransfer-encoding' in lines else ()
+        connection = _field(lines,b'\r\nconnection') if b'\r\nconnection' in lines else ()
+        expect     = _field(lines,b'\r\nexpect') if b'\r\nexpect' in lines else ()
+
+        if version == 'HTTP/1.1':
+            keep_alive = not connection or b'close' not in b','.join(connection)
+        else:
+            keep_alive = bool(connection) and b'keep-alive' in b','.join(connection)
+
+        self._head = (method,target,version,line_end + 2 - start,head_end + 2 - start,
+                      keep_alive,b'100-continue' in expect)
+        self._pos  = head_end + 4 - start
+        if encoding:
+            codings = [coding.strip(_OWS) for coding in b','.join(encoding).split(b',')]
+            if codings[-1] != b'chunked' or length:
+                # a body whose end is not set by chunked framing, or framed two ways
+                raise HttpError(400,"chunked must be the final transfer coding, without Content-Length")
+            if len(codings) > 1:
+                raise HttpError(501,"only chunked transfer coding is supported")
+            self._state     = _CHUNK_SIZE
+            self._chunks    = []
+            self._body_size = 0
+        elif length:
+            if len(length) > 1 or not length[0].isdigit():
+                raise HttpError(400,"invalid Content-Length")
+            self._length = int(length[0])
+            if self._length > self.max_body_size:
+                raise HttpError(413)
+            self._state = _BODY
+        else:
+            self._length = 0
+            self._state  = _BODY
+        return True
+
+    def __parse_chunks(self):
+        ''' Walk the chunks received so far, True once the last chunk and the
+            trailers are in. Data stays in place, only its offsets are kept
+        '''
+        buf,start,end = self._buf,self._start,self._end
+        if end - start > self.max_header_size + 2 * self.max_body_size:
+            raise HttpError(413,"chunk framing too large")      # e.g. millions of 1 byte chunks
+        while True:
+            pos = start + self._pos
+            if self._state == _CHUNK_SIZE:
+                eol = buf.find(_CRLF,pos,end)
+                if eol < 0:
+                    if end - pos > _MAX_CHUNK_LINE:
+                        raise HttpError(400,"chunk size line too long")
+                    return False
+                size_end = buf.find(b';',pos,eol)
+                if size_end < 0:
+                    field = buf[pos:eol]
+                else:
+                    field = buf[pos:size_end].rstrip(_OWS)      # BWS before an extension
+                # hex digits only: int() would also take a sign, 0x, _ and spaces
+                if not field or len(field) > 16 or field.translate(None,_HEXDIGITS):
+                    raise HttpError(400,"invalid chunk size")
+                size = int(field,16)
+                self._pos = eol + 2 - start
+                if size == 0:
+                    self._state = _TRAILERS
+                    continue
+                self._body_size += size
+                if self._body_size > self.max_body_size:
+                    raise HttpError(413)
+                self._length = size
+                self._state  = _CHUNK_DATA
+
+            elif self._state == _CHUNK_DATA:
+                if pos + self._length + 2 > end:
+                    return False
+                data_end = pos + self._length
+                if not buf.startswith(_CRLF,data_end):
+                    raise HttpError(400,"chunk not terminated by CRLF")
+                self._chunks.append((pos - start,data_end - start))
+                self._pos   = data_end + 2 - start
+                self._state = _CHUNK_SIZE
+
+            else:
+                # trailers end with an empty line, without trailers that is right here
+                if buf.startswith(_CRLF,pos,end):
+                    self._pos = pos + 2 - start
+                    return True
+                trailer = buf.find(_HEAD_END,pos,end)
+                if trailer < 0:
+                    if end - pos > self.max_header_size:
+                        raise HttpError(431)
+                    return False
+                self._pos = trailer + 4 - start
+                return True
+
+    def __join_chunks(self):
+        view,start,chunks = self._view,self._start,self._chunks
+        self._chunks = []
+        if len(chunks) == 1:
+            return view[start + chunks[0][0]:start + chunks[0][1]]
+        return memoryview(b"".join([view[start + a:start + b] for a,b in chunks]))
+
+
+__all__ = ['HttpParser','Headers']
@@ -0,0 +1,565 @@
+'''
+    io_uring reactor talking to the kernel directly through ctypes and mmap.
+
+    Submissions are written into the shared SQ ring as they are requested and
+    handed to the kernel with a single io_uring_enter when the loop polls, so one
+    loop turn costs one syscall no matter how many accepts, recvs and sends were
+    queued. Completions are read straight out of the CQ ring and the Job that
+    issued the operation is resumed with the result already in hand, there is no
+    separate readiness wakeup followed by a recv.
+
+    The readiness api every reactor offers (register_reader/register_writter) is
+    implemented with IORING_OP_POLL_ADD so existing code keeps working, the
+    completion api is used through the coroutines at the bottom of this module,
+    which fall back to readiness + syscall when the loop runs another reactor.
+
+    Python has no acquire/release loads and stores, the ring indices are only
+    touched right around io_uring_enter which acts as the barrier. That is
+    sufficient on x86-64 (TSO) and for completions posted inline by the syscall.
+'''
+
+import ctypes
+import mmap
+import os
+
+from .reactor import ReactorBase,READABLE,WRITABLE,_fileno,default_reactor
+from .kernel import kernel_switch
+from .executor import getloop
+
+
+_NR_SETUP   = 425           # same numbers on x86-64 and aarch64
+_NR_ENTER   = 426
+
+_OFF_SQ_RING  = 0
+_OFF_CQ_RING  = 0x8000000
+_OFF_SQES     = 0x10000000
+
+_ENTER_GETEVENTS  = 1 << 0
+_ENTER_EXT_ARG    = 1 << 3
+_FEAT_SINGLE_MMAP = 1 << 0
+_FEAT_EXT_ARG     = 1 << 8
+
+_OP_POLL_ADD      = 6
+_OP_TIMEOUT       = 11
+_OP_ACCEPT        = 13
+_OP_ASYNC_CANCEL  = 14
+_OP_READ          = 22
+_OP_WRITE         = 23
+_OP_SEND          = 26
+_OP_RECV          = 27
+
+_CANCEL_ALL  = 1 << 0
+_CANCEL_FD   = 1 << 1
+
+_POLLIN   = 0x001
+_POLLOUT  = 0x004
+
+_u8, _u16, _u32, _u64, _i32, _i64 = (ctypes.c_uint8, ctypes.c_uint16, ctypes.c_uint32,
+                                     ctypes.c_uint64, ctypes.c_int32, ctypes.c_int64)
+
+class _SqringOffsets(ctypes.Structure):
+    _fields_ = [('head',_u32),('tail',_u32),('ring_mask',_u32),('ring_entries',_u32),
+                ('flags',_u32),('dropped',_u32),('array',_u32),('resv1',_u32),('user_addr',_u64)]
+
+class _CqringOffsets(ctypes.Structure):
+    _fields_ = [('head',_u32),('tail',_u32),('ring_mask',_u32),('ring_entries',_u32),
+                ('overflow',_u32),('cqes',_u32),('flags',_u32),('resv1',_u32),('user_addr',_u64)]
+
+class _Params(ctypes.Structure):
+    _fields_ = [('sq_entries',_u32),('cq_entries',_u32),('flags',_u32),('sq_thread_cpu',_u32),
+                ('sq_thread_idle',_u32),('features',_u32),('wq_fd',_u32),('resv',_u32 * 3),
+                ('sq_off',_SqringOffsets),('cq_off',_CqringOffsets)]
+
+class _Sqe(ctypes.Structure):
+    _fields_ = [('opcode',_u8),('flags',_u8),('ioprio',_u16),('fd',_i32),('off',_u64),
+                ('addr',_u64),('len',_u32),('op_flags',_u32),('user_data',_u64),
+                ('buf_index',_u16),('personality',_u16),('file_index',_i32),
+                ('addr3',_u64),('pad',_u64)]
+
+class _Cqe(ctypes.Structure):
+    _fields_ = [('user_data',_u64),('res',_i32),('flags',_u32)]
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec',_i64),('tv_nsec',_i64)]
+
+class _GeteventsArg(ctypes.Structure):
+    _fields_ = [('sigmask',_u64),('sigmask_sz',_u32),('pad',_u32),('ts',_u64)]
+
+
+_libc = None
+
+def _syscall():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.syscall.restype = ctypes.c_long
+    return _libc.syscall
+
+
+def _address(buf, writable):
+    ''' Address of a buffer the kernel reads from or writes into, plus the object
+        that has to stay alive until the completion arrives
+    '''
+    try:
+        view = (ctypes.c_char * len(buf)).from_buffer(buf)
+        return ctypes.addressof(view), view
+    except TypeError:
+        if writable:
+            raise
+    data = buf if type(buf) is bytes else bytes(buf)
+    ptr  = ctypes.c_char_p(data)
+    return ctypes.cast(ptr, ctypes.c_void_p).value or 0, (data, ptr)
+
+
+'''
+    Result of one submitted operation. res follows the kernel convention, the
+    byte count or new fd on success and -errno on failure.
+'''
+class Completion:
+    __slots__ = ('res','flags','task','keep','reactor','token')
+
+    def __init__(self,task,keep,reactor=None) -> None:
+        self.res      =  None
+        self.flags    =  0
+        self.task     =  task
+        self.keep     =  keep       # buffers the kernel still points into
+        self.reactor  =  reactor
+        self.token    =  0
+
+    def _unpark(self,job):
+        ''' Job.cancel(): ask the kernel to cancel the operation, its completion
+            still arrives later and is dropped then, keep holds the buffers until
+        '''
+        if self.task is not job or self.res is not None:
+            return False
+        self.task = None
+        self.reactor._cancel(self)
+        return True
+
+    def result(self):
+        res = self.res
+        if res is None:
+            raise Exception("operation has not completed yet")
+        if res < 0:
+            raise OSError(-res, os.strerror(-res))
+        return res
+
+    def __repr__(self) -> str:
+        return f"<Completion res={self.res}>"
+
+
+class IoUringReactor(ReactorBase):
+    completions = True
+
+    def __init__(self, _loop, entries=256) -> None:
+        super().__init__(_loop)
+
+        params = _Params()
+        fd     = _syscall()(_NR_SETUP, ctypes.c_uint(entries), ctypes.byref(params))
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"io_uring_setup: {os.strerror(err)}")
+
+        self._ring_fd   = fd
+        self._features  = params.features
+        self._inflight  = {}       # user_data -> Completion or (record, direction)
+        self._next_id   = 1        # 0 is reserved for internal sqes nobody waits on
+        self._reaping   = False
+
+        try:
+            self.__map(params)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._ts  = _Timespec()
+        self._arg = _GeteventsArg(0, 8, 0, ctypes.addressof(self._ts))
+
+    def __map(self, p):
+        sq_size = p.sq_off.array + p.sq_entries * 4
+        cq_size = p.cq_off.cqes + p.cq_entries * ctypes.sizeof(_Cqe)
+        flags   = mmap.MAP_SHARED | getattr(mmap, 'MAP_POPULATE', 0)
+        prot    = mmap.PROT_READ | mmap.PROT_WRITE
+
+        if p.features & _FEAT_SINGLE_MMAP:
+            sq_size = cq_size = max(sq_size, cq_size)
+
+        self._sq_mm   = mmap.mmap(self._ring_fd, sq_size, flags, prot, offset=_OFF_SQ_RING)
+        if p.features & _FEAT_SINGLE_MMAP:
+            self._cq_mm = self._sq_mm
+        else:
+            self._cq_mm = mmap.mmap(self._ring_fd, cq_size, flags, prot, offset=_OFF_CQ_RING)
+        self._sqe_mm  = mmap.mmap(self._ring_fd, p.sq_entries * ctypes.sizeof(_Sqe), flags, prot, offset=_OFF_SQES)
+
+        self._sq_head    = _u32.from_buffer(self._sq_mm, p.sq_off.head)
+        self._sq_tail    = _u32.from_buffer(self._sq_mm, p.sq_off.tail)
+        self._sq_mask    = p.sq_entries - 1
+        self._sq_entries = p.sq_entries
+        self._sqes       = (_Sqe * p.sq_entries).from_buffer(self._sqe_mm)
+
+        # sqe slots are used in ring order, so the indirection array is the
+        # identity and only has to be written once
+        array = (_u32 * p.sq_entries).from_buffer(self._sq_mm, p.sq_off.array)
+        for i in range(p.sq_entries):
+            array[i] = i
+        del array
+
+        self._cq_head = _u32.from_buffer(self._cq_mm, p.cq_off.head)
+        self._cq_tail = _u32.from_buffer(self._cq_mm, p.cq_off.tail)
+        self._cq_mask = p.cq_entries - 1
+        self._cqes    = (_Cqe * p.cq_entries).from_buffer(self._cq_mm, p.cq_off.cqes)
+
+        self._tail = self._sq_tail.value
+
+    def close(self):
+        if self._ring_fd < 0:
+            return
+        for name in ('_sq_head','_sq_tail','_sqes','_cq_head','_cq_tail','_cqes'):
+            setattr(self, name, None)
+        for mm in {id(m): m for m in (self._sq_mm, self._cq_mm, self._sqe_mm)}.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass
+        os.close(self._ring_fd)
+        self._ring_fd = -1
+
+    ''' --- submission side --- '''
+
+    def __enter(self, to_submit, min_complete, flags, arg=None, argsz=0):
+        syscall = _syscall()
+        while True:
+            res = syscall(_NR_ENTER, ctypes.c_int(self._ring_fd), ctypes.c_uint(to_submit),
+                          ctypes.c_uint(min_complete), ctypes.c_uint(flags), arg, ctypes.c_size_t(argsz))
+            if res >= 0:
+                return res
+            err = ctypes.get_errno()
+            if err == 62:                          # ETIME, the wait timed out
+                return 0
+            if err == 4:                           # EINTR
+                continue
+            if err in (11, 16):                    # EAGAIN/EBUSY, completions must be reaped first
+                return -err
+            raise OSError(err, f"io_uring_enter: {os.strerror(err)}")
+
+    def __unsubmitted(self):
+        # without SQPOLL the kernel advances sq_head exactly as far as it
+        # consumed, so whatever lies between head and our tail is still ours
+        return (self._tail - self._sq_head.value) & 0xffffffff
+
+    def __flush(self):
+        ''' Submit the queued sqes, True once the kernel took them all. It may
+            take fewer than asked, or none (EAGAIN/EBUSY) while completions are
+            backed up: then the completion queue is drained, which also lets the
+            kernel flush its overflow list, and the submit retried once. What
+            is still left stays queued for the next flush or poll
+        '''
+        self._sq_tail.value = self._tail & 0xffffffff
+        retried = False
+        while True:
+            pending = self.__unsubmitted()
+            if not pending:
+                return True
+            if self.__enter(pending, 0, 0) > 0:
+                continue                    # partial submit, go again with the rest
+            if retried or self._reaping:
+                return False
+            retried = True
+            woken   = []
+            self.__enter(0, 0, _ENTER_GETEVENTS)
+            self.__reap(woken)
+            if woken:
+                self._loop.new_tasks(woken)
+
+    def __sqe(self, opcode, fd, user_data):
+        # only write the slot once the kernel consumed what was in it
+        while self.__unsubmitted() >= self._sq_entries:
+            if not self.__flush() and self.__unsubmitted() >= self._sq_entries:
+                raise OSError(16, "io_uring submission queue full, the kernel takes no more sqes")
+        sqe = self._sqes[self._tail & self._sq_mask]
+        ctypes.memset(ctypes.addressof(sqe), 0, 64)
+        sqe.opcode    = opcode
+        sqe.fd        = fd
+        sqe.user_data = user_data
+        self._tail   += 1
+        return sqe
+
+    def __token(self, entry):
+        token = self._next_id
+        self._next_id = token + 1 if token < 0xffffffffffff else 1
+        self._inflight[token] = entry
+        return token
+
+    def __poll_add(self, rec, direction):
+        token    = self.__token((rec, direction))
+        sqe      = self.__sqe(_OP_POLL_ADD, rec.fd, token)
+        sqe.op_flags = _POLLIN if direction == READABLE else _POLLOUT
+        rec.armed    = (rec.armed or 0) | direction
+
+    def _submit(self, opcode, fd, task, keep=None, addr=0, length=0, off=0, op_flags=0):
+        comp = Completion(task, keep, self)
+        comp.token = self.__token(comp)
+        sqe  = self.__sqe(opcode, fd, comp.token)
+        sqe.addr     = addr
+        sqe.len      = length
+        sqe.off      = off & 0xffffffffffffffff
+        sqe.op_flags = op_flags
+        self._waiting += 1
+        try:
+            task._parked = comp
+        except AttributeError:
+            pass
+        return comp
+
+    def _cancel(self, comp):
+        sqe = self.__sqe(_OP_ASYNC_CANCEL, -1, 0)
+        sqe.addr = comp.token           # cancel by user_data
+        self.__flush()
+
+    ''' readiness api, one shot POLL_ADD per parked direction '''
+
+    def register_reader(self, fd, task):
+        rec = self._record(fd)
+        self._set_reader(rec, task)
+        if not (rec.armed or 0) & READABLE:
+            self.__poll_add(rec, READABLE)
+
+    def register_writter(self, fd, task):
+        rec = self._record(fd)
+        self._set_writer(rec, task)
+        if not (rec.armed or 0) & WRITABLE:
+            self.__poll_add(rec, WRITABLE)
+
+    def remove_waiters(self, fd):
+        fileno = _fileno(fd)
+        rec    = self._records.get(fileno)
+        if rec is None:
+            raise Exception("File descriptor not available")
+        self._drop(rec)
+
+        # cancel everything still queued against the fd, polls and transfers alike
+        sqe = self.__sqe(_OP_ASYNC_CANCEL, fileno, 0)
+        sqe.op_flags = _CANCEL_FD | _CANCEL_ALL
+
+    def discard(self, fd):
+        fileno = _fileno(fd)
+        if fileno in self._records:
+            super().discard(fd)
+        else:
+            sqe = self.__sqe(_OP_ASYNC_CANCEL, fileno, 0)
+            sqe.op_flags = _CANCEL_FD | _CANCEL_ALL
+
+        # the cancel matches by open file, it has to reach the kernel while the
+        # descriptor still resolves; an in flight transfer keeps the file alive
+        # past close() and would otherwise never complete
+        self.__flush()
+
+    ''' completion api, used by the coroutines below '''
+
+    def prep_accept(self, fd, task, flags=0):
+        return self._submit(_OP_ACCEPT, _fileno(fd), task, op_flags=flags)
+
+    def prep_recv(self, fd, buf, nbytes, task, flags=0):
+        addr, keep = _address(buf, True)
+        return self._submit(_OP_RECV, _fileno(fd), task, keep, addr, nbytes or len(buf), op_flags=flags)
+
+    def prep_send(self, fd, data, task, flags=0):
+        addr, keep = _address(data, False)
+        return self._submit(_OP_SEND, _fileno(fd), task, keep, addr, len(data), op_flags=flags)
+
+    def prep_read(self, fd, buf, nbytes, offset, task):
+        addr, keep = _address(buf, True)
+        return self._submit(_OP_READ, _fileno(fd), task, keep, addr, nbytes or len(buf), offset)
+
+    def prep_write(self, fd, data, offset, task):
+        addr, keep = _address(data, False)
+        return self._submit(_OP_WRITE, _fileno(fd), task, keep, addr, len(data), offset)
+
+    ''' --- completion side --- '''
+
+    def __reap(self, woken):
+        # re-arming below may have to flush a full ring, which must not reap
+        # the same cqes again from inside this loop
+        self._reaping = True
+        try:
+            self.__reap_cqes(woken)
+        finally:
+            self._reaping = False
+
+    def __reap_cqes(self, woken):
+        head     = self._cq_head.value
+        tail     = self._cq_tail.value
+        cqes     = self._cqes
+        mask     = self._cq_mask
+        inflight = self._inflight
+        records  = self._records
+
+        while head != tail:
+            cqe  = cqes[head & mask]
+            head = (head + 1) & 0xffffffff
+
+            entry = inflight.pop(cqe.user_data, None)
+            if entry is None:
+                continue
+
+            if type(entry) is Completion:
+                entry.res   = cqe.res
+                entry.flags = cqe.flags
+                entry.keep  = None
+                self._waiting -= 1
+                if entry.task is not None:
+                    woken.append(entry.task)
+                continue
+
+            rec, direction = entry
+            rec.armed &= ~direction
+            self._wake(rec, direction, woken)
+            if rec.reader is not None and not rec.armed & READABLE:
+                self.__poll_add(rec, READABLE)
+            if rec.writer is not None and not rec.armed & WRITABLE:
+                self.__poll_add(rec, WRITABLE)
+            if not rec.armed and rec.reader is None and rec.writer is None and records.get(rec.fd) is rec:
+                del records[rec.fd]
+
+        self._cq_head.value = head
+
+    def __ready(self):
+        return self._cq_head.value != self._cq_tail.value
+
+    def poll(self, timeout):
+        woken = []
+        self._sq_tail.value = self._tail & 0xffffffff
+        to_submit = self.__unsubmitted()
+
+        if timeout == 0 or self.__ready():
+            if to_submit:
+                self.__enter(to_submit, 0, 0)
+
+        elif timeout is None:
+            res = self.__enter(to_submit, 1, _ENTER_GETEVENTS)
+            if res < 0:
+                self.__reap(woken)
+
+        else:
+            secs = int(timeout)
+            self._ts.tv_sec  = secs
+            self._ts.tv_nsec = int((timeout - secs) * 1e9)
+
+            if self._features & _FEAT_EXT_ARG:
+                res = self.__enter(to_submit, 1, _ENTER_GETEVENTS | _ENTER_EXT_ARG,
+                                   ctypes.byref(self._arg), ctypes.sizeof(self._arg))
+            else:
+                # older kernels: a timeout sqe that completes after one cqe or the delay
+                sqe = self.__sqe(_OP_TIMEOUT, -1, 0)
+                sqe.addr = ctypes.addressof(self._ts)
+                sqe.len  = 1
+                sqe.off  = 1
+                self._sq_tail.value = self._tail & 0xffffffff
+                to_submit = self.__unsubmitted()
+                res = self.__enter(to_submit, 1, _ENTER_GETEVENTS)
+            if res < 0:
+                self.__reap(woken)
+
+        self.__reap(woken)
+        if woken:
+            self._loop.new_tasks(woken)
+
+
+def iouring_reactor(_loop, entries=256):
+    ''' IoUringReactor when the kernel lets us create a ring, EpollReactor otherwise
+        (old kernel, seccomp filters, kernel.io_uring_disabled). Meant for
+        loop.use_reactor(iouring_reactor)
+    '''
+    try:
+        return IoUringReactor(_loop, entries)
+    except OSError:
+        return default_reactor(_loop)
+
+
+'''
+    Completion based socket and file helpers. With an IoUringReactor the job is
+    parked once and resumed with the transfer already done, with any other reactor
+    they park for readiness and perform the syscall afterwards.
+'''
+
+async def accept(sock):
+    _loop   = getloop()
+    reactor = _loop.get_reactor()
+
+    if isinstance(reactor, IoUringReactor):
+        comp = reactor.prep_accept(sock, _loop.get_current())
+        _loop.set_current(None)
+        await kernel_switch()
+        fd   = comp.result()
+        conn = sock.__class__(sock.family, sock.type, sock.proto, fileno=fd)
+        return conn, conn.getpeername()
+
+    _loop.read_wait(sock, _loop.get_current())
+    _loop.set_current(None)
+    await kernel_switch()
+    return sock.accept()
+
+async def recv_into(sock, buf, nbytes=0, flags=0):
+    _loop   = getloop()
+    reactor = _loop.get_reactor()
+
+    if isinstance(reactor, IoUringReactor):
+        comp = reactor.prep_recv(sock, buf, nbytes, _loop.get_current(), flags)
+        _loop.set_current(None)
+        await kernel_switch()
+        return comp.result()
+
+    _loop.read_wait(sock, _loop.get_current())
+    _loop.set_current(None)
+    await kernel_switch()
+    return sock.recv_into(buf, nbytes, flags)
+
+async def recv(sock, max_bytes=1024, flags=0):
+    buf = bytearray(max_bytes)
+    n   = await recv_into(sock, buf, max_bytes, flags)
+    del buf[n:]
+    return bytes(buf)
+
+async def send(sock, data, flags=0):
+    _loop   = getloop()
+    reactor = _loop.get_reactor()
+
+    if isinstance(reactor, IoUringReactor):
+        comp = reactor.prep_send(sock, data, _loop.get_current(), flags)
+        _loop.set_current(None)
+        await kernel_switch()
+        return comp.result()
+
+    _loop.write_wait(sock, _loop.get_current())
+    _loop.set_current(None)
+    await kernel_switch()
+    return sock.send(data, flags)
+
+async def read(fd, nbytes, offset=-1):
+    ''' Read from a file descriptor, offset -1 uses and advances the file position '''
+    _loop   = getloop()
+    reactor = _loop.get_reactor()
+
+    if isinstance(reactor, IoUringReactor):
+        buf  = bytearray(nbytes)
+        comp = reactor.prep_read(fd, buf, nbytes, offset, _loop.get_current())
+        _loop.set_current(None)
+        await kernel_switch()
+        del buf[comp.result():]
+        return bytes(buf)
+
+    fd = _fileno(fd)
+    return os.read(fd, nbytes) if offset < 0 else os.pread(fd, nbytes, offset)
+
+async def write(fd, data, offset=-1):
+    _loop   = getloop()
+    reactor = _loop.get_reactor()
+
+    if isinstance(reactor, IoUringReactor):
+        comp = reactor.prep_write(fd, data, offset, _loop.get_current())
+        _loop.set_current(None)
+        await kernel_switch()
+        return comp.result()
+
+    fd = _fileno(fd)
+    return os.write(fd, data) if offset < 0 else os.pwrite(fd, data, offset)
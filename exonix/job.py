@@ -1,36 +1,106 @@
-from .promise import Promise
+from .promise import Promise,CancelledError,PENDING,FINISHED,FAILED
+from . import promise as _promise
 
 ''' Represents a wrapped coroutine with the helps of future retains the result of a function 
     that returns the value in a asyncronouse envirnonment when scheduled in a executors 
     eventLoop
 '''
 class Job(Promise):
-    
-    def __init__(self,coro) -> None:
-        super().__init__()
-        self.__coro = coro  
+    __slots__ = ('_coro','_parked','_cancel')
+
+    # read by the scheduling policies, plain jobs share these class level
+    # defaults and only ScheduledJob carries its own values
+    priority  =  0
+    deadline  =  None
+    group     =  None
+
+    def __init__(self,coro,loop=None) -> None:
+        # Promise.__init__ inlined, spawning is on the hot path
+        self._value    =  None
+        self._state    =  PENDING
+        self._waiters  =  None
+        self._loop     =  loop if loop is not None else _promise._getloop()
+        self._coro     =  coro
+        self._parked   =  None      # what the job last parked on, see cancel()
+        self._cancel   =  None      # CancelledError to throw in on the next step
 
     def inner_val_unsafe(self):
-        return self._Promise__value
+        return self._value
     
     def __repr__(self):
-        if self._Promise__state == self.State.PENDING or self._Promise__state == self.State.CANCELLED:
-            return f"<Job {self._Promise__state}>"
-        else:
-            return f"<Job {self._Promise__state}> value={self._Promise__value}"
+        name = getattr(self._coro,'__qualname__',None) or type(self._coro).__name__
+        if self._state == FINISHED:
+            return f"<Job FINISHED {name}> value={self._value}"
+        if self._state == FAILED:
+            return f"<Job FAILED {name}> exception={self._value!r}"
+        return f"<Job {'PENDING' if self._state == PENDING else 'CANCELLED'} {name}>"
 
     def __call__(self):
+        loop = self._loop
+        loop._current = self
         try:
-            self._Promise__executor.set_current(self)
-            self.__coro.send(None)
-
-            if self._Promise__executor.get_current():
-                self._Promise__executor.new_task(self)
-        
+            if self._cancel is None:
+                self._coro.send(None)
+            else:
+                exc, self._cancel = self._cancel, None
+                self._coro.throw(exc)
         except StopIteration as e:
-            self._Promise__state = self.State.FINISHED
-            self._Promise__done  = True
             self.set_value(e.value)
+            return
+        except CancelledError as e:
+            loop._current = None
+            self._cancelled(e)
+            return
+        except Exception as e:
+            # the job fails, whoever awaits it gets the exception; nobody
+            # waiting yet means it may never be looked at, so the loop reports it
+            loop._current = None
+            if self._waiters is None:
+                loop.report_exception(self,e)
+            self.set_exception(e)
+            return
+
+        if loop._current is not None:
+            loop._ready.append(self)
+        elif self._cancel is not None:
+            # cancelled itself while running, it just parked somewhere
+            self.__wake_cancelled()
+
+    def cancel(self,msg=None):
+        ''' Throw CancelledError into the coroutine at the point where it waits.
+            A job parked on a promise, a timer, a socket or an io_uring operation
+            is taken off it in O(1) and scheduled right away; a job that is ready
+            or running gets the error on its next step. The coroutine may catch
+            it to clean up, awaiting the job afterwards raises it
+        '''
+        if self._state != PENDING or self._cancel is not None:
+            return False
+        self._cancel = CancelledError(msg) if msg is not None else CancelledError()
+        if self._loop._current is not self:
+            self.__wake_cancelled()
+        return True
+
+    def __wake_cancelled(self):
+        parked = self._parked
+        if parked is None or not parked._unpark(self):
+            return                      # already ready, it sees _cancel when it runs
+        self._parked = None
+
+        loop = self._loop
+        if loop is _promise._getloop():
+            loop._ready.append(self)
+        else:
+            loop.call_soon_threadsafe(self)
         
 
-__all__ = ['Job']
\ No newline at end of file
+class ScheduledJob(Job):
+    __slots__ = ('priority','deadline','group')
+
+    def __init__(self,coro,loop=None,priority=0,deadline=None,group=None) -> None:
+        super().__init__(coro,loop)
+        self.priority  =  priority
+        self.deadline  =  deadline      # absolute, time.monotonic() based
+        self.group     =  group
+
+
+__all__ = ['Job','ScheduledJob']
@@ -1,7 +1,17 @@
-class Kernel_Pause:    
+_SWITCH = (None,)
+
+class Kernel_Pause:
+    ''' Yields control back to the event loop exactly once. Stateless, so a single
+        instance is shared by every await and iterating a one element tuple is
+        cheaper than building a generator per switch
+    '''
+    __slots__ = ()
+
     def __await__(self):
-        yield
+        return iter(_SWITCH)
+
 
+_PAUSE = Kernel_Pause()
 
 def kernel_switch():
-    return Kernel_Pause()
+    return _PAUSE
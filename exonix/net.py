@@ -0,0 +1,266 @@
+'''
+    Non-blocking sockets on top of the TaskExecutor.
+
+    Every operation tries the syscall first and only parks the current Job in the
+    reactor when the kernel answers EAGAIN, so data that is already buffered (or
+    buffer space that is already free) costs no trip through the loop. On a
+    completion reactor (io_uring) the parked case hands the transfer itself to the
+    kernel instead of waiting for readiness and retrying.
+'''
+
+import errno
+import os
+import socket
+import traceback
+
+from .executor import getloop
+from .kernel import kernel_switch
+
+
+_WOULD_BLOCK = (BlockingIOError, InterruptedError)
+
+
+class AsyncSocket:
+    def __init__(self,sock,loop=None) -> None:
+        sock.setblocking(False)
+        self._sock  =  sock
+        self._loop  =  loop if loop is not None else getloop()
+
+    def __repr__(self) -> str:
+        return f"<AsyncSocket {self._sock!r}>"
+
+    @property
+    def sock(self):
+        return self._sock
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def getpeername(self):
+        return self._sock.getpeername()
+
+    def getsockname(self):
+        return self._sock.getsockname()
+
+    def setsockopt(self,*args):
+        return self._sock.setsockopt(*args)
+
+    async def _wait_readable(self):
+        loop = self._loop
+        loop.read_wait(self._sock,loop._current)
+        loop._current = None
+        await kernel_switch()
+
+    async def _wait_writable(self):
+        loop = self._loop
+        loop.write_wait(self._sock,loop._current)
+        loop._current = None
+        await kernel_switch()
+
+    async def accept(self):
+        sock = self._sock
+        while True:
+            try:
+                conn,addr = sock.accept()
+                return AsyncSocket(conn,self._loop),addr
+            except _WOULD_BLOCK:
+                pass
+
+            loop    = self._loop
+            reactor = loop.get_reactor()
+            if reactor.completions:
+                comp = reactor.prep_accept(sock,loop._current)
+                loop._current = None
+                await kernel_switch()
+                conn = socket.socket(sock.family,sock.type,sock.proto,fileno=comp.result())
+                return AsyncSocket(conn,loop),conn.getpeername()
+
+            await self._wait_readable()
+
+    async def connect(self,address):
+        err = self._sock.connect_ex(address)
+        if err == 0:
+            return
+        if err not in (errno.EINPROGRESS,errno.EWOULDBLOCK,errno.EAGAIN,errno.EINTR):
+            raise OSError(err,f"connect to {address}: {errno.errorcode.get(err,err)}")
+
+        await self._wait_writable()
+        err = self._sock.getsockopt(socket.SOL_SOCKET,socket.SO_ERROR)
+        if err:
+            raise OSError(err,f"connect to {address}: {errno.errorcode.get(err,err)}")
+
+    async def recv_into(self,buf,nbytes=0,flags=0):
+        sock = self._sock
+        while True:
+            try:
+                return sock.recv_into(buf,nbytes,flags)
+            except _WOULD_BLOCK:
+                pass
+
+            loop    = self._loop
+            reactor = loop.get_reactor()
+            if reactor.completions:
+                comp = reactor.prep_recv(sock,buf,nbytes,loop._current,flags)
+                loop._current = None
+                await kernel_switch()
+                return comp.result()
+
+            await self._wait_readable()
+
+    async def recv(self,max_bytes=65536,flags=0):
+        sock = self._sock
+        while True:
+            try:
+                return sock.recv(max_bytes,flags)
+            except _WOULD_BLOCK:
+                pass
+
+            if self._loop.get_reactor().completions:
+                buf = bytearray(max_bytes)
+                del buf[await self.recv_into(buf,max_bytes,flags):]
+                return bytes(buf)
+
+            await self._wait_readable()
+
+    async def send(self,data,flags=0):
+        ''' Send as much of data as the kernel takes, returns the byte count '''
+        sock = self._sock
+        while True:
+            try:
+                return sock.send(data,flags)
+            except _WOULD_BLOCK:
+                pass
+
+            loop    = self._loop
+            reactor = loop.get_reactor()
+            if reactor.completions:
+                comp = reactor.prep_send(sock,data,loop._current,flags)
+                loop._current = None
+                await kernel_switch()
+                return comp.result()
+
+            await self._wait_writable()
+
+    async def sendall(self,data,flags=0):
+        view = memoryview(data)
+        while view:
+            sent = await self.send(view,flags)
+            view = view[sent:]
+
+    async def sendfile(self,file,offset=0,count=None):
+        ''' Send count bytes of file (a file object or descriptor) from offset,
+            up to its end when count is None, with os.sendfile: the data goes
+            from the page cache to the socket without passing through Python.
+            Returns the byte count sent, short only if the file is shorter
+        '''
+        fd   = file if isinstance(file,int) else file.fileno()
+        out  = self._sock.fileno()
+        if count is None:
+            count = os.fstat(fd).st_size - offset
+        sent = 0
+        while sent < count:
+            try:
+                n = os.sendfile(out,fd,offset + sent,count - sent)
+            except _WOULD_BLOCK:
+                await self._wait_writable()
+                continue
+            if not n:
+                break                   # end of file came early, it was truncated
+            sent += n
+        return sent
+
+    def shutdown(self,how=socket.SHUT_WR):
+        self._sock.shutdown(how)
+
+    def close(self):
+        sock = self._sock
+        if sock.fileno() >= 0:
+            self._loop.discard_fd(sock)
+            sock.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc):
+        self.close()
+
+
+'''
+    Accept loop that runs handler(conn) as its own Job for every client and closes
+    the connection when the handler returns.
+'''
+class TcpServer:
+    def __init__(self,handler,host='127.0.0.1',port=0,backlog=socket.SOMAXCONN,
+                 reuse_port=False,sock=None,loop=None) -> None:
+        if sock is None:
+            sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET,socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEPORT,1)
+            sock.bind((host,port))
+            sock.listen(backlog)
+
+        self._loop      =  loop if loop is not None else getloop()
+        self._listener  =  AsyncSocket(sock,self._loop)
+        self._handler   =  handler
+        self._serving   =  False
+        self.accepted   =  0
+        self.active     =  0
+
+    def __repr__(self) -> str:
+        return f"<TcpServer {self.address} active={self.active}>"
+
+    @property
+    def address(self):
+        return self._listener.getsockname()
+
+    async def serve_forever(self):
+        listener = self._listener
+        loop     = self._loop
+        self._serving = True
+
+        while self._serving:
+            try:
+                conn,_ = await listener.accept()
+            except OSError:
+                if not self._serving:
+                    break
+                raise
+
+            self.accepted += 1
+            loop.new_task(self.__client(conn))
+
+    async def __client(self,conn):
+        self.active += 1
+        try:
+            await self._handler(conn)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.active -= 1
+            conn.close()
+
+    def close(self):
+        ''' Stop accepting, connections already handed out keep running '''
+        self._serving = False
+        self._listener.close()
+
+
+async def open_connection(host,port,loop=None):
+    ''' Connected AsyncSocket to host:port. Name resolution is a blocking
+        getaddrinfo, pass numeric addresses on latency sensitive paths
+    '''
+    error = None
+    for family,type_,proto,_,address in socket.getaddrinfo(host,port,type=socket.SOCK_STREAM):
+        conn = AsyncSocket(socket.socket(family,type_,proto),loop)
+        try:
+            await conn.connect(address)
+            return conn
+        except OSError as e:
+            conn.close()
+            error = e
+
+    raise error if error is not None else OSError(f"could not resolve {host}:{port}")
+
+
+__all__ = ['AsyncSocket','TcpServer','open_connection']
@@ -0,0 +1,133 @@
+'''
+    Offloading blocking and CPU bound calls out of the loop.
+
+    run_in_thread/run_in_process hand fn(*args) to a concurrent.futures pool and
+    return a Promise right away. The pool signals completion through
+    call_soon_threadsafe, i.e. one eventfd write that wakes the loop out of its
+    poll, and the Promise is settled on the loop thread.
+
+    With batch_size > 1 the calls made during one turn of the loop are shipped
+    to the pool as a single work item (split every batch_size calls). For a
+    process pool that is one pickle round trip instead of one per call, which is
+    what dominates for small functions.
+'''
+
+import concurrent.futures
+
+from .promise import Promise
+
+
+def _run_batch(calls):
+    ''' Executed in the pool: run every call, never raise past one of them '''
+    results = []
+    for fn,args,kwargs in calls:
+        try:
+            results.append((True,fn(*args,**kwargs)))
+        except Exception as e:
+            results.append((False,e))
+    return results
+
+
+'''
+    One kind of pool plus its pending batch. The pool itself is created on first
+    use so a loop that never offloads never starts a thread or a process.
+'''
+class _Lane:
+    def __init__(self,loop,factory,max_workers,batch_size) -> None:
+        self._loop        =  loop
+        self._factory     =  factory
+        self._max_workers =  max_workers
+        self._batch_size  =  batch_size
+        self._pool        =  None
+        self._batch       =  []         # (fn,args,kwargs,promise) waiting for the flush
+        self._flush_cb    =  self.flush
+
+    def pool(self):
+        if self._pool is None:
+            self._pool = self._factory(max_workers=self._max_workers)
+        return self._pool
+
+    def submit(self,fn,args,kwargs):
+        loop    = self._loop
+        promise = Promise(loop)
+        loop._keepalive += 1
+
+        if self._batch_size <= 1:
+            future = self.pool().submit(fn,*args,**kwargs)
+            future.add_done_callback(lambda f: loop.call_soon_threadsafe(_settle_one,loop,promise,f))
+            return promise
+
+        if not self._batch:
+            loop._ready.append(self._flush_cb)      # ships whatever was batched this turn
+        self._batch.append((fn,args,kwargs,promise))
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+        return promise
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        loop     = self._loop
+        promises = [entry[3] for entry in batch]
+        future   = self.pool().submit(_run_batch,[entry[:3] for entry in batch])
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(_settle_batch,loop,promises,f))
+
+    def shutdown(self,wait=True):
+        self.flush()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+def _settle_one(loop,promise,future):
+    loop._keepalive -= 1
+    try:
+        promise.set_value(future.result())
+    except Exception as e:
+        promise.set_exception(e)
+
+
+def _settle_batch(loop,promises,future):
+    loop._keepalive -= len(promises)
+    try:
+        results = future.result()
+    except Exception as e:                       # the batch never ran, e.g. broken pool
+        for promise in promises:
+            promise.set_exception(e)
+        return
+
+    for promise,(ok,value) in zip(promises,results):
+        if ok:
+            promise.set_value(value)
+        else:
+            promise.set_exception(value)
+
+
+class Offloader:
+    def __init__(self,loop,threads=None,processes=None,batch_size=1,process_batch_size=None) -> None:
+        '''
+            threads / processes   pool sizes, None lets concurrent.futures decide
+            batch_size            calls per work item for the thread pool
+            process_batch_size    same for the process pool, defaults to batch_size
+        '''
+        if process_batch_size is None:
+            process_batch_size = batch_size
+
+        self._threads    =  _Lane(loop,concurrent.futures.ThreadPoolExecutor,threads,batch_size)
+        self._processes  =  _Lane(loop,concurrent.futures.ProcessPoolExecutor,processes,process_batch_size)
+
+    def run_in_thread(self,fn,*args,**kwargs):
+        return self._threads.submit(fn,args,kwargs)
+
+    def run_in_process(self,fn,*args,**kwargs):
+        ''' fn, its arguments and its result must be picklable '''
+        return self._processes.submit(fn,args,kwargs)
+
+    def shutdown(self,wait=True):
+        self._threads.shutdown(wait)
+        self._processes.shutdown(wait)
+
+
+__all__ = ['Offloader']
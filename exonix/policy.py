@@ -0,0 +1,200 @@
+'''
+    Scheduling policies.
+
+    A policy is the loop's ready queue: TaskExecutor._ready is whatever object
+    the policy is, and everything that makes a job runnable (Job re-queueing
+    itself, Promise waking its waiters, the reactor, the timers) only calls
+    append/extend on it while the loop calls popleft. That keeps the FIFO default
+    a bare deque with no indirection at all; the other policies pay only for the
+    ordering they add.
+
+        FifoPolicy           strict FIFO, the default (a deque)
+        PriorityPolicy       higher Job.priority first, FIFO within a priority
+        DeadlinePolicy       earliest Job.deadline first, jobs without a deadline
+                             after them in FIFO order
+        WeightedFairPolicy   stride scheduling across Job.group: every group gets
+                             turns in proportion to its weight, FIFO inside a group
+
+    Jobs get their scheduling attributes from TaskExecutor.schedule(); plain jobs
+    and callbacks count as priority 0, no deadline and the default group.
+'''
+
+import heapq
+import itertools
+from abc import ABC,abstractmethod
+from collections import deque
+
+
+class SchedulingPolicy(ABC):
+    ''' The subset of the deque interface the loop relies on '''
+
+    @abstractmethod
+    def append(self,job):
+        pass
+
+    def extend(self,jobs):
+        for job in jobs:
+            self.append(job)
+
+    @abstractmethod
+    def popleft(self):
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class FifoPolicy(deque):
+    ''' The default ready queue, named so it can be passed to use_policy '''
+    __slots__ = ()
+
+
+class PriorityPolicy(SchedulingPolicy):
+    def __init__(self) -> None:
+        self._levels  =  {}           # priority -> deque
+        self._order   =  []           # heap of -priority for non empty levels
+        self._len     =  0
+
+    def append(self,job):
+        prio  = getattr(job,'priority',0)
+        level = self._levels.get(prio)
+        if level is None:
+            level = self._levels[prio] = deque()
+        if not level:
+            heapq.heappush(self._order,-prio)
+        level.append(job)
+        self._len += 1
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty policy")
+        prio  = -self._order[0]
+        level = self._levels[prio]
+        job   = level.popleft()
+        if not level:
+            heapq.heappop(self._order)
+        self._len -= 1
+        return job
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def clear(self):
+        self._levels.clear()
+        self._order.clear()
+        self._len = 0
+
+
+class DeadlinePolicy(SchedulingPolicy):
+    def __init__(self) -> None:
+        self._heap    =  []           # (deadline, seq, job)
+        self._rest    =  deque()      # jobs without a deadline
+        self._seq     =  itertools.count()
+
+    def append(self,job):
+        deadline = getattr(job,'deadline',None)
+        if deadline is None:
+            self._rest.append(job)
+        else:
+            heapq.heappush(self._heap,(deadline,next(self._seq),job))
+
+    def popleft(self):
+        if self._heap:
+            return heapq.heappop(self._heap)[2]
+        return self._rest.popleft()
+
+    def __len__(self):
+        return len(self._heap) + len(self._rest)
+
+    def __bool__(self):
+        return bool(self._heap or self._rest)
+
+    def clear(self):
+        self._heap.clear()
+        self._rest.clear()
+
+
+'''
+    One group of WeightedFairPolicy. pass_ is the group's virtual time, every job
+    it runs advances it by stride = 1/weight, the group with the smallest pass_
+    runs next.
+'''
+class _Group:
+    __slots__ = ('name','jobs','stride','pass_')
+
+    def __init__(self,name,weight) -> None:
+        self.name    =  name
+        self.jobs    =  deque()
+        self.stride  =  1.0 / weight
+        self.pass_   =  0.0
+
+
+class WeightedFairPolicy(SchedulingPolicy):
+    def __init__(self,weights=None,default_weight=1) -> None:
+        self._weights  =  dict(weights or {})
+        self._default  =  default_weight
+        self._groups   =  {}          # name -> _Group
+        self._active   =  []          # heap of (pass_, seq, group) for non empty groups
+        self._seq      =  itertools.count()
+        self._vtime    =  0.0         # pass_ of the group served last
+        self._len      =  0
+
+    def set_weight(self,group,weight):
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        self._weights[group] = weight
+        if group in self._groups:
+            self._groups[group].stride = 1.0 / weight
+
+    def append(self,job):
+        name  = getattr(job,'group',None)
+        group = self._groups.get(name)
+        if group is None:
+            group = self._groups[name] = _Group(name,self._weights.get(name,self._default))
+
+        if not group.jobs:
+            # an idle group rejoins at the current virtual time, it cannot bank
+            # the turns it did not use while it had nothing to run
+            if group.pass_ < self._vtime:
+                group.pass_ = self._vtime
+            heapq.heappush(self._active,(group.pass_,next(self._seq),group))
+        group.jobs.append(job)
+        self._len += 1
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty policy")
+        _,_,group = heapq.heappop(self._active)
+        job = group.jobs.popleft()
+        self._vtime  = group.pass_
+        group.pass_ += group.stride
+        if group.jobs:
+            heapq.heappush(self._active,(group.pass_,next(self._seq),group))
+        self._len -= 1
+        return job
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def clear(self):
+        for group in self._groups.values():
+            group.jobs.clear()
+        self._active.clear()
+        self._len = 0
+
+
+__all__ = ['SchedulingPolicy','FifoPolicy','PriorityPolicy','DeadlinePolicy','WeightedFairPolicy']
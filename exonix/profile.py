@@ -0,0 +1,309 @@
+'''
+    Job level profiling, off unless a Profiler is started.
+
+    cProfile attributes everything to run_default_policy, which called every
+    job. Profiler looks at the loop per job instead:
+
+        tracer   Job.__call__ is wrapped while the profiler runs. Every step
+                 records the CPU time it took and the frame the coroutine was
+                 suspended at, i.e. where that resume started. Per coroutine
+                 function you get jobs, resumes, CPU time and the resume site
+                 that cost the most. Steps slower than `slow` are kept with their
+                 site, like warn_slow_jobs but with the line that holds the loop
+        sampler  SIGPROF every `interval` seconds of CPU time. The interrupted
+                 stack is cut at the job step and filed under the running job's
+                 coroutine name. Samples taken outside any job (polling,
+                 timers) go under [loop]
+
+        profiler = Profiler(interval=0.001,slow=0.01)
+        with profiler:
+            loop.run_default_policy()
+        print(profiler.table(20))
+        profiler.write_collapsed('exonix.folded')      # flamegraph.pl / speedscope
+
+    Only one Profiler runs at a time. Signals reach the main thread only, so the
+    sampler has to be started there and sees the loop of that thread; the
+    tracer counts jobs of every thread.
+'''
+
+import heapq
+import os
+import signal
+import threading
+import time
+from collections import Counter
+
+from .job import Job
+from .promise import PENDING
+
+
+_job_call    =  Job.__call__        # the plain step, restored by stop()
+_active      =  None                # the running Profiler
+_PACKAGE     =  os.path.dirname(os.path.abspath(__file__))
+_MAX_DEPTH   =  128
+_SLOWEST     =  100                 # slow steps kept, the longest ones win
+
+
+def _name(coro):
+    return getattr(coro,'__qualname__',None) or type(coro).__name__
+
+def _qualname(code):
+    # co_qualname is new in Python 3.11, older code objects only know co_name
+    return getattr(code,'co_qualname',code.co_name)
+
+def _where(frame):
+    code = frame.f_code
+    return f"{_qualname(code)} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _resume_site(coro):
+    ''' Where a coroutine is suspended: the innermost frame of its await chain
+        outside exonix itself, so `await lock.acquire()` reports the caller's
+        line rather than the inside of Lock
+    '''
+    frame = getattr(coro,'cr_frame',None) or getattr(coro,'gi_frame',None)
+    if frame is None:
+        return '<native>'
+    if frame.f_lasti <= 0:             # not started yet, -1 from 3.12 on
+        return '<start>'
+
+    site  = frame
+    inner = getattr(coro,'cr_await',None) or getattr(coro,'gi_yieldfrom',None)
+    while inner is not None:
+        frame = getattr(inner,'cr_frame',None) or getattr(inner,'gi_frame',None)
+        if frame is None:
+            break
+        if not frame.f_code.co_filename.startswith(_PACKAGE):
+            site = frame
+        inner = getattr(inner,'cr_await',None) or getattr(inner,'gi_yieldfrom',None)
+    return _where(site)
+
+
+def _profiled_call(job):
+    ''' Job.__call__ while a Profiler is running '''
+    profiler = _active
+    coro     = job._coro
+    site     = _resume_site(coro)
+    running  = profiler._running
+    ident    = threading.get_ident()
+    running[ident] = job
+    cpu      = time.thread_time()
+    wall     = time.perf_counter()
+    try:
+        _job_call(job)
+    finally:
+        wall = time.perf_counter() - wall
+        cpu  = time.thread_time() - cpu
+        running.pop(ident,None)
+        profiler._record(job,coro,site,cpu,wall)
+
+_STEP_CODE = _profiled_call.__code__
+_CALL_CODE = _job_call.__code__
+
+
+'''
+    Per coroutine function totals, jobs are folded in once they finish
+'''
+class _Entry:
+    __slots__ = ('jobs','resumes','cpu','wall','max_step','max_job','samples','sites')
+
+    def __init__(self) -> None:
+        self.jobs      =  0
+        self.resumes   =  0
+        self.cpu       =  0.0
+        self.wall      =  0.0
+        self.max_step  =  0.0         # longest single step, wall seconds
+        self.max_job   =  0.0         # most CPU one job used over its life
+        self.samples   =  0
+        self.sites     =  Counter()   # resume site -> CPU seconds spent from there
+
+
+class Profiler:
+    def __init__(self,interval=0.001,sample=True,slow=None) -> None:
+        self.interval   =  interval
+        self.sample     =  sample
+        self.slow       =  slow           # seconds, steps at least this long are kept
+        self._entries   =  {}             # coroutine name -> _Entry
+        self._live      =  {}             # job -> [cpu so far, name]
+        self._slowest   =  []             # min heap of (wall, cpu, name, site)
+        self._stacks    =  Counter()      # collapsed stack -> samples
+        self._labels    =  {}             # code -> frame label, see __label
+        self._running   =  {}             # thread ident -> job in its step
+        self._lock      =  threading.Lock()
+        self._handler   =  None           # signal handler replaced by the sampler
+
+    def __repr__(self) -> str:
+        state = "running" if _active is self else "stopped"
+        return f"<Profiler {state} functions={len(self._entries)} samples={sum(self._stacks.values())}>"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        self.stop()
+        return False
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise Exception("another Profiler is already running")
+        if self.sample:
+            if not hasattr(signal,'setitimer'):
+                raise Exception("the sampler needs signal.setitimer, use Profiler(sample=False)")
+            if threading.current_thread() is not threading.main_thread():
+                raise Exception("the sampler can only be started from the main thread")
+            self._handler = signal.signal(signal.SIGPROF,self.__on_sample)
+            signal.setitimer(signal.ITIMER_PROF,self.interval,self.interval)
+
+        _active       = self
+        Job.__call__  = _profiled_call
+
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        Job.__call__ = _job_call
+        _active      = None
+        if self.sample:
+            signal.setitimer(signal.ITIMER_PROF,0,0)
+            signal.signal(signal.SIGPROF,self._handler or signal.SIG_DFL)
+            self._handler = None
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._live.clear()
+            self._slowest.clear()
+            self._stacks.clear()
+
+    ''' tracer '''
+
+    def _record(self,job,coro,site,cpu,wall):
+        with self._lock:
+            live = self._live.get(job)
+            if live is None:
+                live = self._live[job] = [0.0,_name(coro)]
+            live[0] += cpu
+
+            entry = self._entries.get(live[1])
+            if entry is None:
+                entry = self._entries[live[1]] = _Entry()
+            entry.resumes     += 1
+            entry.cpu         += cpu
+            entry.wall        += wall
+            entry.sites[site] += cpu
+            if wall > entry.max_step:
+                entry.max_step = wall
+
+            if job._state != PENDING:
+                del self._live[job]
+                self.__fold(entry,live[0])
+
+            if self.slow is not None and wall >= self.slow:
+                step = (wall,cpu,live[1],site)
+                if len(self._slowest) < _SLOWEST:
+                    heapq.heappush(self._slowest,step)
+                else:
+                    heapq.heappushpop(self._slowest,step)
+
+    def __fold(self,entry,cpu):
+        entry.jobs += 1
+        if cpu > entry.max_job:
+            entry.max_job = cpu
+
+    ''' sampler '''
+
+    def __label(self,code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (f"{_qualname(code)} "
+                                          f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        return label
+
+    def __on_sample(self,signum,frame):
+        job   = self._running.get(threading.main_thread().ident)
+        stack = []
+        root  = '[other]'                   # sampled outside any loop
+        while frame is not None and len(stack) < _MAX_DEPTH:
+            code = frame.f_code
+            if code is _STEP_CODE:
+                # inside a job step, or in the tracer's own bookkeeping around it
+                root = _name(job._coro) if job is not None else '[profiler]'
+                break
+            if code.co_name == 'run_default_policy':
+                root = '[loop]'
+                break
+            if code is not _CALL_CODE:
+                stack.append(self.__label(code))
+            frame = frame.f_back
+
+        if job is not None:
+            entry = self._entries.get(root)
+            if entry is not None:
+                entry.samples += 1
+        stack.append(root)
+        stack.reverse()
+        self._stacks[';'.join(stack)] += 1
+
+    ''' reports '''
+
+    def collapsed(self):
+        ''' Samples in collapsed stack format, one `root;caller;callee count` line
+            per distinct stack, as read by flamegraph.pl, inferno and speedscope
+        '''
+        return ''.join(f"{stack} {count}\n" for stack,count in sorted(self._stacks.items()))
+
+    def write_collapsed(self,path):
+        with open(path,'w') as f:
+            f.write(self.collapsed())
+
+    def functions(self):
+        ''' Per coroutine function totals, jobs still running are counted with
+            what they used so far. Times are seconds
+        '''
+        with self._lock:
+            running = Counter()
+            for cpu,name in self._live.values():
+                running[name] += 1
+            result = {}
+            for name,entry in self._entries.items():
+                site,site_cpu = entry.sites.most_common(1)[0] if entry.sites else ('',0.0)
+                max_job = max([entry.max_job] + [cpu for cpu,n in self._live.values() if n == name])
+                result[name] = {'jobs': entry.jobs + running[name],'running': running[name],
+                                'resumes': entry.resumes,'cpu': entry.cpu,'wall': entry.wall,
+                                'cpu_per_resume': entry.cpu / entry.resumes if entry.resumes else 0.0,
+                                'max_step': entry.max_step,'max_job_cpu': max_job,
+                                'samples': entry.samples,'top_site': site,'top_site_cpu': site_cpu}
+            return result
+
+    def slowest(self,n=None):
+        ''' Steps that took at least `slow` seconds, longest first, as
+            (wall, cpu, coroutine, resume site) tuples
+        '''
+        steps = sorted(self._slowest,reverse=True)
+        return steps if n is None else steps[:n]
+
+    def table(self,n=20,sort='cpu'):
+        ''' Top n coroutine functions as a text table, sorted by one of the
+            functions() keys
+        '''
+        rows = sorted(self.functions().items(),key=lambda item: item[1][sort],reverse=True)[:n]
+        lines = [f"{'cpu ms':>10} {'resumes':>9} {'jobs':>7} {'us/resume':>10} {'max step ms':>11}"
+                 f" {'samples':>8}  function / hottest resume site"]
+        for name,row in rows:
+            lines.append(f"{row['cpu'] * 1e3:10.2f} {row['resumes']:9d} {row['jobs']:7d}"
+                         f" {row['cpu_per_resume'] * 1e6:10.1f} {row['max_step'] * 1e3:11.2f}"
+                         f" {row['samples']:8d}  {name}")
+            if row['top_site']:
+                lines.append(f"{'':>60}  ^ {row['top_site']}")
+
+        slowest = self.slowest(5)
+        if slowest:
+            lines.append("")
+            lines.append(f"slowest steps (>= {self.slow * 1e3:g} ms):")
+            for wall,cpu,name,site in slowest:
+                lines.append(f"{wall * 1e3:10.2f} ms  {name}  resumed at {site}")
+        return '\n'.join(lines)
+
+
+__all__ = ['Profiler']
@@ -1,47 +1,129 @@
-from collections import deque
-from enum import Enum, auto
+import threading
+
 from .kernel import kernel_switch
 
 
+PENDING   = 0
+FINISHED  = 1
+CANCELLED = 2
+FAILED    = 3       # finished with an exception, _value holds it
+
+
+# Set while a multi threaded runtime runs (see exonix.runtime). Meanwhile
+# parking and finishing go through _lock, and waiters are woken on the loop
+# they belong to instead of the loop the promise was created on
+_threaded = False
+_lock     = threading.Lock()
+_runtimes = 0           # runtimes currently running, the flag drops with the last
+
+def _enable_threading():
+    global _threaded,_runtimes
+    with _lock:
+        _runtimes += 1
+        _threaded  = True
+
+def _disable_threading():
+    global _threaded,_runtimes
+    with _lock:
+        _runtimes -= 1
+        _threaded  = _runtimes > 0
+
+
+class CancelledError(BaseException):
+    ''' Thrown into a cancelled job, a BaseException so `except Exception` blocks
+        in the coroutine do not swallow it
+    '''
+
+
+def _getloop():
+    # executor imports job which imports this module, so the lookup is resolved
+    # on first use and the name is rebound straight to executor.getloop
+    global _getloop
+    from .executor import getloop as _getloop
+    return _getloop()
+
+
 '''
     Promise Object helps to retain the result of any asyncronous operation 
     which tends to run in a eventloop of the executor 
 
-    ********     NOT THREAD SAFE   ********
+    Not thread safe by default, while a multi threaded runtime runs every
+    promise uses locked state transitions (see _enable_threading)
 
 '''
 class Promise:
-    class State(Enum):
-        CANCELLED = auto()
-        PENDING   = auto()
-        FINISHED  = auto()
-
-    def __init__(self) -> None:
-        from . import executor
-        self.__value      =  None
-        self.__callbacks  =  deque()
-        self.__state      =  self.State.PENDING
-        self.__done       =  False
-        self.__executor   =  executor.getloop()
+    class State:
+        PENDING   = PENDING
+        FINISHED  = FINISHED
+        CANCELLED = CANCELLED
+        FAILED    = FAILED
+
+    __slots__ = ('_value','_state','_waiters','_loop')
+
+    def __init__(self,loop=None) -> None:
+        self._value    =  None
+        self._state    =  PENDING
+        self._waiters  =  None      # nothing, a single Job, or a list once a second one parks
+        self._loop     =  loop if loop is not None else _getloop()
+
+    def _park(self,job):
+        job._parked = self
+        waiters = self._waiters
+        if waiters is None:
+            self._waiters = job
+        elif type(waiters) is list:
+            waiters.append(job)
+        else:
+            self._waiters = [waiters,job]
 
     def __await__(self):
         
         ''' This functions like a get_value in a only awiting
           the promise will yield in a result of the folowing promise '''
 
-        if self.__state == self.State.PENDING or self.__done == False:
-            self.__callbacks.append(self.__executor.get_current())
-            self.__executor.set_current(None)
-            yield
+        if self._state == PENDING:
+            if _threaded:
+                loop = _getloop()
+                if self._park_locked(loop._current):
+                    loop._current = None
+                    yield
+            else:
+                loop = self._loop
+                self._park(loop._current)
+                loop._current = None
+                yield
 
-        return self.__value
+        if self._state > FINISHED:
+            raise self._value
+        return self._value
     
     def __repr__(self) -> str:
+        if self._state == FINISHED:
+            return f"<Promise FINISHED value={self._value}>"
+        if self._state == FAILED:
+            return f"<Promise FAILED exception={self._value!r}>"
+        return f"<Promise {'PENDING' if self._state == PENDING else 'CANCELLED'}>"
 
-        if self.__state == self.State.PENDING or self.__state == self.State.CANCELLED:
-            return f"<Promise {self.__state}>"
-        else:
-            return f"<Promise {self.__state} value={self.__value}>"
+    def done(self):
+        return self._state != PENDING
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def cancel(self,msg=None):
+        ''' Finish a pending promise as cancelled, awaiting it raises CancelledError '''
+        if self._state != PENDING:
+            return False
+        self._cancelled(CancelledError(msg) if msg is not None else CancelledError())
+        return True
+
+    def _cancelled(self,exc):
+        if _threaded:
+            return self._finish_locked(CANCELLED,exc)
+
+        self._value = exc
+        self._state = CANCELLED
+        self._wake_waiters()
 
     async def get_value(self):
 
@@ -57,13 +139,21 @@ class Promise:
 
         '''
 
-        if self.__done == False:
-            self.__state = self.State.PENDING
-            self.__callbacks.append(self.__executor.get_current())
-            self.__executor.set_current(None)
-            await kernel_switch()
+        if self._state == PENDING:
+            if _threaded:
+                loop = _getloop()
+                if self._park_locked(loop._current):
+                    loop._current = None
+                    await kernel_switch()
+            else:
+                loop = self._loop
+                self._park(loop._current)
+                loop._current = None
+                await kernel_switch()
 
-        return self.__value
+        if self._state > FINISHED:
+            raise self._value
+        return self._value
     
     def set_value(self,value):
 
@@ -73,14 +163,198 @@ class Promise:
             smooth syncotrnization 
         '''
 
-        self.__value = value
-        self.__done  = True
-        self.__state = self.State.FINISHED
+        if _threaded:
+            return self._finish_locked(FINISHED,value)
+
+        self._value = value
+        self._state = FINISHED
 
         '''Wake up all the functions sleeping in the waitqueue'''
-        while self.__callbacks:
-            self.__executor.new_task(self.__callbacks.popleft())
+        waiters = self._waiters
+        if waiters is not None:
+            self._waiters = None
+            if type(waiters) is list:
+                self._wake_list(waiters)
+            elif type(waiters) is _Countdown:
+                waiters._done(self)
+            else:
+                self._loop._ready.append(waiters)
+
+    def set_exception(self,exc):
+        ''' Finish the promise with an error, awaiting it raises exc '''
+        if _threaded:
+            return self._finish_locked(FAILED,exc)
+
+        self._value = exc
+        self._state = FAILED
+        self._wake_waiters()
+
+    def exception(self):
+        return self._value if self._state == FAILED else None
+
+    def _unpark(self,job):
+        ''' Take job off the waiters again, False if it is not waiting here '''
+        if _threaded:
+            with _lock:
+                return self.__remove(job)
+        return self.__remove(job)
+
+    def __remove(self,job):
+        waiters = self._waiters
+        if waiters is job:
+            self._waiters = None
+            return True
+        if type(waiters) is list and job in waiters:
+            waiters.remove(job)
+            return True
+        return False
+
+    def _park_locked(self,job):
+        ''' Park unless another thread finished the promise meanwhile '''
+        with _lock:
+            if self._state != PENDING:
+                return False
+            self._park(job)
+            return True
+
+    def _finish_locked(self,state,value):
+        with _lock:
+            self._value = value
+            self._state = state
+            waiters, self._waiters = self._waiters, None
+
+        if waiters is None:
+            return
+        if type(waiters) is not list:
+            waiters = (waiters,)
+
+        here = _getloop()
+        for job in waiters:
+            if type(job) is _Countdown:
+                with _lock:
+                    outcome = job._record(self)
+                job._finish(self,*outcome)
+                continue
+            loop = job._loop
+            if loop is here:
+                loop._ready.append(job)
+            else:
+                loop.call_soon_threadsafe(job)
+
+    def _wake_waiters(self):
+        waiters = self._waiters
+        if waiters is not None:
+            self._waiters = None
+            if type(waiters) is list:
+                self._wake_list(waiters)
+            elif type(waiters) is _Countdown:
+                waiters._done(self)
+            else:
+                self._loop._ready.append(waiters)
+
+    def _wake_list(self,waiters):
+        ready = self._loop._ready
+        for job in waiters:
+            if type(job) is _Countdown:
+                job._done(self)
+            else:
+                ready.append(job)
+
+    def _watch(self,countdown):
+        ''' Register a _Countdown, False when the promise is already done '''
+        if _threaded:
+            with _lock:
+                return self.__watch(countdown)
+        return self.__watch(countdown)
+
+    def __watch(self,countdown):
+        if self._state != PENDING:
+            return False
+        waiters = self._waiters
+        if waiters is None:
+            self._waiters = countdown
+        elif type(waiters) is list:
+            waiters.append(countdown)
+        else:
+            self._waiters = [waiters,countdown]
+        return True
+
+
+'''
+    One waiter parked on many promises at once, the combinators in
+    exonix.combinators are built on it. Instead of being queued like a Job it is
+    told right where a promise finishes, records it and queues the job waiting
+    on it only once quorum promises are done, or at the first failure with
+    fail_fast. N promises cost N waiter slots and a single wakeup of the job.
+'''
+class _Countdown:
+    __slots__ = ('done','quorum','fail_fast','failed','on_fail','job')
+
+    def __init__(self,quorum=1,fail_fast=False,on_fail=None) -> None:
+        self.done       =  []         # finished promises in completion order
+        self.quorum     =  quorum
+        self.fail_fast  =  fail_fast
+        self.failed     =  None       # first promise that did not finish normally
+        self.on_fail    =  on_fail    # called with every such promise
+        self.job        =  None       # parked in wait()
+
+    def _done(self,promise):
+        self._finish(promise,*self._record(promise))
+
+    def _record(self,promise):
+        ''' Note a finished promise, the part that runs under _lock. Returns
+            whether on_fail is due for it and the job to wake, both left to
+            _finish once the lock is released: on_fail may cancel jobs, which
+            takes _lock again
+        '''
+        self.done.append(promise)
+        failed = promise._state > FINISHED
+        if failed and self.failed is None:
+            self.failed = promise
+
+        job = self.job
+        if job is not None and (len(self.done) >= self.quorum or (self.fail_fast and self.failed is not None)):
+            self.job = None
+        else:
+            job = None
+        return failed and self.on_fail is not None,job
+
+    def _finish(self,promise,failed,job):
+        if failed:
+            self.on_fail(promise)
+        if job is not None:
+            loop = job._loop
+            if not _threaded or loop is _getloop():
+                loop._ready.append(job)
+            else:
+                loop.call_soon_threadsafe(job)
+
+    def __satisfied(self):
+        return len(self.done) >= self.quorum or (self.fail_fast and self.failed is not None)
+
+    def _unpark(self,job):
+        if self.job is not job:
+            return False
+        self.job = None
+        return True
+
+    async def wait(self):
+        ''' Park the current job until quorum is reached '''
+        loop = _getloop()
+        if _threaded:
+            with _lock:
+                parked = not self.__satisfied()
+                if parked:
+                    self.job = loop._current
+        else:
+            parked = not self.__satisfied()
+            if parked:
+                self.job = loop._current
+
+        if parked:
+            self.job._parked = self
+            loop._current = None
+            await kernel_switch()
 
 
-__all__ = ['Promise']
-# import executor
\ No newline at end of file
+__all__ = ['Promise','CancelledError']
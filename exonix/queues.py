@@ -0,0 +1,233 @@
+'''
+    Bounded queues for producer/consumer pipelines between jobs of one loop.
+
+        Queue          FIFO, maxsize <= 0 is unbounded
+        PriorityQueue  smallest item first (heapq order)
+        LifoQueue      last in, first out
+        Channel        no buffer at all, put waits until a getter took the item
+
+    put() waits while the queue is full and get() while it is empty, which is
+    what gives a pipeline its backpressure. Items never sit in the buffer while
+    somebody is waiting for them: a put with a getter parked hands the item
+    straight to that getter, and a get that frees a slot moves the first parked
+    putter's item in, so a woken job has nothing left to do. get_many/put_many
+    move whole batches per wakeup.
+
+    Waiters are woken in FIFO order and parked on the queue, Job.cancel() takes
+    them off; an item already handed to a cancelled getter goes back to the
+    front. Not thread safe, like exonix.sync.
+'''
+
+import heapq
+from collections import deque
+
+from .kernel import kernel_switch
+from .promise import CancelledError
+from . import promise as _promise
+
+
+class QueueEmpty(Exception):
+    pass
+
+class QueueFull(Exception):
+    pass
+
+
+_EMPTY = object()       # item slot of a getter not served yet, or of a putter whose item was taken
+
+def _wake(job):
+    job._loop._ready.append(job)
+
+
+class Queue:
+    __slots__ = ('_items','_capacity','_getters','_putters')
+
+    def __init__(self,maxsize=0) -> None:
+        self._items     =  self._init()
+        self._capacity  =  maxsize if maxsize > 0 else None
+        self._getters   =  deque()      # [job, item] of jobs waiting in get
+        self._putters   =  deque()      # [job, item] of jobs waiting in put
+
+    def __repr__(self) -> str:
+        return (f"<{type(self).__name__} size={len(self._items)} maxsize={self.maxsize}"
+                f" getters={len(self._getters)} putters={len(self._putters)}>")
+
+    ''' storage, overridden by the other orders '''
+
+    def _init(self):
+        return deque()
+
+    def _put(self,item):
+        self._items.append(item)
+
+    def _get(self):
+        return self._items.popleft()
+
+    def _requeue(self,item):
+        ''' Put back an item a cancelled getter was handed, it goes out next '''
+        self._items.appendleft(item)
+
+    @property
+    def maxsize(self):
+        return self._capacity or 0
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return self._capacity is not None and len(self._items) >= self._capacity
+
+    ''' put side '''
+
+    def put_nowait(self,item):
+        if self._getters:               # the buffer is empty while getters wait
+            entry    = self._getters.popleft()
+            entry[1] = item
+            _wake(entry[0])
+            return
+        if self._capacity is not None and len(self._items) >= self._capacity:
+            raise QueueFull
+        self._put(item)
+
+    async def put(self,item):
+        if self._getters or self._capacity is None or len(self._items) < self._capacity:
+            return self.put_nowait(item)
+
+        loop  = _promise._getloop()
+        job   = loop._current
+        entry = [job,item]
+        self._putters.append(entry)
+        job._parked   = self
+        loop._current = None
+        try:
+            await kernel_switch()       # woken once a getter took the item
+        except CancelledError:
+            # after the handoff (entry[1] is _EMPTY) the item stays delivered,
+            # the cancel still propagates so the job does not outlive it
+            if entry[1] is not _EMPTY and entry in self._putters:
+                self._putters.remove(entry)
+            raise
+
+    async def put_many(self,items):
+        for item in items:
+            if self._getters or self._capacity is None or len(self._items) < self._capacity:
+                self.put_nowait(item)
+            else:
+                await self.put(item)
+
+    ''' get side '''
+
+    def get_nowait(self):
+        if self._items:
+            item = self._get()
+            if self._putters and len(self._items) < self._capacity:
+                entry = self._putters.popleft()
+                self._put(entry[1])
+                entry[1] = _EMPTY       # accepted, a cancel arriving now leaves the item in
+                _wake(entry[0])
+            return item
+        if self._putters:               # only a Channel has putters with an empty buffer
+            entry = self._putters.popleft()
+            item,entry[1] = entry[1],_EMPTY
+            _wake(entry[0])
+            return item
+        raise QueueEmpty
+
+    async def get(self):
+        if self._items or self._putters:
+            return self.get_nowait()
+
+        loop  = _promise._getloop()
+        job   = loop._current
+        entry = [job,_EMPTY]
+        self._getters.append(entry)
+        job._parked   = self
+        loop._current = None
+        try:
+            await kernel_switch()
+        except CancelledError:
+            if entry[1] is not _EMPTY:
+                self.__redeliver(entry[1])
+            raise
+        return entry[1]
+
+    async def get_many(self,max_items=None):
+        ''' Wait for at least one item, then return up to max_items (all that are
+            available by default) as a list
+        '''
+        if not self._items and not self._putters:
+            batch = [await self.get()]
+        else:
+            batch = []
+
+        while (self._items or self._putters) and (max_items is None or len(batch) < max_items):
+            batch.append(self.get_nowait())
+        return batch
+
+    def __redeliver(self,item):
+        if self._getters:
+            entry    = self._getters.popleft()
+            entry[1] = item
+            _wake(entry[0])
+        else:
+            self._requeue(item)
+
+    def _unpark(self,job):
+        for waiters in (self._getters,self._putters):
+            for entry in waiters:
+                if entry[0] is job:
+                    waiters.remove(entry)
+                    return True
+        return False
+
+
+class PriorityQueue(Queue):
+    __slots__ = ()
+
+    def _init(self):
+        return []
+
+    def _put(self,item):
+        heapq.heappush(self._items,item)
+
+    def _get(self):
+        return heapq.heappop(self._items)
+
+    def _requeue(self,item):
+        heapq.heappush(self._items,item)
+
+
+class LifoQueue(Queue):
+    __slots__ = ()
+
+    def _init(self):
+        return []
+
+    def _put(self,item):
+        self._items.append(item)
+
+    def _get(self):
+        return self._items.pop()
+
+    def _requeue(self,item):
+        self._items.append(item)
+
+
+class Channel(Queue):
+    ''' Rendezvous: put returns once a getter has the item, nothing is buffered
+        except an item handed to a getter that got cancelled before it ran
+    '''
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._capacity = 0
+
+    def full(self):
+        return True
+
+
+__all__ = ['Queue','PriorityQueue','LifoQueue','Channel','QueueEmpty','QueueFull']
@@ -1,32 +1,88 @@
 '''
 
-    Make Reactor powerfull and production ready compatible with non-blocking sockets 
+    Make Reactor powerfull and production ready compatible with non-blocking sockets
 
 '''
 
 from abc import ABC,abstractmethod
+import os
 import select
+import sys
+
+
+READABLE = 0x001    # same bit values as POLLIN/EPOLLIN and POLLOUT/EPOLLOUT so a
+WRITABLE = 0x004    # record's interest can be handed to epoll without translation
+
+
+def _fileno(fd):
+    ''' Reactors accept raw descriptors or anything exposing fileno() such as sockets '''
+    if type(fd) is int:
+        return fd
+    return fd.fileno()
+
+
+'''
+    Everything a reactor knows about one descriptor: the job parked for each
+    direction, the interest mask armed in the kernel and readiness that arrived
+    while nobody was waiting. Keeping both directions on one record is what lets a
+    reader and a writer sit on the same socket at the same time.
+'''
+class _FdRecord:
+    __slots__ = ('fd','owner','reactor','reader','writer','armed','pending')
+
+    def __init__(self,fd,owner,reactor) -> None:
+        self.fd       =  fd
+        self.owner    =  owner    # object the fd came from, used to spot descriptor reuse
+        self.reactor  =  reactor
+        self.reader   =  None
+        self.writer   =  None
+        self.armed    =  None     # None while the kernel does not know the fd
+        self.pending  =  0
+
+    def interest(self):
+        mask = 0
+        if self.reader is not None:
+            mask |= READABLE
+        if self.writer is not None:
+            mask |= WRITABLE
+        return mask
+
+    def _unpark(self,job):
+        ''' Job.cancel(): drop job if it is still parked on this descriptor '''
+        reactor = self.reactor
+        if reactor._records.get(self.fd) is not self:
+            return False
+        if self.reader is job:
+            return reactor.remove_reader(self.fd)
+        if self.writer is job:
+            return reactor.remove_writer(self.fd)
+        return False
+
+    def __repr__(self) -> str:
+        return f"<FdRecord fd={self.fd} reader={self.reader} writer={self.writer}>"
+
 
 class ReactorBase(ABC):
+    completions = False       # True when the reactor can perform transfers itself (io_uring)
+
     def __init__(self,_loop) -> None:
-        self._read_waiters  = {}
-        self._write_waiters = {}
-        self._loop         = _loop
+        self._records  = {}       # fd -> _FdRecord
+        self._waiting  = 0        # number of parked jobs, both directions
+        self._internal = 0        # of those, parked by the executor itself (wakeup fd)
+        self._loop     = _loop
 
     @abstractmethod
     def register_reader(self,fd,task):
         pass
 
-    @abstractmethod
     def reactor_ready(self):
-        if self._read_waiters or self._write_waiters:
-            return True
-        return False
-    
+        ''' True while somebody other than the executor's own wakeup reader is parked '''
+        return self._waiting > self._internal
+
     @abstractmethod
     def register_writter(self,fd,task):
         pass
-    
+
     @abstractmethod
     def remove_waiters(self,fd):
         pass
@@ -34,91 +90,434 @@ class ReactorBase(ABC):
     @abstractmethod
     def poll(self,timeout):
         pass
+
+    def close(self):
+        ''' Release the os resources held by the reactor '''
+        pass
+
+    def _record(self,fd):
+        fileno = _fileno(fd)
+        rec    = self._records.get(fileno)
+
+        if rec is None:
+            rec = self._records[fileno] = _FdRecord(fileno,fd,self)
+
+        elif rec.owner is not fd and (fd is not fileno or type(rec.owner) is not int):
+            # the descriptor number now belongs to another object (or is passed
+            # raw after an object held it), whoever was parked on the old one
+            # gets woken to discover it on its own syscall
+            woken = []
+            self._wake(rec,READABLE | WRITABLE,woken)
+            if woken:
+                self._loop.new_tasks(woken)
+            rec.owner   = fd
+            rec.armed   = None
+            rec.pending = 0
+
+        return rec
+
+    def _set_reader(self,rec,task):
+        if rec.reader is None:
+            self._waiting += 1
+        elif rec.reader is not task:
+            raise Exception(f"fd {rec.fd} already has a reader waiting")
+        rec.reader = task
+        try:
+            task._parked = rec
+        except AttributeError:
+            pass                    # a plain callback such as the wakeup reader
+
+    def _set_writer(self,rec,task):
+        if rec.writer is None:
+            self._waiting += 1
+        elif rec.writer is not task:
+            raise Exception(f"fd {rec.fd} already has a writer waiting")
+        rec.writer = task
+        try:
+            task._parked = rec
+        except AttributeError:
+            pass
+
+    def _wake(self,rec,events,woken):
+        ''' Move the jobs parked for the ready directions into woken and return
+            the directions nobody was waiting for
+        '''
+        unclaimed = 0
+        if events & READABLE:
+            if rec.reader is not None:
+                woken.append(rec.reader)
+                rec.reader = None
+                self._waiting -= 1
+            else:
+                unclaimed |= READABLE
+
+        if events & WRITABLE:
+            if rec.writer is not None:
+                woken.append(rec.writer)
+                rec.writer = None
+                self._waiting -= 1
+            else:
+                unclaimed |= WRITABLE
+
+        return unclaimed
+
+    def _drop(self,rec):
+        ''' Forget a record entirely, its jobs stay parked nowhere '''
+        if rec.reader is not None:
+            self._waiting -= 1
+        if rec.writer is not None:
+            self._waiting -= 1
+        rec.reader = rec.writer = None
+        del self._records[rec.fd]
+
+    def discard(self,fd):
+        ''' Forget fd before it gets closed, jobs still parked on it are woken so
+            they run into the closed descriptor on their own syscall
+        '''
+        rec = self._records.get(_fileno(fd))
+        if rec is None:
+            return
+
+        woken = []
+        self._wake(rec,READABLE | WRITABLE,woken)
+        self.remove_waiters(fd)
+        if woken:
+            self._loop.new_tasks(woken)
+
+    def _released(self,rec):
+        ''' Called after a direction was removed without being woken '''
+        pass
+
+    def remove_reader(self,fd):
+        rec = self._records.get(_fileno(fd))
+        if rec is None or rec.reader is None:
+            return False
+
+        rec.reader     = None
+        self._waiting -= 1
+        self._released(rec)
+        return True
+
+    def remove_writer(self,fd):
+        rec = self._records.get(_fileno(fd))
+        if rec is None or rec.writer is None:
+            return False
+
+        rec.writer     = None
+        self._waiting -= 1
+        self._released(rec)
+        return True
+
 '''
-    A reactor class for interacting with io polling or completion api like 
+    A reactor class for interacting with io polling or completion api like
     epoll poll, select and io_uring type polling api
 '''
 
 class SelectReactor(ReactorBase):
     def __init__(self,_loop) -> None:
         super().__init__(_loop)
-    
+
     def register_reader(self,fd,task):
-        self._read_waiters[fd] = task
-    
+        self._set_reader(self._record(fd),task)
+
     def register_writter(self, fd, task):
-        self._write_waiters[fd] = task
-    
+        self._set_writer(self._record(fd),task)
+
     def remove_waiters(self, fd):
-        if fd in self._read_waiters:
-            del self._read_waiters[fd]
-        
-        elif fd in self._write_waiters:
-            del self._write_waiters[fd]
-        else:
+        rec = self._records.get(_fileno(fd))
+        if rec is None:
             raise Exception("File descriptor not available")
+        self._drop(rec)
 
-    def reactor_ready(self):
-        return super().reactor_ready()
+    def _released(self, rec):
+        if rec.reader is None and rec.writer is None:
+            del self._records[rec.fd]
+
+    def __select(self, rlist, wlist, timeout):
+        try:
+            can_read,can_write,_ = select.select(rlist,wlist,[],timeout)
+            return can_read,can_write
+
+        except (OSError,ValueError):
+            # somebody closed a descriptor while parked on it, report only the
+            # broken ones as ready so their owners hit the error themselves
+            bad = []
+            for fd in set(rlist) | set(wlist):
+                try:
+                    select.select([fd],[],[],0)
+                except (OSError,ValueError):
+                    bad.append(fd)
+            return bad,bad
 
     def poll(self, timeout):
-        can_read,can_write,_ = select.select(self._read_waiters,self._write_waiters,[],timeout)
+        rlist = []
+        wlist = []
+        for fd, rec in self._records.items():
+            if rec.reader is not None:
+                rlist.append(fd)
+            if rec.writer is not None:
+                wlist.append(fd)
+
+        can_read,can_write = self.__select(rlist,wlist,timeout)
 
+        records = self._records
+        woken   = []
         for rfd in can_read:
-            self._loop.new_task(self._read_waiters.pop(rfd))
+            self._wake(records[rfd],READABLE,woken)
 
         for wfd in can_write:
-            self._loop.new_task(self._write_waiters.pop(wfd))
+            self._wake(records[wfd],WRITABLE,woken)
+
+        for fd in (*can_read,*can_write):
+            rec = records.get(fd)
+            if rec is not None and rec.reader is None and rec.writer is None:
+                del records[fd]
+
+        if woken:
+            self._loop.new_tasks(woken)
+
+
+'''
+    Epoll reactor with persistent registrations.
+
+    A descriptor is added to the epoll set the first time somebody waits on it and
+    stays there; waking a job does not touch the kernel. That holds for fds passed
+    as objects (sockets, anything with fileno()), whose replacement _record spots.
+    A raw int fd can be closed, which silently drops it from the epoll set, and
+    its number handed out again with nothing telling the two apart, so raw fds
+    are only registered while somebody waits on them: they leave the set as soon
+    as their last waiter is woken or removed. Interest changes are only
+    recorded when a wait needs a direction the kernel is not already watching, and
+    are flushed in one pass right before epoll_wait, so a job that re-parks on the
+    same direction in the same turn costs no syscall at all. A direction that
+    fires while nobody waits on it is dropped lazily at that point. A reader and a
+    writer parked on the same fd share one registration with the combined mask.
+
+    flags:
+        0                   level triggered (default, safe with blocking sockets)
+        select.EPOLLET      edge triggered; the fd is registered once for both
+                            directions and never modified. Readiness that arrives
+                            with no waiter parked is remembered and handed to the
+                            next waiter. Requires non-blocking sockets and code
+                            that only parks after the syscall hit EAGAIN.
+        select.EPOLLONESHOT the kernel disarms the fd after every event and each
+                            wait re-arms it
+'''
 
+if hasattr(select, 'epoll'):
+    _HANGUP = select.EPOLLERR | select.EPOLLHUP
+    _EXTRA  = select.EPOLLPRI | select.EPOLLRDHUP
 
-## TODO : -> improve speed 
 class EpollReactor(ReactorBase):
-    def __init__(self, _loop) -> None:
+    def __init__(self, _loop, flags=0, max_events=1024) -> None:
         super().__init__(_loop)
-        self._epoll = select.epoll()
-    
+        if flags & ~(select.EPOLLET | select.EPOLLONESHOT):
+            raise ValueError("flags must be a combination of EPOLLET and EPOLLONESHOT")
+
+        self._epoll       = select.epoll()
+        self._edge        = bool(flags & select.EPOLLET)
+        self._oneshot     = bool(flags & select.EPOLLONESHOT)
+        self._flags       = flags
+        self._max_events  = max_events
+        self._dirty       = set()    # records whose kernel mask is reconciled at next poll
+
+    def __arm(self, rec, want):
+        if rec.armed is None or not (self._edge or rec.armed & want):
+            self._dirty.add(rec)
 
     def register_reader(self, fd, task):
-        self._read_waiters[fd.fileno()] = task;
-        try:
-            self._epoll.register(fd.fileno(),select.EPOLLIN)
-        except FileExistsError:
-            self._epoll.modify(fd.fileno(),select.EPOLLIN)
+        rec = self._record(fd)
+        if rec.pending & READABLE:
+            rec.pending &= ~READABLE
+            self._loop._ready.append(task)
+            return
 
-    def register_writter(self, fd, task):
-        self._write_waiters[fd.fileno()] = task
+        self._set_reader(rec, task)
+        self.__arm(rec, READABLE)
 
-        try:
-            self._epoll.register(fd.fileno(),select.EPOLLOUT)
-        except FileExistsError:
-            self._epoll.modify(fd.fileno(),select.EPOLLOUT)
+    def register_writter(self, fd, task):
+        rec = self._record(fd)
+        if rec.pending & WRITABLE:
+            rec.pending &= ~WRITABLE
+            self._loop._ready.append(task)
+            return
 
+        self._set_writer(rec, task)
+        self.__arm(rec, WRITABLE)
 
     def remove_waiters(self, fd):
-        if fd.fileno() in self._read_waiters:
-            del self._read_waiters[fd.fileno()]
-            self._epoll.unregister(fd.fileno())
-        elif fd.fileno() in self._write_waiters:
-            del self._write_waiters[fd.fileno()]
-            self._epoll.unregister(fd.fileno())
-        else:
+        rec = self._records.get(_fileno(fd))
+        if rec is None:
             raise Exception("File descriptor not available")
 
-    def reactor_ready(self):
-        return super().reactor_ready()
+        if rec.armed is not None:
+            try:
+                self._epoll.unregister(rec.fd)
+            except OSError:
+                pass
+        self._dirty.discard(rec)
+        self._drop(rec)
+
+    def _released(self, rec):
+        if type(rec.owner) is int and rec.reader is None and rec.writer is None:
+            self.__release_raw(rec)
+
+    def __release_raw(self, rec):
+        ''' Unregister an idle raw fd, see the class comment '''
+        if rec.armed is not None:
+            try:
+                self._epoll.unregister(rec.fd)
+            except OSError:
+                pass                # already closed, the kernel dropped it itself
+        self._dirty.discard(rec)
+        del self._records[rec.fd]
+
+    def __reconcile(self, woken):
+        ''' Flush the interest changes collected since the last poll '''
+        epoll   = self._epoll
+        records = self._records
+        dirty, self._dirty = self._dirty, set()
+
+        for rec in dirty:
+            if records.get(rec.fd) is not rec:
+                continue
+
+            if self._edge:
+                mask = READABLE | WRITABLE | select.EPOLLRDHUP | select.EPOLLET
+            else:
+                mask = rec.interest()
+                if mask:
+                    mask |= self._flags
+            if mask == rec.armed:
+                continue
+
+            try:
+                if rec.armed is not None:
+                    try:
+                        epoll.modify(rec.fd, mask)
+                    except FileNotFoundError:
+                        epoll.register(rec.fd, mask)
+                elif mask:
+                    try:
+                        epoll.register(rec.fd, mask)
+                    except FileExistsError:
+                        epoll.modify(rec.fd, mask)
+                else:
+                    continue
+                rec.armed = mask
 
+            except OSError:
+                # closed behind our back, let the waiters find out on their own syscall
+                self._wake(rec, READABLE | WRITABLE, woken)
+                del records[rec.fd]
 
     def poll(self, timeout):
-        events = self._epoll.poll(timeout)
+        woken = []
+        if self._dirty:
+            self.__reconcile(woken)
+            if woken:
+                timeout = 0
+
+        if timeout is None:
+            timeout = -1
+
+        events  = self._epoll.poll(timeout, self._max_events)
+        if len(events) == self._max_events:
+            self._max_events <<= 1
+
+        records = self._records
+        wake    = self._wake
 
         for fd, event in events:
-            if event & select.EPOLLIN:
-                task = self._read_waiters[fd]
-                if task:
-                    self._loop.new_task(task)
+            rec = records.get(fd)
+            if rec is None:
+                continue
+
+            ready = event & (READABLE | WRITABLE)
+            if event & _HANGUP:
+                ready = READABLE | WRITABLE
+            elif event & _EXTRA:
+                ready |= READABLE
+
+            unclaimed = wake(rec, ready, woken)
+
+            if type(rec.owner) is int and rec.reader is None and rec.writer is None:
+                self.__release_raw(rec)
+                continue
+
+            if self._edge:
+                rec.pending |= unclaimed
+
+            elif event & _HANGUP:
+                # level triggered keeps reporting a hangup until the fd is closed,
+                # everyone parked on it was just woken so let go of it
+                try:
+                    self._epoll.unregister(fd)
+                except OSError:
+                    pass
+                self._dirty.discard(rec)
+                del records[fd]
+
+            elif self._oneshot:
+                # kernel disarmed the fd, next wait has to re-arm it
+                rec.armed = 0
+                if rec.reader is not None or rec.writer is not None:
+                    self._dirty.add(rec)
+
+            elif unclaimed & rec.armed:
+                self._dirty.add(rec)
+
+        if woken:
+            self._loop.new_tasks(woken)
+
+    def close(self):
+        self._epoll.close()
+
+
+_ONE = (1).to_bytes(8,sys.byteorder)     # eventfd takes a native 64 bit increment
+
+'''
+    Descriptor other threads write to so a loop blocked in poll wakes up at once.
+    An eventfd where the platform has one (a single 8 byte counter, any number of
+    notifications collapse into one readable event), a pipe otherwise.
+'''
+class Waker:
+    def __init__(self) -> None:
+        if hasattr(os,'eventfd'):
+            self._rfd = self._wfd = os.eventfd(0,os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        else:
+            self._rfd,self._wfd = os.pipe()
+            os.set_blocking(self._rfd,False)
+            os.set_blocking(self._wfd,False)
+
+    def fileno(self):
+        return self._rfd
+
+    def notify(self):
+        try:
+            os.write(self._wfd,_ONE)
+        except BlockingIOError:
+            pass            # counter or pipe already full, a wakeup is pending anyway
+
+    def drain(self):
+        try:
+            while os.read(self._rfd,4096):
+                if self._rfd == self._wfd:
+                    break
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self._rfd < 0:
+            return
+        os.close(self._rfd)
+        if self._wfd != self._rfd:
+            os.close(self._wfd)
+        self._rfd = self._wfd = -1
 
-            elif event & select.EPOLLOUT:
-                task = self._write_waiters[fd]
-                if task:
-                    self._loop.new_task(task)
 
+def default_reactor(_loop):
+    ''' Pick the most scalable reactor the platform offers '''
+    if hasattr(select, 'epoll'):
+        return EpollReactor(_loop)
+    return SelectReactor(_loop)
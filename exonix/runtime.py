@@ -0,0 +1,223 @@
+'''
+    Multi threaded work stealing runtime.
+
+    One TaskExecutor per worker thread, each with its own ready queue, timers
+    and reactor, bound as that thread's getloop(). Next to its ready queue every
+    worker owns a local run queue of Tasks that were spawned but never ran.
+    After each pass over the ready jobs a worker moves a batch of its own Tasks
+    over; a worker with nothing left picks peers in random order and steals half
+    of the Tasks at the tail of their run queue, rebinding them to itself.
+
+    Only Tasks that have not started yet migrate. A job that already ran has
+    created sockets, streams and timers on its worker's loop and keeps running
+    there, wakeups from other workers reach it through that loop's eventfd
+    handoff (Promise switches to locked transitions for that, see
+    promise._enable_threading). Plain Jobs and the loop's own callbacks are never
+    stolen, so everything exonix spawns internally stays put.
+
+    On a GIL build the workers interleave rather than run in parallel, which
+    still helps when tasks block in C code that releases the GIL; free threaded
+    builds (3.13t and later) run the workers truly in parallel.
+'''
+
+import os
+import random
+import threading
+import traceback
+from collections import deque
+
+from .executor import TaskExecutor,_LoopStopped,_LoopReload,getloop,set_thread_loop
+from .job import Job
+from . import promise as _promise
+
+
+_IDLE_POLL = 0.05       # an idle worker re-checks its peers at least this often
+_LOCAL_BATCH = 32       # spawned Tasks moved to the ready queue per pass
+
+
+class Task(Job):
+    ''' A Job that idle workers may steal for as long as it has not started '''
+    __slots__ = ()
+
+
+class WorkStealingRuntime:
+    def __init__(self,workers=None,idle_poll=_IDLE_POLL) -> None:
+        self.workers     =  workers or os.cpu_count() or 1
+        self._idle_poll  =  idle_poll
+        self._loops      =  [TaskExecutor.create() for _ in range(self.workers)]
+        self._index      =  {id(loop): i for i,loop in enumerate(self._loops)}
+        self._queues     =  [deque() for _ in range(self.workers)]   # spawned, not yet run
+        self._sleepers   =  deque()        # idle worker loops blocked in their poll
+        self._steals     =  [0] * self.workers
+        self._stolen     =  [0] * self.workers
+        self._next       =  0              # round robin target for spawns from outside
+        self._stopping   =  False
+        self._result     =  None
+        self._error      =  None
+
+    def __repr__(self) -> str:
+        return f"<WorkStealingRuntime workers={self.workers}>"
+
+    def spawn(self,coro):
+        ''' Queue a coroutine as a stealable Task, from any thread. On a worker it
+            goes to that worker's local queue, from outside round robin
+        '''
+        index = self._index.get(id(getloop()))
+        if index is None:
+            index = self._next % self.workers
+            self._next += 1
+            task  = Task(coro,self._loops[index])
+            self._queues[index].append(task)
+            self._loops[index].wakeup()
+        else:
+            task  = Task(coro,self._loops[index])
+            self._queues[index].append(task)
+
+        if self._sleepers:
+            self.__wake_one()
+        return task
+
+    def spawn_many(self,coros):
+        return [self.spawn(coro) for coro in coros]
+
+    def __wake_one(self):
+        try:
+            sleeper = self._sleepers.popleft()
+        except IndexError:
+            return
+        sleeper.wakeup()
+
+    def __unsleep(self,loop):
+        try:
+            self._sleepers.remove(loop)
+        except ValueError:
+            pass                        # a spawner already popped and woke us
+
+    def __steal(self,index,rng):
+        queues = self._queues
+        loop   = self._loops[index]
+        count  = len(queues)
+        first  = rng.randrange(count)
+
+        for k in range(count):
+            victim = (first + k) % count
+            if victim == index:
+                continue
+
+            queue   = queues[victim]
+            grabbed = []
+            for _ in range((len(queue) + 1) // 2):
+                try:
+                    grabbed.append(queue.pop())
+                except IndexError:
+                    break
+
+            if grabbed:
+                for job in grabbed:
+                    job._loop = loop
+                grabbed.reverse()
+                loop._ready.extend(grabbed)
+                self._steals[index] += 1
+                self._stolen[index] += len(grabbed)
+                return True
+
+        return False
+
+    def _run_worker(self,index):
+        loop  = self._loops[index]
+        ready = loop._ready
+        local = self._queues[index]
+        rng   = random.Random(index)
+        ran   = 0               # jobs since the reactor was last looked at
+        set_thread_loop(loop)
+
+        while not self._stopping:
+            try:
+                for _ in range(len(ready)):
+                    ready.popleft()()
+                    ran += 1
+            except _LoopStopped:
+                break
+            except _LoopReload:
+                # use_policy/enable_stats marker: use_policy moved the queued jobs
+                # into a new ready queue, workers keep their loop but follow it
+                ready = loop._ready
+                continue
+            except Exception:
+                # a failing task must not take the worker down with it
+                traceback.print_exc()
+                continue
+
+            if ran >= loop._slice_jobs:
+                ran = 0
+                if ready:
+                    loop.run_once(0)    # same time slice as run_default_policy
+
+            if local:
+                for _ in range(_LOCAL_BATCH):
+                    try:
+                        ready.append(local.popleft())
+                    except IndexError:
+                        break
+                continue
+            if ready or self.__steal(index,rng):
+                continue
+
+            self._sleepers.append(loop)
+            if ready or local or self.__steal(index,rng):
+                self.__unsleep(loop)
+                continue
+            loop.run_once(self._idle_poll)
+            self.__unsleep(loop)
+
+    async def __main(self,coro):
+        try:
+            self._result = await coro
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.stop()
+
+    def run(self,coro):
+        ''' Run coro as the first Task on worker 0 (the calling thread) and return
+            its result. The runtime stops once it finishes
+        '''
+        _promise._enable_threading()
+        self._stopping = False
+        self._queues[0].append(Task(self.__main(coro),self._loops[0]))
+
+        threads = [threading.Thread(target=self._run_worker,args=(i,),name=f"exonix-worker-{i}",daemon=True)
+                   for i in range(1,self.workers)]
+        try:
+            for thread in threads:
+                thread.start()
+            self._run_worker(0)
+        finally:
+            self.stop()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+            set_thread_loop(TaskExecutor())
+            _promise._disable_threading()       # single threaded loops go back to the lock free path
+
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def stop(self):
+        ''' Workers exit once their ready queue is drained '''
+        self._stopping = True
+        for loop in self._loops:
+            loop.wakeup()
+
+    def close(self):
+        for loop in self._loops:
+            loop.close()
+
+    def stats(self):
+        return [{'worker': i,'steals': self._steals[i],'stolen': self._stolen[i],
+                 'ready': len(loop._ready),'queued': len(self._queues[i])}
+                for i,loop in enumerate(self._loops)]
+
+
+__all__ = ['WorkStealingRuntime','Task']
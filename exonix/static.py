@@ -0,0 +1,237 @@
+'''
+    Static files for exonix.http.
+
+        static = StaticFiles('/srv/www', max_age=3600)
+        app.add('GET','/',static)
+        app.add('GET','/{path:path}',static)
+
+    StaticFiles is a handler serving the file named by request.params[param]
+    (or the request path when the route has no such segment) below root, a
+    directory answering with its index file; a {path:path} route segment
+    hands it names in subdirectories too. Names that leave root are 404.
+
+    Small files (up to max_file_size) are read once and kept in an LRU cache
+    bounded by cache_size bytes, together with a ready Response whose header
+    lines are encoded in advance, so a hit costs one stat() and no open, read
+    or formatting. Bigger files only have their headers cached and go out as
+    FileResponse, with sendfile. Every request stats the file and an entry is
+    rebuilt when its inode, mtime or size changed.
+
+    Responses carry an ETag (inode, mtime and size) and Last-Modified; a
+    matching If-None-Match, or If-Modified-Since without it, is answered 304.
+    A single bytes Range is answered 206 (If-Range respected), an
+    unsatisfiable one 416; several ranges get the whole file.
+'''
+
+import mimetypes
+import os
+import stat
+from collections import OrderedDict
+from email.utils import formatdate,parsedate_to_datetime
+
+from .http import Response,FileResponse
+from .httpparser import HttpError
+
+
+'''
+    Response that is sent many times: header lines are encoded once
+'''
+class _Prepared(Response):
+    __slots__ = ('lines',)
+
+    def __init__(self,body=b"",status=200,headers=None,content_type='application/octet-stream') -> None:
+        super().__init__(body,status,headers,content_type)
+        self.lines = Response.header_lines(self)
+
+    def header_lines(self):
+        return self.lines
+
+
+class _Entry:
+    __slots__ = ('key','size','mtime','content_type','validators','body','response','not_modified','cost')
+
+    def __init__(self,st,content_type,body,max_age) -> None:
+        validators = {'ETag': f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"',
+                      'Last-Modified': formatdate(st.st_mtime,usegmt=True)}
+        if max_age is not None:
+            validators['Cache-Control'] = f"max-age={max_age}"
+
+        self.key           =  _key(st)
+        self.size          =  st.st_size
+        self.mtime         =  int(st.st_mtime)
+        self.content_type  =  content_type
+        self.validators    =  validators
+        self.body          =  body           # None for files sent with sendfile
+        self.response      =  _Prepared(body,200,self.headers(),content_type) if body is not None else None
+        self.not_modified  =  _Prepared(status=304,headers=validators)
+        self.cost          =  len(body or b"") + 512
+
+    def headers(self,**extra):
+        return dict(self.validators,**{'Accept-Ranges': 'bytes'},**extra)
+
+
+def _key(st):
+    return (st.st_ino,st.st_mtime_ns,st.st_size)
+
+
+def _range(header,size):
+    ''' (first, last) byte of a single bytes range, None when the header is to
+        be ignored and the whole file sent. Raises HttpError 416 when the range
+        starts past the end
+    '''
+    unit,_,spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first,dash,last = spec.strip().partition('-')
+    if not dash:
+        return None
+    if first.isdigit():
+        start = int(first)
+        if not last:
+            end = size - 1
+        elif last.isdigit() and int(last) >= start:
+            end = int(last)
+        else:
+            return None
+    elif not first and last.isdigit() and int(last):
+        start,end = max(size - int(last),0),size - 1
+    elif not first and last.isdigit():
+        start,end = size,size           # bytes=-0 selects nothing
+    else:
+        return None
+    if start >= size:
+        raise HttpError(416,headers={'Content-Range': f"bytes */{size}"})
+    return start,min(end,size - 1)
+
+
+class StaticFiles:
+    def __init__(self,root,cache_size=32 * 1024 * 1024,max_file_size=256 * 1024,
+                 index='index.html',param='path',max_age=None) -> None:
+        self.root           =  os.path.abspath(root)
+        self.cache_size     =  cache_size
+        self.max_file_size  =  max_file_size
+        self.index          =  index
+        self.param          =  param
+        self.max_age        =  max_age
+        self.hits           =  0
+        self.misses         =  0
+        self._cache         =  OrderedDict()     # path -> _Entry, least recently used first
+        self._size          =  0
+
+    def __repr__(self) -> str:
+        return (f"<StaticFiles {self.root} cached={len(self._cache)} bytes={self._size} "
+                f"hits={self.hits} misses={self.misses}>")
+
+    def __call__(self,request):
+        path,st = self.__lookup(request)
+        entry   = self._cache.get(path)
+        if entry is not None and entry.key == _key(st):
+            self._cache.move_to_end(path)
+            self.hits += 1
+        else:
+            entry = self.__load(path,st)
+
+        if self.__fresh(request,entry):
+            return entry.not_modified
+
+        span  = None
+        value = request.headers.get('range')
+        if value is not None:
+            condition = request.headers.get('if-range')
+            if condition is None or condition in (entry.validators['ETag'],entry.validators['Last-Modified']):
+                span = _range(value,entry.size)
+
+        if entry.body is not None:
+            if span is None:
+                return entry.response
+            start,end = span
+            return Response(memoryview(entry.body)[start:end + 1],206,
+                            entry.headers(**{'Content-Range': f"bytes {start}-{end}/{entry.size}"}),
+                            entry.content_type)
+
+        try:
+            file = open(path,'rb')
+        except OSError:
+            raise HttpError(404)
+        if _key(os.fstat(file.fileno())) != entry.key:
+            file.close()                # replaced between stat and open, the next request sees the new one
+            raise HttpError(503,headers={'Retry-After': '0'})
+        if span is None:
+            return FileResponse(file,0,entry.size,200,entry.headers(),entry.content_type)
+        start,end = span
+        return FileResponse(file,start,end - start + 1,206,
+                            entry.headers(**{'Content-Range': f"bytes {start}-{end}/{entry.size}"}),
+                            entry.content_type)
+
+    def clear(self):
+        self._cache.clear()
+        self._size = 0
+
+    def __lookup(self,request):
+        ''' Absolute path and stat of the requested regular file, HttpError 404
+            for anything else
+        '''
+        name = request.params.get(self.param,request.path)
+        path = os.path.normpath(os.path.join(self.root,name.lstrip('/')))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise HttpError(404)
+        try:
+            st = os.stat(path)
+            if stat.S_ISDIR(st.st_mode) and self.index:
+                path = os.path.join(path,self.index)
+                st   = os.stat(path)
+        except (OSError,ValueError):        # ValueError: NUL in the name
+            raise HttpError(404)
+        if not stat.S_ISREG(st.st_mode):
+            raise HttpError(404)
+        return path,st
+
+    def __load(self,path,st):
+        self.misses += 1
+        body = None
+        if st.st_size <= self.max_file_size:
+            try:
+                with open(path,'rb') as file:
+                    st   = os.fstat(file.fileno())
+                    body = file.read()
+            except OSError:
+                raise HttpError(404)
+            if len(body) != st.st_size:
+                raise HttpError(503,headers={'Retry-After': '0'})
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        entry        = _Entry(st,content_type,body,self.max_age)
+
+        old = self._cache.pop(path,None)
+        if old is not None:
+            self._size -= old.cost
+        self._cache[path] = entry
+        self._size       += entry.cost
+        while self._size > self.cache_size and self._cache:
+            _,old = self._cache.popitem(last=False)
+            self._size -= old.cost
+        return entry
+
+    def __fresh(self,request,entry):
+        ''' True when the client's copy is current and 304 will do '''
+        match = request.headers.get('if-none-match')
+        if match is not None:
+            if match.strip() == '*':
+                return True
+            etag = entry.validators['ETag']
+            for tag in match.split(','):
+                tag = tag.strip()
+                if (tag[2:] if tag.startswith('W/') else tag) == etag:    # weak comparison
+                    return True
+            return False
+
+        since = request.headers.get('if-modified-since')
+        if since is not None:
+            try:
+                return parsedate_to_datetime(since).timestamp() >= entry.mtime
+            except (TypeError,ValueError):
+                return False
+        return False
+
+
+__all__ = ['StaticFiles']
@@ -0,0 +1,139 @@
+'''
+    Loop instrumentation, off unless TaskExecutor.enable_stats() is called.
+
+    Histogram is a log-linear (HDR style) histogram of non negative integers:
+    values below 2**sub_bits get a bucket each, above that every power of two
+    is split into 2**sub_bits buckets, so any recorded value is reported within
+    1/2**sub_bits of itself (3% with the default 5 bits) from a few hundred
+    counters, whatever the range.
+
+    LoopStats holds what run_default_policy records while stats are enabled;
+    TaskExecutor.stats() returns its snapshot().
+'''
+
+
+class Histogram:
+    __slots__ = ('_sub_bits','_sub','_counts','count','total','min','max')
+
+    def __init__(self,sub_bits=5) -> None:
+        self._sub_bits  =  sub_bits
+        self._sub       =  1 << sub_bits
+        self._counts    =  []
+        self.count      =  0
+        self.total      =  0
+        self.min        =  None
+        self.max        =  0
+
+    def __repr__(self) -> str:
+        return f"<Histogram count={self.count} p50={self.percentile(50)} max={self.max}>"
+
+    def __index(self,value):
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self._sub_bits - 1
+        return ((shift + 1) << self._sub_bits) + (value >> shift) - self._sub
+
+    def __lowest(self,index):
+        ''' Smallest value that lands in bucket index '''
+        if index < self._sub:
+            return index
+        shift = (index >> self._sub_bits) - 1
+        return ((index & (self._sub - 1)) + self._sub) << shift
+
+    def record(self,value,n=1):
+        value = int(value)
+        if value < 0:
+            value = 0
+        index  = self.__index(value)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += n
+        self.count    += n
+        self.total    += value * n
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self,p):
+        if not self.count:
+            return 0
+        rank = max(1,int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for index,n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                # report the top of the bucket, never above what was recorded
+                return min(self.__lowest(index + 1) - 1,self.max)
+        return self.max
+
+    def merge(self,other):
+        ''' Add the counts of another histogram with the same sub_bits '''
+        if other._sub_bits != self._sub_bits:
+            raise ValueError("cannot merge histograms with different sub_bits")
+        counts = self._counts
+        if len(other._counts) > len(counts):
+            counts.extend([0] * (len(other._counts) - len(counts)))
+        for index,n in enumerate(other._counts):
+            counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max > self.max:
+            self.max = other.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self):
+        self._counts.clear()
+        self.count = 0
+        self.total = 0
+        self.min   = None
+        self.max   = 0
+
+    def snapshot(self):
+        return {'count': self.count,'mean': round(self.mean(),2),'min': self.min or 0,
+                'p50': self.percentile(50),'p90': self.percentile(90),'p99': self.percentile(99),
+                'p999': self.percentile(99.9),'max': self.max}
+
+
+class LoopStats:
+    __slots__ = ('iterations','jobs','polls','poll_time','run_time',
+                 'ready_depth','jobs_per_iteration','poll_us','woken_per_poll','timer_lateness_us')
+
+    def __init__(self) -> None:
+        self.iterations          =  0
+        self.jobs                =  0
+        self.polls               =  0
+        self.poll_time           =  0.0        # seconds inside reactor.poll
+        self.run_time            =  0.0        # seconds running ready jobs
+        self.ready_depth         =  Histogram()
+        self.jobs_per_iteration  =  Histogram()
+        self.poll_us             =  Histogram()
+        self.woken_per_poll      =  Histogram()     # jobs a single poll made ready
+        self.timer_lateness_us   =  Histogram()     # how far past its deadline a timer fired
+
+    def reset(self):
+        self.__init__()
+
+    def snapshot(self):
+        busy = self.poll_time + self.run_time
+        return {
+            'iterations'         : self.iterations,
+            'jobs'               : self.jobs,
+            'polls'              : self.polls,
+            'poll_time'          : round(self.poll_time,6),
+            'run_time'           : round(self.run_time,6),
+            'run_ratio'          : round(self.run_time / busy,4) if busy else 0.0,
+            'ready_depth'        : self.ready_depth.snapshot(),
+            'jobs_per_iteration' : self.jobs_per_iteration.snapshot(),
+            'poll_us'            : self.poll_us.snapshot(),
+            'woken_per_poll'     : self.woken_per_poll.snapshot(),
+            'timer_lateness_us'  : self.timer_lateness_us.snapshot(),
+        }
+
+
+__all__ = ['Histogram','LoopStats']
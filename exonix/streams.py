@@ -0,0 +1,433 @@
+'''
+    Buffered streams over AsyncSocket.
+
+    StreamReader receives with recv_into straight into a bytearray borrowed from a
+    BufferPool and parses in place: readexactly/readuntil search and slice the
+    filled window of that buffer, so the only copy is the bytes object handed back
+    to the caller. StreamWriter corks: write() only queues the buffer, everything
+    written during one turn of the loop goes out in a single sendmsg
+    scatter-gather call when the writing job yields.
+'''
+
+import os
+import socket
+
+from .executor import getloop
+from .kernel import kernel_switch
+from .net import open_connection
+
+
+_WOULD_BLOCK = (BlockingIOError, InterruptedError)
+
+try:
+    _IOV_MAX = min(os.sysconf('SC_IOV_MAX'), 1024)
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 16
+
+
+class IncompleteReadError(EOFError):
+    def __init__(self,partial,expected) -> None:
+        super().__init__(f"{len(partial)} bytes read on a total of {expected} expected bytes")
+        self.partial   =  partial
+        self.expected  =  expected
+
+
+class LimitOverrunError(Exception):
+    def __init__(self,message,consumed) -> None:
+        super().__init__(message)
+        self.consumed  =  consumed
+
+
+'''
+    Free list of equally sized bytearrays. Connections borrow their receive buffer
+    on creation and give it back on close, so a server churning through short
+    lived connections reuses the same few buffers instead of allocating new ones.
+'''
+class BufferPool:
+    def __init__(self,size=16384,max_free=256) -> None:
+        self.size      =  size
+        self._free     =  []
+        self._max_free =  max_free
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        if self._free:
+            return self._free.pop()
+        return bytearray(self.size)
+
+    def release(self,buf):
+        if len(buf) == self.size and len(self._free) < self._max_free:
+            self._free.append(buf)
+
+_default_pool = BufferPool()
+
+
+class StreamReader:
+    def __init__(self,sock,limit=65536,pool=None,loop=None) -> None:
+        self._sock   =  sock
+        self._loop   =  loop if loop is not None else getloop()
+        self._pool   =  pool if pool is not None else _default_pool
+        self._buf    =  self._pool.acquire()
+        self._view   =  memoryview(self._buf)
+        self._start  =  0           # first unread byte
+        self._end    =  0           # one past the last received byte
+        self._limit  =  limit
+        self._eof    =  False
+        self._paused =  False
+        self._parked =  None        # job waiting in _fill for resume_reading
+
+    def __repr__(self) -> str:
+        return f"<StreamReader buffered={self._end - self._start} eof={self._eof}>"
+
+    def __len__(self):
+        return self._end - self._start
+
+    def at_eof(self):
+        return self._eof and self._start == self._end
+
+    def pause_reading(self):
+        ''' Stop receiving: buffered bytes are still served, the next read that
+            needs the socket waits for resume_reading and the kernel buffer fills
+            up so TCP flow control slows the peer down
+        '''
+        self._paused = True
+
+    def resume_reading(self):
+        self._paused = False
+        if self._parked is not None:
+            job, self._parked = self._parked, None
+            self._loop.new_task(job)
+
+    def is_reading(self):
+        return not self._paused
+
+    def _unpark(self,job):
+        if self._parked is not job:
+            return False
+        self._parked = None
+        return True
+
+    async def _fill(self):
+        ''' Receive once into the free tail of the buffer, False on eof '''
+        while self._paused:
+            loop = self._loop
+            self._parked  = loop._current
+            self._parked._parked = self
+            loop._current = None
+            await kernel_switch()
+
+        if self._eof:
+            return False
+
+        if self._end == len(self._buf):
+            self.__make_room()
+
+        n = await self._sock.recv_into(self._view[self._end:])
+        if not n:
+            self._eof = True
+            return False
+        self._end += n
+        return True
+
+    def __make_room(self):
+        size = self._end - self._start
+        if self._start:
+            # slide the unread bytes to the front, memmove within the same buffer
+            self._view[:size] = self._view[self._start:self._end]
+        else:
+            bigger = bytearray(len(self._buf) * 2)
+            bigger[:size] = self._view[:size]
+            self._view.release()
+            self._pool.release(self._buf)
+            self._buf  = bigger
+            self._view = memoryview(bigger)
+        self._start = 0
+        self._end   = size
+
+    def __take(self,n):
+        start        = self._start
+        self._start += n
+        data         = bytes(self._view[start:start + n])
+        if self._start == self._end:
+            self._start = self._end = 0
+        return data
+
+    async def read(self,n=-1):
+        ''' Up to n bytes, at most one recv when nothing is buffered. n=-1 reads to eof '''
+        if n < 0:
+            while await self._fill():
+                pass
+            return self.__take(self._end - self._start)
+
+        if self._start == self._end:
+            await self._fill()
+        return self.__take(min(n, self._end - self._start))
+
+    async def readexactly(self,n):
+        while self._end - self._start < n:
+            if not await self._fill():
+                partial = self.__take(self._end - self._start)
+                raise IncompleteReadError(partial,n)
+        return self.__take(n)
+
+    async def readuntil(self,separator=b'\n'):
+        ''' Bytes up to and including separator. The search resumes where the
+            previous pass stopped instead of rescanning the whole window
+        '''
+        seplen = len(separator)
+        if not seplen:
+            raise ValueError("separator should be at least one-byte string")
+
+        buf    = self._buf
+        offset = 0
+        while True:
+            idx = buf.find(separator, self._start + offset, self._end)
+            if idx >= 0:
+                return self.__take(idx + seplen - self._start)
+
+            offset = max(0, self._end - self._start - seplen + 1)
+            if offset > self._limit:
+                raise LimitOverrunError("separator is not found, and chunk exceed the limit",offset)
+
+            if not await self._fill():
+                partial = self.__take(self._end - self._start)
+                raise IncompleteReadError(partial,None)
+            buf = self._buf
+
+    async def readline(self):
+        try:
+            return await self.readuntil(b'\n')
+        except IncompleteReadError as e:
+            return e.partial
+
+    def release(self):
+        ''' Hand the receive buffer back to the pool, the reader is unusable after '''
+        if self._buf is not None:
+            self._view.release()
+            self._pool.release(self._buf)
+            self._buf = self._view = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+
+'''
+    Flow control: the write queue is bounded by a high and a low watermark. Once
+    a write takes the queue above high_water the writer counts as paused, drain()
+    parks the caller and the on_pause hook fires. The flush job, which is the one
+    parked in the reactor's write interest, resumes the drainers and fires
+    on_resume as soon as the kernel has taken enough to get back to low_water.
+    Wiring those hooks to a StreamReader's pause_reading/resume_reading lets a
+    proxy or fan-out stop pulling from its source while a sink is slow.
+'''
+class StreamWriter:
+    def __init__(self,sock,loop=None,high_water=65536,low_water=None) -> None:
+        self._sock      =  sock
+        self._loop      =  loop if loop is not None else getloop()
+        self._chunks    =  []
+        self._size      =  0
+        self._flushing  =  False      # a flush job is scheduled or parked on the fd
+        self._paused    =  False      # queue went above high and not yet back to low
+        self._drainers  =  []         # woken when the queue is back under low water
+        self._flushed   =  []         # woken when the queue is empty
+        self._error     =  None
+        self._eof       =  False      # shutdown(SHUT_WR) once the queue is empty
+        self._closing   =  False
+        self._on_pause  =  None
+        self._on_resume =  None
+        self.set_write_buffer_limits(high_water,low_water)
+
+    def __repr__(self) -> str:
+        state = " paused" if self._paused else ""
+        return f"<StreamWriter buffered={self._size}{state}>"
+
+    def set_write_buffer_limits(self,high=None,low=None):
+        if high is None:
+            high = 65536 if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError(f"high ({high}) must be >= low ({low}) must be >= 0")
+        self._high = high
+        self._low  = low
+
+    def get_write_buffer_limits(self):
+        return self._low,self._high
+
+    def get_write_buffer_size(self):
+        return self._size
+
+    def set_flow_callbacks(self,on_pause=None,on_resume=None):
+        ''' Called without arguments when the queue crosses high water going up
+            and low water going down
+        '''
+        self._on_pause  = on_pause
+        self._on_resume = on_resume
+
+    def is_paused(self):
+        return self._paused
+
+    def write(self,data):
+        ''' Queue data, it is sent together with everything else written before the
+            current job yields. The buffer must not be mutated until flushed
+        '''
+        if self._error is not None:
+            raise self._error
+        if self._closing or self._eof:
+            raise Exception("write on a closing StreamWriter")
+        if not data:
+            return
+
+        self._chunks.append(data)
+        self._size += len(data)
+        if not self._flushing:
+            self._flushing = True
+            self._loop.new_task(self.__flush())
+
+        if self._size > self._high and not self._paused:
+            self._paused = True
+            if self._on_pause is not None:
+                self._on_pause()
+
+    def writelines(self,lines):
+        for data in lines:
+            self.write(data)
+
+    def _send_some(self):
+        ''' One non blocking sendmsg over the queued chunks, False on EAGAIN '''
+        chunks = self._chunks
+        try:
+            sent = self._sock.sock.sendmsg(chunks[:_IOV_MAX])
+        except _WOULD_BLOCK:
+            return False
+
+        self._size -= sent
+        done = 0
+        for chunk in chunks:
+            size = len(chunk)
+            if sent < size:
+                break
+            sent -= size
+            done += 1
+        del chunks[:done]
+        if sent:
+            chunks[0] = memoryview(chunks[0])[sent:]
+        return True
+
+    async def __flush(self):
+        loop = self._loop
+        sock = self._sock.sock
+        try:
+            while self._chunks:
+                if self._send_some():
+                    if self._paused and self._size <= self._low:
+                        self.__resume()
+                else:
+                    loop.write_wait(sock,loop._current)
+                    loop._current = None
+                    await kernel_switch()
+        except OSError as e:
+            self._error = e
+            self._chunks.clear()
+            self._size = 0
+
+        self._flushing = False
+        if self._paused:
+            self.__resume()
+        if self._flushed:
+            woken, self._flushed = self._flushed, []
+            loop.new_tasks(woken)
+        self.__finish()
+
+    def __resume(self):
+        self._paused = False
+        if self._drainers:
+            woken, self._drainers = self._drainers, []
+            self._loop.new_tasks(woken)
+        if self._on_resume is not None:
+            self._on_resume()
+
+    def __finish(self):
+        if self._closing:
+            self._sock.close()
+        elif self._eof and self._error is None:
+            try:
+                self._sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    async def drain(self):
+        ''' Return at once while the queue is under high water, otherwise wait
+            until the kernel has taken it back down to low water
+        '''
+        if self._paused:
+            loop = self._loop
+            self._drainers.append(loop._current)
+            loop._current._parked = self
+            loop._current = None
+            await kernel_switch()
+
+        if self._error is not None:
+            raise self._error
+
+    async def flush(self):
+        ''' Wait until everything written so far reached the kernel '''
+        if self._flushing:
+            loop = self._loop
+            self._flushed.append(loop._current)
+            loop._current._parked = self
+            loop._current = None
+            await kernel_switch()
+
+        if self._error is not None:
+            raise self._error
+
+    def _unpark(self,job):
+        ''' Job.cancel() of a job waiting in drain() or flush() '''
+        for waiters in (self._drainers,self._flushed):
+            if job in waiters:
+                waiters.remove(job)
+                return True
+        return False
+
+    def can_write_eof(self):
+        return True
+
+    def write_eof(self):
+        ''' Shut down the sending side once the queued data is sent '''
+        self._eof = True
+        if not self._flushing:
+            self.__finish()
+
+    def close(self):
+        ''' Close once the queued data is sent '''
+        self._closing = True
+        if not self._flushing:
+            self.__finish()
+
+    def is_closing(self):
+        return self._closing
+
+    async def wait_closed(self):
+        await self.flush()
+
+
+def open_streams(sock,limit=65536,pool=None,high_water=65536,low_water=None):
+    ''' Reader and writer sharing one connected AsyncSocket '''
+    return StreamReader(sock,limit,pool),StreamWriter(sock,None,high_water,low_water)
+
+
+async def open_stream(host,port,limit=65536,pool=None,high_water=65536,low_water=None):
+    return open_streams(await open_connection(host,port),limit,pool,high_water,low_water)
+
+
+__all__ = ['BufferPool','StreamReader','StreamWriter','IncompleteReadError',
+           'LimitOverrunError','open_streams','open_stream']
@@ -0,0 +1,413 @@
+'''
+    Multi-process runtime: one TaskExecutor per core.
+
+    The TaskExecutor is a per process singleton and runs on one core, so the way
+    to use a many core host is many processes. Supervisor forks N workers, each
+    worker builds its own loop and its own SO_REUSEPORT listening socket on the
+    same address and the kernel spreads incoming connections across them. The
+    supervisor itself runs no loop, it only watches its children:
+
+        SIGHUP           rolling restart, a new generation of workers is started
+                         and every new worker that reports ready retires one old
+                         worker gracefully
+        SIGTERM/SIGINT   graceful shutdown of every worker, then exit
+        worker crash     the worker is replaced, with a short backoff when it
+                         died right after starting
+
+    A retiring worker closes its listening socket, lets open connections finish
+    and exits, at the latest after `grace` seconds. Every worker reports its
+    counters over a pipe each `stats_interval` seconds and stats() sums them.
+'''
+
+import json
+import os
+import selectors
+import signal
+import socket
+import time
+
+from .executor import getloop,sleep
+from .kernel import kernel_switch
+from .net import TcpServer
+
+
+_CUMULATIVE = ('accepted',)       # counters that keep counting after a worker exits
+_RESPAWN_BACKOFF = 1.0
+_KILL_AFTER = 5.0                 # extra seconds past grace before SIGKILL
+
+
+'''
+    Supervisor side bookkeeping for one forked worker
+'''
+class _WorkerProc:
+    __slots__ = ('pid','generation','fd','buffer','started','stats','ready','retiring')
+
+    def __init__(self,pid,generation,fd) -> None:
+        self.pid         =  pid
+        self.generation  =  generation
+        self.fd          =  fd            # read end of the stats pipe
+        self.buffer      =  b''
+        self.started     =  time.monotonic()
+        self.stats       =  {}
+        self.ready       =  False
+        self.retiring    =  None          # monotonic time SIGTERM was sent
+
+    def __repr__(self) -> str:
+        return f"<Worker pid={self.pid} generation={self.generation}>"
+
+
+'''
+    Runs inside the forked worker: serves, reports and shuts down on SIGTERM
+'''
+class _WorkerRuntime:
+    def __init__(self,supervisor,generation,stats_fd) -> None:
+        self._sup         =  supervisor
+        self._generation  =  generation
+        self._stats_fd    =  stats_fd
+        self._loop        =  getloop()
+        self._server      =  None
+        self._stopping    =  False
+
+    def run(self):
+        sup  = self._sup
+        loop = self._loop
+
+        signal.signal(signal.SIGINT,signal.SIG_IGN)         # the supervisor handles ^C
+        signal.signal(signal.SIGHUP,signal.SIG_IGN)
+        signal.signal(signal.SIGTERM,lambda *_: None)       # delivered through the wakeup fd
+        signal.signal(signal.SIGCHLD,signal.SIG_DFL)
+
+        if sup.setup is not None:
+            sup.setup(loop)
+
+        self._server = TcpServer(sup.handler,sup.host,sup.port,sup.backlog,reuse_port=True)
+        loop.new_task(self._server.serve_forever())
+        loop.new_task(self.__watch_signals())
+        self.__send_stats()                                 # first report doubles as "ready"
+        loop.call_later(self.__report(),sup.stats_interval)
+
+        loop.run_default_policy()
+        self.__send_stats()
+
+    async def __watch_signals(self):
+        rfd,wfd = os.pipe()
+        os.set_blocking(rfd,False)
+        os.set_blocking(wfd,False)
+        signal.set_wakeup_fd(wfd)
+
+        loop = self._loop
+        while not self._stopping:
+            loop.read_wait(rfd,loop.get_current())
+            loop.set_current(None)
+            await kernel_switch()
+            try:
+                data = os.read(rfd,64)
+            except BlockingIOError:
+                continue
+            if signal.SIGTERM in data:
+                self.shutdown()
+
+        signal.set_wakeup_fd(-1)
+        loop.discard_fd(rfd)
+        os.close(rfd)
+        os.close(wfd)
+
+    async def __report(self):
+        if self._stopping:
+            return
+        self.__send_stats()
+        self._loop.call_later(self.__report(),self._sup.stats_interval)
+
+    def stats(self):
+        return {
+            'pid'        : os.getpid(),
+            'generation' : self._generation,
+            'accepted'   : self._server.accepted,
+            'active'     : self._server.active,
+        }
+
+    def __send_stats(self):
+        line = json.dumps(self.stats()).encode() + b'\n'
+        try:
+            os.write(self._stats_fd,line)
+        except BlockingIOError:
+            pass                      # supervisor is behind, the next report catches up
+        except BrokenPipeError:
+            self.shutdown()           # supervisor is gone
+
+    def shutdown(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        self._server.close()
+        self._loop.new_task(self.__drain())
+
+    async def __drain(self):
+        # open connections get `grace` seconds to finish on their own
+        deadline = time.monotonic() + self._sup.grace
+        while self._server.active and time.monotonic() < deadline:
+            await sleep(0.05)
+        self._loop.stop()
+
+
+class Supervisor:
+    def __init__(self,handler,host='0.0.0.0',port=8080,workers=None,backlog=socket.SOMAXCONN,
+                 grace=30.0,stats_interval=1.0,setup=None,on_stats=None) -> None:
+        '''
+            handler         coroutine function run for every connection, as for TcpServer
+            workers         number of processes, defaults to os.cpu_count()
+            grace           seconds a retiring worker waits for its connections
+            setup(loop)     called in every worker before it starts serving, e.g. to
+                            pick a reactor
+            on_stats(dict)  called in the supervisor with the aggregate every interval
+        '''
+        self.handler         =  handler
+        self.host            =  host
+        self.port            =  port
+        self.workers         =  workers or os.cpu_count() or 1
+        self.backlog         =  backlog
+        self.grace           =  grace
+        self.stats_interval  =  stats_interval
+        self.setup           =  setup
+        self.on_stats        =  on_stats
+
+        self._procs          =  {}          # pid -> _WorkerProc
+        self._generation     =  0
+        self._restarts       =  0
+        self._exited         =  dict.fromkeys(_CUMULATIVE,0)
+        self._respawn        =  []          # monotonic times at which to start a worker
+        self._signals        =  []
+        self._stopping       =  False
+        self._selector       =  None
+        self._anchor         =  None
+
+    def __repr__(self) -> str:
+        return f"<Supervisor {self.host}:{self.port} workers={len(self._procs)}/{self.workers}>"
+
+    def _bind_anchor(self):
+        ''' Bound but never listening SO_REUSEPORT socket that pins the port (and
+            resolves port 0) for the lifetime of the supervisor, so restarts never
+            leave a window in which somebody else can take the address
+        '''
+        sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET,socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEPORT,1)
+        sock.bind((self.host,self.port))
+        self.port    = sock.getsockname()[1]
+        self._anchor = sock
+
+    def _spawn(self,generation):
+        rfd,wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(rfd)
+                self._close_inherited()
+                os.set_blocking(wfd,False)
+                _WorkerRuntime(self,generation,wfd).run()
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(wfd)
+        os.set_blocking(rfd,False)
+        proc = self._procs[pid] = _WorkerProc(pid,generation,rfd)
+        self._selector.register(rfd,selectors.EVENT_READ,proc)
+        return proc
+
+    def _close_inherited(self):
+        signal.set_wakeup_fd(-1)
+        self._selector.close()
+        self._anchor.close()
+        for proc in self._procs.values():
+            os.close(proc.fd)
+
+    def _on_signal(self,signum,frame):
+        self._signals.append(signum)
+
+    def restart(self):
+        ''' Start a new generation, old workers retire as the new ones come up '''
+        if self._stopping:
+            return
+        self._generation += 1
+        self._restarts   += 1
+        for _ in range(self.workers):
+            self._spawn(self._generation)
+
+    def stop(self):
+        self._stopping = True
+        self._respawn.clear()
+        for proc in self._procs.values():
+            self._retire(proc)
+
+    def _retire(self,proc):
+        if proc.retiring is None:
+            proc.retiring = time.monotonic()
+            try:
+                os.kill(proc.pid,signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _read_stats(self,proc):
+        try:
+            data = os.read(proc.fd,65536)
+        except BlockingIOError:
+            return
+        if not data:
+            self._unwatch(proc)
+            return
+
+        *lines, proc.buffer = (proc.buffer + data).split(b'\n')
+        for line in lines:
+            if line:
+                proc.stats = json.loads(line)
+
+        if not proc.ready and proc.stats:
+            proc.ready = True
+            if proc.generation == self._generation:
+                # one new worker is serving, one old worker may go
+                for old in self._procs.values():
+                    if old.generation < self._generation and old.retiring is None:
+                        self._retire(old)
+                        break
+
+    def _unwatch(self,proc):
+        try:
+            self._selector.unregister(proc.fd)
+        except (KeyError,ValueError):
+            pass
+
+    def _reap(self):
+        while self._procs:
+            try:
+                pid,status = os.waitpid(-1,os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            proc = self._procs.pop(pid,None)
+            if proc is None:
+                continue
+
+            self._read_stats(proc)
+            self._unwatch(proc)
+            os.close(proc.fd)
+            for key in _CUMULATIVE:
+                self._exited[key] += proc.stats.get(key,0)
+
+            if proc.retiring is None and not self._stopping and proc.generation == self._generation:
+                # crashed, replace it; back off when it died right after starting
+                now = time.monotonic()
+                if now - proc.started < _RESPAWN_BACKOFF:
+                    self._respawn.append(now + _RESPAWN_BACKOFF)
+                else:
+                    self._spawn(self._generation)
+
+    def stats(self):
+        ''' Sum of the last report of every live worker; cumulative counters also
+            include workers that already exited
+        '''
+        total = {'workers': len(self._procs),'generation': self._generation,'restarts': self._restarts}
+        for key in _CUMULATIVE:
+            total[key] = self._exited[key]
+
+        per_worker = {}
+        for proc in self._procs.values():
+            per_worker[proc.pid] = proc.stats
+            for key,value in proc.stats.items():
+                if key in ('pid','generation') or not isinstance(value,(int,float)):
+                    continue
+                total[key] = total.get(key,0) + value
+
+        total['per_worker'] = per_worker
+        return total
+
+    def __timeout(self,now,next_report):
+        deadline = next_report
+        if self._respawn:
+            deadline = min(deadline,min(self._respawn))
+        for proc in self._procs.values():
+            if proc.retiring is not None:
+                deadline = min(deadline,proc.retiring + self.grace + _KILL_AFTER)
+        return max(0,deadline - now)
+
+    def __housekeeping(self,now):
+        due = [t for t in self._respawn if t <= now]
+        if due:
+            self._respawn = [t for t in self._respawn if t > now]
+            for _ in due:
+                self._spawn(self._generation)
+
+        for proc in self._procs.values():
+            if proc.retiring is not None and now - proc.retiring > self.grace + _KILL_AFTER:
+                try:
+                    os.kill(proc.pid,signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def run(self):
+        ''' Start the workers and supervise them until SIGTERM/SIGINT or stop() '''
+        self._selector = selectors.DefaultSelector()
+        self._bind_anchor()
+
+        wake_r,wake_w = os.pipe()
+        os.set_blocking(wake_r,False)
+        os.set_blocking(wake_w,False)
+        self._selector.register(wake_r,selectors.EVENT_READ,None)
+        signal.set_wakeup_fd(wake_w)
+        previous = {sig: signal.signal(sig,self._on_signal)
+                    for sig in (signal.SIGHUP,signal.SIGTERM,signal.SIGINT,signal.SIGCHLD)}
+
+        try:
+            for _ in range(self.workers):
+                self._spawn(self._generation)
+
+            next_report = time.monotonic() + self.stats_interval
+            while self._procs or (self._respawn and not self._stopping):
+                now = time.monotonic()
+                for key,_ in self._selector.select(self.__timeout(now,next_report)):
+                    if key.data is None:
+                        try:
+                            os.read(wake_r,4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        self._read_stats(key.data)
+
+                signals, self._signals = self._signals, []
+                for signum in signals:
+                    if signum == signal.SIGHUP:
+                        self.restart()
+                    elif signum in (signal.SIGTERM,signal.SIGINT):
+                        self.stop()
+
+                self._reap()
+                now = time.monotonic()
+                self.__housekeeping(now)
+
+                if now >= next_report:
+                    next_report = now + self.stats_interval
+                    if self.on_stats is not None:
+                        self.on_stats(self.stats())
+
+        finally:
+            signal.set_wakeup_fd(-1)
+            for sig,handler in previous.items():
+                signal.signal(sig,handler)
+            self._selector.close()
+            os.close(wake_r)
+            os.close(wake_w)
+            self._anchor.close()
+
+
+def serve_multicore(handler,host='0.0.0.0',port=8080,workers=None,**kwargs):
+    ''' Blocking shortcut for Supervisor(...).run() '''
+    Supervisor(handler,host,port,workers,**kwargs).run()
+
+
+__all__ = ['Supervisor','serve_multicore']
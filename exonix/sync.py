@@ -0,0 +1,465 @@
+'''
+    Synchronization primitives for jobs running on one loop.
+
+        Lock               mutual exclusion, released ownership goes straight
+                           to the first waiter so nobody can barge in between
+        Semaphore          counter of permits, same direct handoff
+        BoundedSemaphore   Semaphore that refuses to be released above its start value
+        Event              flag that wakes every waiter when set
+        Condition          wait/notify on top of a Lock
+        Barrier            cyclic rendezvous of a fixed number of jobs
+        RWLock             many readers or one writer, FIFO between the two
+
+    Waiters queue in a deque and are woken in arrival order. Taking a free
+    primitive is a flag or counter update that allocates nothing; only a job
+    that has to wait touches the queue. A waiting job is parked on the
+    primitive itself, so Job.cancel() removes it from the queue, and a job
+    cancelled after ownership was already handed to it passes it on.
+
+    Like Promise without the multi threaded runtime, none of them is thread
+    safe: share them between jobs of the same loop, not across workers.
+'''
+
+from collections import deque
+
+from .kernel import kernel_switch
+from .promise import CancelledError
+from . import promise as _promise
+
+
+'''
+    Put on a woken job's _parked by a handoff. Job.cancel() cannot take the job
+    off it, so a waiter that sees it after a CancelledError knows it was already
+    given the primitive and has to give it back.
+'''
+class _Granted:
+    __slots__ = ()
+
+    def _unpark(self,job):
+        return False
+
+_GRANTED = _Granted()
+
+def _grant(job):
+    job._parked = _GRANTED
+    job._loop._ready.append(job)
+
+def _wake(job):
+    job._loop._ready.append(job)
+
+def _remove(waiters,job):
+    try:
+        waiters.remove(job)
+    except ValueError:
+        return False
+    return True
+
+
+class Lock:
+    __slots__ = ('_locked','_waiters')
+
+    def __init__(self,loop=None) -> None:
+        # loop is accepted for the old Lock(executor) signature, jobs carry their own
+        self._locked   =  False
+        self._waiters  =  deque()
+
+    def __repr__(self) -> str:
+        state = "locked" if self._locked else "unlocked"
+        return f"<Lock {state} waiters={len(self._waiters)}>"
+
+    def locked(self):
+        return self._locked
+
+    async def acquire(self):
+        # unlocked implies nobody is queued, release hands over instead of unlocking
+        if not self._locked:
+            self._locked = True
+            return True
+
+        loop = _promise._getloop()
+        job  = loop._current
+        self._waiters.append(job)
+        job._parked   = self
+        loop._current = None
+        try:
+            await kernel_switch()
+        except CancelledError:
+            if job._parked is _GRANTED:
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        if not self._locked:
+            raise Exception("Lock is not acquired")
+        if self._waiters:
+            _grant(self._waiters.popleft())         # stays locked, owned by the waiter now
+        else:
+            self._locked = False
+
+    def _unpark(self,job):
+        return _remove(self._waiters,job)
+
+    async def __aenter__(self):
+        if not self._locked:            # fast path inlined, saves the acquire() coroutine
+            self._locked = True
+            return self
+        await self.acquire()
+        return self
+
+    async def __aexit__(self,exc_type,exc,tb):
+        self.release()
+
+
+class Semaphore:
+    __slots__ = ('_value','_waiters')
+
+    def __init__(self,value=1) -> None:
+        if value < 0:
+            raise ValueError("Semaphore initial value must be >= 0")
+        self._value    =  value
+        self._waiters  =  deque()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} value={self._value} waiters={len(self._waiters)}>"
+
+    def locked(self):
+        return self._value == 0
+
+    async def acquire(self):
+        # a free permit implies nobody is queued, release hands permits over directly
+        if self._value > 0:
+            self._value -= 1
+            return True
+
+        loop = _promise._getloop()
+        job  = loop._current
+        self._waiters.append(job)
+        job._parked   = self
+        loop._current = None
+        try:
+            await kernel_switch()
+        except CancelledError:
+            if job._parked is _GRANTED:
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        if self._waiters:
+            _grant(self._waiters.popleft())
+        else:
+            self._value += 1
+
+    def _unpark(self,job):
+        return _remove(self._waiters,job)
+
+    async def __aenter__(self):
+        if self._value > 0:
+            self._value -= 1
+            return self
+        await self.acquire()
+        return self
+
+    async def __aexit__(self,exc_type,exc,tb):
+        self.release()
+
+
+class BoundedSemaphore(Semaphore):
+    __slots__ = ('_bound',)
+
+    def __init__(self,value=1) -> None:
+        super().__init__(value)
+        self._bound = value
+
+    def release(self):
+        if not self._waiters and self._value >= self._bound:
+            raise ValueError("BoundedSemaphore released too many times")
+        super().release()
+
+
+class Event:
+    __slots__ = ('_flag','_waiters')
+
+    def __init__(self) -> None:
+        self._flag     =  False
+        self._waiters  =  deque()
+
+    def __repr__(self) -> str:
+        state = "set" if self._flag else "unset"
+        return f"<Event {state} waiters={len(self._waiters)}>"
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        if self._flag:
+            return
+        self._flag = True
+        waiters, self._waiters = self._waiters, deque()
+        for job in waiters:
+            _wake(job)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self):
+        if self._flag:
+            return True
+
+        loop = _promise._getloop()
+        job  = loop._current
+        self._waiters.append(job)
+        job._parked   = self
+        loop._current = None
+        await kernel_switch()
+        return True
+
+    def _unpark(self,job):
+        return _remove(self._waiters,job)
+
+
+class Condition:
+    __slots__ = ('_lock','_waiters')
+
+    def __init__(self,lock=None) -> None:
+        self._lock     =  lock if lock is not None else Lock()
+        self._waiters  =  deque()
+
+    def __repr__(self) -> str:
+        return f"<Condition {self._lock!r} waiters={len(self._waiters)}>"
+
+    def locked(self):
+        return self._lock.locked()
+
+    async def acquire(self):
+        return await self._lock.acquire()
+
+    def release(self):
+        self._lock.release()
+
+    async def __aenter__(self):
+        await self._lock.acquire()
+        return self
+
+    async def __aexit__(self,exc_type,exc,tb):
+        self._lock.release()
+
+    async def wait(self):
+        ''' Release the lock, wait for notify, take the lock back. The lock is
+            held again on return, also when the wait is cancelled
+        '''
+        if not self._lock.locked():
+            raise Exception("Condition.wait() without holding the lock")
+
+        self._lock.release()
+        try:
+            loop = _promise._getloop()
+            job  = loop._current
+            self._waiters.append(job)
+            job._parked   = self
+            loop._current = None
+            await kernel_switch()
+        finally:
+            cancelled = None
+            while True:
+                try:
+                    await self._lock.acquire()
+                    break
+                except CancelledError as e:
+                    cancelled = e
+            if cancelled is not None:
+                raise cancelled
+        return True
+
+    async def wait_for(self,predicate):
+        result = predicate()
+        while not result:
+            await self.wait()
+            result = predicate()
+        return result
+
+    def notify(self,n=1):
+        if not self._lock.locked():
+            raise Exception("Condition.notify() without holding the lock")
+        waiters = self._waiters
+        for _ in range(min(n,len(waiters))):
+            _wake(waiters.popleft())
+
+    def notify_all(self):
+        self.notify(len(self._waiters))
+
+    def _unpark(self,job):
+        return _remove(self._waiters,job)
+
+
+class Barrier:
+    __slots__ = ('_parties','_count','_waiters')
+
+    def __init__(self,parties,loop=None) -> None:
+        if parties < 1:
+            raise ValueError("Barrier needs at least one party")
+        self._parties  =  parties
+        self._count    =  0
+        self._waiters  =  deque()
+
+    def __repr__(self) -> str:
+        return f"<Barrier waiting={self._count}/{self._parties}>"
+
+    @property
+    def parties(self):
+        return self._parties
+
+    @property
+    def n_waiting(self):
+        return self._count
+
+    async def wait(self):
+        ''' Wait until parties jobs are waiting, then release them all together.
+            Returns the arrival index, 0 to parties-1. The barrier resets itself
+            for the next round
+        '''
+        index = self._count
+        self._count += 1
+        if self._count == self._parties:
+            self._count = 0
+            waiters, self._waiters = self._waiters, deque()
+            for job in waiters:
+                _wake(job)
+            return index
+
+        loop = _promise._getloop()
+        job  = loop._current
+        self._waiters.append(job)
+        job._parked   = self
+        loop._current = None
+        await kernel_switch()
+        return index
+
+    def _unpark(self,job):
+        if not _remove(self._waiters,job):
+            return False
+        self._count -= 1
+        return True
+
+
+'''
+    Readers share the lock, a writer holds it alone. Requests are served in
+    arrival order: once a writer is queued, later readers queue behind it even
+    while the lock is read held, so writers do not starve.
+
+        async with rwlock.reader:  ...
+        async with rwlock.writer:  ...
+'''
+class RWLock:
+    __slots__ = ('_readers','_writer','_waiters','reader','writer')
+
+    def __init__(self) -> None:
+        self._readers  =  0
+        self._writer   =  False
+        self._waiters  =  deque()          # (job, wants_write)
+        self.reader    =  _ReadSide(self)
+        self.writer    =  _WriteSide(self)
+
+    def __repr__(self) -> str:
+        return f"<RWLock readers={self._readers} writer={self._writer} waiters={len(self._waiters)}>"
+
+    async def acquire_read(self):
+        if not self._writer and not self._waiters:
+            self._readers += 1
+            return True
+        await self.__wait(False)
+        return True
+
+    async def acquire_write(self):
+        if not self._writer and not self._readers and not self._waiters:
+            self._writer = True
+            return True
+        await self.__wait(True)
+        return True
+
+    def release_read(self):
+        if not self._readers:
+            raise Exception("RWLock is not read held")
+        self._readers -= 1
+        if not self._readers:
+            self.__grant()
+
+    def release_write(self):
+        if not self._writer:
+            raise Exception("RWLock is not write held")
+        self._writer = False
+        self.__grant()
+
+    async def __wait(self,write):
+        loop = _promise._getloop()
+        job  = loop._current
+        self._waiters.append((job,write))
+        job._parked   = self
+        loop._current = None
+        try:
+            await kernel_switch()
+        except CancelledError:
+            if job._parked is _GRANTED:
+                if write:
+                    self.release_write()
+                else:
+                    self.release_read()
+            raise
+
+    def __grant(self):
+        ''' Hand the lock to the head of the queue: one writer, or every reader
+            up to the next queued writer
+        '''
+        waiters = self._waiters
+        if self._writer or not waiters:
+            return
+        if waiters[0][1]:
+            if not self._readers:
+                self._writer = True
+                _grant(waiters.popleft()[0])
+            return
+        while waiters and not waiters[0][1]:
+            self._readers += 1
+            _grant(waiters.popleft()[0])
+
+    def _unpark(self,job):
+        for entry in self._waiters:
+            if entry[0] is job:
+                self._waiters.remove(entry)
+                self.__grant()              # a writer leaving the head may let readers in
+                return True
+        return False
+
+
+class _ReadSide:
+    __slots__ = ('_rw',)
+
+    def __init__(self,rw) -> None:
+        self._rw = rw
+
+    async def __aenter__(self):
+        rw = self._rw
+        if not rw._writer and not rw._waiters:
+            rw._readers += 1
+            return
+        await rw.acquire_read()
+
+    async def __aexit__(self,exc_type,exc,tb):
+        self._rw.release_read()
+
+
+class _WriteSide:
+    __slots__ = ('_rw',)
+
+    def __init__(self,rw) -> None:
+        self._rw = rw
+
+    async def __aenter__(self):
+        await self._rw.acquire_write()
+
+    async def __aexit__(self,exc_type,exc,tb):
+        self._rw.release_write()
+
+
+__all__ = ['Lock','Semaphore','BoundedSemaphore','Event','Condition','Barrier','RWLock']
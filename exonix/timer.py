@@ -0,0 +1,255 @@
+'''
+    Timer backends used by the executor for call_later/sleep.
+
+    Both work on time.monotonic so a wall clock step (NTP, manual date change)
+    never fires timers early or holds them back, and both hand out a TimerHandle
+    that cancels in O(1).
+
+    TimerWheel   hashed hierarchical timing wheel (Varghese & Lauck). Insert and
+                 cancel are O(1), expiry is O(1) per timer plus one cascade per
+                 timer and level it passes through. Timers are rounded up to the
+                 wheel resolution, everything due in the same tick lands in the
+                 same bucket and is released as one batch by one loop wakeup.
+    TimerHeap    the previous binary heap, O(log n) insert with exact deadlines,
+                 cancel marks the entry and the heap is compacted lazily.
+'''
+
+import heapq
+import math
+import time
+
+
+'''
+    Returned by add(), cancel() removes the timer from whatever structure holds it
+'''
+class TimerHandle:
+    __slots__ = ('when','task','owner','tick','level','slot')
+
+    def __init__(self,owner,when,task) -> None:
+        self.when   =  when
+        self.task   =  task
+        self.owner  =  owner      # None once fired or cancelled
+        self.tick   =  0
+        self.level  =  0
+        self.slot   =  0
+
+    def cancel(self):
+        if self.owner is not None:
+            self.owner.cancel(self)
+
+    def cancelled(self):
+        return self.owner is None and self.task is None
+
+    def _unpark(self,job):
+        ''' Job.cancel() of a sleeping job '''
+        if self.owner is None or self.task is not job:
+            return False
+        self.owner.cancel(self)
+        return True
+
+    def __repr__(self) -> str:
+        state = "pending" if self.owner is not None else "done"
+        return f"<TimerHandle when={self.when:.6f} {state}>"
+
+
+_BITS  = 6
+_SLOTS = 1 << _BITS
+_MASK  = _SLOTS - 1
+
+class TimerWheel:
+    def __init__(self,resolution=0.001,levels=4,clock=time.monotonic) -> None:
+        self._inv       =  1.0 / resolution
+        self._res       =  resolution
+        self._levels    =  levels
+        self._slots     =  [[None] * _SLOTS for _ in range(levels)]
+        self._occupied  =  [0] * levels          # bitmap of non empty slots per level
+        self._overflow  =  {}                    # beyond the span of the top level
+        self._count     =  0
+        self._cur       =  int(clock() * self._inv)   # next tick to be processed
+
+    def __len__(self):
+        return self._count
+
+    def __place(self,handle,cur):
+        tick = handle.tick if handle.tick > cur else cur
+
+        # lowest level whose window still contains both tick and cur, i.e. the
+        # level of the highest bit in which they differ
+        level = ((tick ^ cur).bit_length() - 1) // _BITS
+        if level < 0:
+            level = 0
+        elif level >= self._levels:
+            self._overflow[handle] = None
+            handle.level = -1
+            return
+
+        idx    = (tick >> (_BITS * level)) & _MASK
+        bucket = self._slots[level][idx]
+        if bucket is None:
+            bucket = self._slots[level][idx] = {}
+        bucket[handle] = None
+        self._occupied[level] |= 1 << idx
+        handle.level = level
+        handle.slot  = idx
+
+    def add(self,when,task):
+        handle      = TimerHandle(self,when,task)
+        handle.tick = math.ceil(when * self._inv - 1e-9)
+        self.__place(handle,self._cur)
+        self._count += 1
+        return handle
+
+    def cancel(self,handle):
+        if handle.owner is not self:
+            return
+
+        if handle.level < 0:
+            del self._overflow[handle]
+        else:
+            bucket = self._slots[handle.level][handle.slot]
+            del bucket[handle]
+            if not bucket:
+                self._slots[handle.level][handle.slot] = None
+                self._occupied[handle.level] &= ~(1 << handle.slot)
+
+        handle.owner = None
+        handle.task  = None
+        self._count -= 1
+
+    def __next_event(self):
+        ''' First tick at which a level 0 bucket expires or a higher bucket must be
+            cascaded down, None when the wheel is empty
+        '''
+        cur  = self._cur
+        best = None
+
+        for level in range(self._levels):
+            occ = self._occupied[level]
+            if not occ:
+                continue
+
+            shift = _BITS * level
+            idx   = (cur >> shift) & _MASK
+            if level and cur & ((1 << shift) - 1):
+                idx += 1        # already inside that slot, it was cascaded on entry
+
+            pending = occ >> idx
+            if pending:
+                slot = idx + (pending & -pending).bit_length() - 1
+                tick = ((cur >> (shift + _BITS)) << (shift + _BITS)) | (slot << shift)
+                if best is None or tick < best:
+                    best = tick
+
+        if self._overflow:
+            span = _BITS * self._levels
+            tick = cur if not cur & ((1 << span) - 1) else ((cur >> span) + 1) << span
+            if best is None or tick < best:
+                best = tick
+
+        return best
+
+    def __process(self,tick,out,now,lateness):
+        span = _BITS * self._levels
+        if self._overflow and not tick & ((1 << span) - 1):
+            moved, self._overflow = self._overflow, {}
+            for handle in moved:
+                self.__place(handle,tick)
+
+        for level in range(self._levels - 1, 0, -1):
+            shift = _BITS * level
+            if tick & ((1 << shift) - 1):
+                continue
+            idx = (tick >> shift) & _MASK
+            if self._occupied[level] >> idx & 1:
+                bucket = self._slots[level][idx]
+                self._slots[level][idx] = None
+                self._occupied[level]  &= ~(1 << idx)
+                for handle in bucket:
+                    self.__place(handle,tick)
+
+        idx = tick & _MASK
+        if self._occupied[0] >> idx & 1:
+            bucket = self._slots[0][idx]
+            self._slots[0][idx] = None
+            self._occupied[0]  &= ~(1 << idx)
+            for handle in bucket:
+                handle.owner = None
+                out.append(handle.task)
+            if lateness is not None:
+                for handle in bucket:
+                    lateness.record((now - handle.when) * 1e6)
+            self._count -= len(bucket)
+
+    def next_deadline(self):
+        tick = self.__next_event()
+        if tick is None:
+            return None
+        return tick * self._res
+
+    def expire(self,now,out,lateness=None):
+        ''' Append the task of every timer due at now to out, lateness is an
+            optional exonix.stats.Histogram fed with how late each one fired (us)
+        '''
+        target = int(now * self._inv)
+
+        while True:
+            tick = self.__next_event()
+            if tick is None or tick > target:
+                break
+            self._cur = tick
+            self.__process(tick,out,now,lateness)
+            self._cur = tick + 1
+
+        if self._cur <= target:
+            self._cur = target + 1
+
+
+class TimerHeap:
+    def __init__(self) -> None:
+        self._heap       =  []
+        self._seq        =  0
+        self._cancelled  =  0
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def add(self,when,task):
+        handle     = TimerHandle(self,when,task)
+        self._seq += 1
+        heapq.heappush(self._heap,(when,self._seq,handle))
+        return handle
+
+    def cancel(self,handle):
+        if handle.owner is not self:
+            return
+
+        handle.owner = None
+        handle.task  = None
+        self._cancelled += 1
+
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if entry[2].owner is self]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def next_deadline(self):
+        heap = self._heap
+        while heap and heap[0][2].owner is not self:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        return heap[0][0] if heap else None
+
+    def expire(self,now,out,lateness=None):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            handle = heapq.heappop(heap)[2]
+            if handle.owner is self:
+                handle.owner = None
+                out.append(handle.task)
+                if lateness is not None:
+                    lateness.record((now - handle.when) * 1e6)
+            else:
+                self._cancelled -= 1
+
+
+__all__ = ['TimerWheel','TimerHeap','TimerHandle']
@@ -0,0 +1,13 @@
+import pytest
+
+from exonix import start, gather, first_completed, race
+
+
+def test_empty_arguments():
+    async def main():
+        assert await gather() == []
+        for combinator in (first_completed,race):
+            with pytest.raises(ValueError):
+                await combinator()
+
+    start(main())
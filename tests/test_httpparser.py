@@ -0,0 +1,48 @@
+from exonix import HttpParser, HttpError
+
+
+def parse(data):
+    parser = HttpParser()
+    parser.buffer()[:len(data)] = data
+    parser.feed(len(data))
+    return parser.next()
+
+
+def test_lookups_without_header_lines():
+    request = parse(b"GET /x HTTP/1.1\r\n\r\n")
+    assert request.headers.get('if-none-match') is None
+    assert request.headers.get('range') is None
+    assert 'host' not in request.headers
+    assert len(request.headers) == 0
+
+
+def test_repeated_lookups():
+    request = parse(b"GET /x HTTP/1.1\r\nHost: a\r\nX-A: 1\r\nx-a: 2\r\n\r\n")
+    assert request.headers.get('HOST') == 'a'
+    assert request.headers.get('x-a') == '1, 2'
+    assert request.headers.getall('X-A') == ['1','2']
+
+
+def parse_error(data):
+    try:
+        parse(data)
+    except HttpError as e:
+        return e.status
+    return None
+
+
+CHUNKED = b"POST /c HTTP/1.1\r\nTransfer-Encoding: %s\r\n\r\n%s\r\nhello\r\n0\r\n\r\n"
+
+def test_chunk_size_is_hex_digits_only():
+    assert parse(CHUNKED % (b"chunked",b"5")).body == b"hello"
+    assert parse(CHUNKED % (b"chunked",b"5 ;ext=1")).body == b"hello"
+    for size in (b"0x5",b"+5",b"-1",b" 5",b"5 ",b"0_5",b""):
+        assert parse_error(CHUNKED % (b"chunked",size)) == 400,size
+
+
+def test_chunked_must_be_the_final_coding():
+    for coding in (b"chunkedx",b"chunked, gzip",b"xchunked"):
+        assert parse_error(CHUNKED % (coding,b"5")) == 400,coding
+    assert parse_error(CHUNKED % (b"gzip, chunked",b"5")) == 501
+    assert parse_error(b"POST /c HTTP/1.1\r\nTransfer-Encoding: chunked\r\nContent-Length: 5\r\n\r\n"
+                       b"5\r\nhello\r\n0\r\n\r\n") == 400
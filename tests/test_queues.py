@@ -0,0 +1,37 @@
+from exonix import start, getloop, sleep, Queue, Channel, CancelledError
+
+
+def test_cancel_after_handoff_keeps_the_item_and_propagates():
+    async def main():
+        queue  = Queue(1)
+        queue.put_nowait('a')
+        putter = getloop().new_task(queue.put('b'))
+        await sleep(0)                  # putter parks on the full queue
+        assert queue.get_nowait() == 'a'     # moves 'b' into the buffer and wakes the putter
+        putter.cancel()
+        try:
+            await putter
+        except CancelledError:
+            pass
+        else:
+            raise AssertionError("the cancel was swallowed")
+        assert queue.get_nowait() == 'b'
+
+    start(main())
+
+
+def test_cancel_before_handoff_drops_the_item():
+    async def main():
+        channel = Channel()
+        putter  = getloop().new_task(channel.put('x'))
+        await sleep(0)
+        putter.cancel()
+        try:
+            await putter
+        except CancelledError:
+            pass
+        else:
+            raise AssertionError("put was not cancelled")
+        assert channel.empty() and not channel._putters
+
+    start(main())
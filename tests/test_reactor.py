@@ -0,0 +1,39 @@
+import os
+import select
+
+import pytest
+
+from exonix import start, getloop, with_timeout
+from exonix.kernel import kernel_switch
+from exonix.reactor import SelectReactor, EpollReactor
+
+
+REACTORS = [SelectReactor]
+if hasattr(select,'epoll'):
+    REACTORS += [EpollReactor,
+                 lambda loop: EpollReactor(loop,select.EPOLLET),
+                 lambda loop: EpollReactor(loop,select.EPOLLONESHOT)]
+
+
+async def readable(fd):
+    loop = getloop()
+    loop.read_wait(fd,loop.get_current())
+    loop.set_current(None)
+    await kernel_switch()
+
+
+@pytest.mark.parametrize('reactor',REACTORS)
+def test_raw_fd_number_reused(reactor):
+    ''' A closed raw fd drops out of the kernel's set, the next pipe that gets
+        the same number must still be watched
+    '''
+    async def main():
+        for _ in range(5):
+            r,w = os.pipe()
+            os.write(w,b"x")
+            await with_timeout(readable(r),2.0)
+            os.close(r)
+            os.close(w)
+
+    getloop().use_reactor(reactor)
+    start(main())
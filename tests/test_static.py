@@ -0,0 +1,39 @@
+from exonix import start, getloop, open_connection, HttpServer, Router, StaticFiles
+
+
+def fetch(root,target):
+    ''' Status line and body of GET target against StaticFiles(root) routed
+        the documented way
+    '''
+    static = StaticFiles(root)
+    app    = Router()
+    app.add('GET','/',static)
+    app.add('GET','/{path:path}',static)
+
+    async def main():
+        server = HttpServer(app,'127.0.0.1',0)
+        getloop().new_task(server.serve_forever())
+        conn = await open_connection(*server.address)
+        await conn.sendall(f"GET {target} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+        data = b""
+        while True:
+            chunk = await conn.recv()
+            if not chunk:
+                break
+            data += chunk
+        conn.close()
+        server.close()
+        head,_,body = data.partition(b"\r\n\r\n")
+        return head.split(b"\r\n")[0],body
+
+    return start(main())
+
+
+def test_nested_file(tmp_path):
+    (tmp_path / 'sub' / 'deeper').mkdir(parents=True)
+    (tmp_path / 'sub' / 'deeper' / 'a.txt').write_bytes(b"nested")
+    (tmp_path / 'index.html').write_bytes(b"home")
+
+    assert fetch(tmp_path,'/sub/deeper/a.txt') == (b"HTTP/1.1 200 OK",b"nested")
+    assert fetch(tmp_path,'/') == (b"HTTP/1.1 200 OK",b"home")
+    assert fetch(tmp_path,'/sub/../../etc/passwd')[0] == b"HTTP/1.1 404 Not Found"
@@ -0,0 +1,84 @@
+'''
+    A TaskGroup member failing while its siblings are parked used to deadlock:
+    the group cancels the siblings from inside the promise lock under a
+    threaded runtime, and cancelling takes that lock again.
+'''
+
+import threading
+
+import pytest
+
+from exonix import start, Promise, TaskGroup, WorkStealingRuntime, CancelledError, getloop, gather
+from exonix.policy import PriorityPolicy
+from exonix import promise as _promise
+
+
+class Boom(Exception):
+    pass
+
+
+async def parked(gate,cancelled):
+    try:
+        await gate
+    except CancelledError:
+        cancelled.append(True)
+        raise
+
+async def failing():
+    raise Boom()
+
+async def group_with_failure():
+    gate      = Promise()
+    cancelled = []
+    with pytest.raises(Boom):
+        async with TaskGroup() as group:
+            for _ in range(3):
+                group.spawn(parked(gate,cancelled))
+            group.spawn(failing())
+    return len(cancelled)
+
+
+def run_in_thread(fn,timeout=10):
+    ''' fn() in a daemon thread, failing the test instead of hanging it '''
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()),daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(),"deadlocked"
+    return result[0]
+
+
+def test_member_failure_on_loop():
+    assert run_in_thread(lambda: start(group_with_failure())) == 3
+
+
+def test_member_failure_under_runtime():
+    runtime = WorkStealingRuntime(workers=2)
+    assert run_in_thread(lambda: runtime.run(group_with_failure())) == 3
+
+
+def test_runtime_restores_single_threaded_promises():
+    runtime = WorkStealingRuntime(workers=2)
+
+    async def nothing():
+        return 1
+
+    assert run_in_thread(lambda: runtime.run(nothing())) == 1
+    assert not _promise._threaded
+    assert run_in_thread(lambda: start(group_with_failure())) == 3
+
+
+def test_use_policy_on_a_worker_loop():
+    ''' use_policy moves the queued jobs into a new ready queue, the worker
+        has to run that one from then on
+    '''
+    async def child(i):
+        return i
+
+    async def main():
+        jobs = [getloop().new_task(child(i)) for i in range(10)]
+        getloop().use_policy(PriorityPolicy)
+        return await gather(*jobs,child(10))
+
+    runtime = WorkStealingRuntime(workers=2)
+    assert run_in_thread(lambda: runtime.run(main())) == list(range(11))
@@ -0,0 +1,20 @@
+import time
+
+from exonix import start, getloop, sleep, with_timeout
+
+
+def test_expiry_disarmed_when_the_awaitable_wins_late():
+    ''' The awaitable's timer and the expiry both overdue in one pass: leaving
+        with_timeout normally must not leave a cancel behind for the next await
+    '''
+    async def blocker():
+        await sleep(0.01)
+        time.sleep(0.1)                 # the loop comes back after both deadlines
+
+    async def main():
+        getloop().new_task(blocker())
+        await with_timeout(sleep(0.03),0.05)
+        await sleep(0.05)
+        return 'done'
+
+    assert start(main()) == 'done'